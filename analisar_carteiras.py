@@ -0,0 +1,81 @@
+# analisar_carteiras.py
+
+import argparse
+from db_nexus import DatabaseSessionManager
+from app.cache import CacheAnalises
+from app.perfil import adicionar_opcao_perfil, perfilar
+from app.precos import CachePrecos
+from app.services import PortfolioService
+from app.planejamento import FAIXA_TOLERANCIA
+
+# --- Cores ---
+VERDE = '\033[92m'
+VERMELHO = '\033[91m'
+AMARELO = '\033[93m'
+RESET = '\033[0m'
+
+CORES = {"Vender": VERMELHO, "Comprar": VERDE}
+
+def exibir_carteiras(service: PortfolioService, carteira: str | None = None, faixa_tolerancia: float = FAIXA_TOLERANCIA):
+    """
+    Exibe o resumo de todas as carteiras (valor, volatilidade e o volume do
+    rebalanceamento sugerido) e, se pedido, o plano detalhado de uma delas.
+    """
+    print("\n--- Análise das Carteiras ---")
+
+    analise = service.analisar_carteiras(faixa_tolerancia=faixa_tolerancia)
+    if analise is None:
+        print("Nenhuma carteira com posições encontrada.")
+        return
+
+    # 1. Resumo: uma linha por carteira
+    print(f"\n{'CARTEIRA':<20} | {'ATIVOS':>6} | {'VALOR (R$)':>16} | {'VOL. ANUAL':>10} | {'VENDAS (R$)':>14} | {'COMPRAS (R$)':>14}")
+    print("-" * 97)
+    for registro in analise.como_registros():
+        print(
+            f"{registro['carteira']:<20} | {registro['ativos']:>6} | {registro['valor_total']:>16,.2f} | "
+            f"{registro['volatilidade'] * 100:>9.2f}% | {registro['total_vendas']:>14,.2f} | {registro['total_compras']:>14,.2f}"
+        )
+    print("-" * 97)
+    print(f"Calculado em {analise.tempo_ms:.1f} ms ({len(analise.nomes)} carteiras x {len(analise.tickers)} ativos).")
+
+    if carteira is None:
+        return
+    if carteira not in analise.nomes:
+        print(f"\n❌ Carteira '{carteira}' não encontrada. Disponíveis: {', '.join(analise.nomes)}")
+        return
+
+    # 2. Plano detalhado da carteira escolhida
+    plano = analise.plano(carteira)
+    print(f"\n--- Plano de Rebalanceamento: {carteira} (faixa de ±{plano.faixa_tolerancia:.0%}) ---")
+    for classe, itens in plano.classes.items():
+        print(f"\n--- CLASSE: {classe.upper()} ---")
+        print(f"{'TICKER':<10} | {'PREÇO ATUAL':>12} | {'ALOC. ATUAL':>12} | {'ALOC. ALVO':>11} | {'RECOMENDAÇÃO':<22} | {'VALOR (R$)':>15}")
+        print("-" * 100)
+        for item in itens:
+            cor = CORES.get(item.recomendacao, AMARELO)
+            print(
+                f"{cor}{item.ticker:<10} | R$ {item.preco_atual:>9.2f} | {item.alocacao_atual_na_classe * 100:>11.2f}% | "
+                f"{item.alocacao_sugerida * 100:>10.2f}% | {item.recomendacao:<22} | R$ {item.valor_a_movimentar:>12.2f}{RESET}"
+            )
+        print("-" * 100)
+
+    print(f"\n  Total de Vendas Sugerido: {VERMELHO}R$ {plano.total_vendas:,.2f}{RESET}")
+    print(f"  Total de Compras Viáveis: {VERDE}R$ {plano.total_compras:,.2f}{RESET}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analisa todas as carteiras de uma só vez.")
+    parser.add_argument("--carteira", help="Exibe também o plano de rebalanceamento desta carteira.")
+    parser.add_argument("--faixa", type=float, default=FAIXA_TOLERANCIA, help="Faixa de tolerância em torno do alvo.")
+    adicionar_opcao_perfil(parser)
+    args = parser.parse_args()
+
+    DB_URL = "sqlite:///data/portfolio.db"
+    session_manager = DatabaseSessionManager(DB_URL)
+    service = PortfolioService(
+        session_manager, cache_precos=CachePrecos(), cache=CacheAnalises("data/cache_analises")
+    )
+
+    with perfilar(args.profile, service):
+        exibir_carteiras(service, args.carteira, args.faixa)
@@ -0,0 +1,64 @@
+# analisar_historico.py
+
+import argparse
+import datetime
+from db_nexus import DatabaseSessionManager
+from app.cache import CacheAnalises
+from app.perfil import adicionar_opcao_perfil, perfilar
+from app.precos import CachePrecos
+from app.services import PortfolioService
+
+def exibir_historico(service: PortfolioService, data_inicial: datetime.date | None = None):
+    """
+    Exibe a evolução mensal do valor da carteira e o resumo dos retornos
+    ponderados pelo tempo (TWR) e pelo dinheiro (MWR).
+    """
+    print("\n--- Evolução do Valor da Carteira ---")
+
+    historico = service.calcular_historico_carteira(data_inicial)
+    if historico is None:
+        print("Não foi possível calcular o histórico. A carteira está vazia ou sem cotações.")
+        return
+
+    # 1. Tabela mensal: valor no último pregão do mês, aportes líquidos e retorno do mês
+    serie = historico.como_dataframe()
+    meses = serie.index.to_period('M')
+    mensal = serie.groupby(meses).agg(
+        valor=('valor', 'last'),
+        fluxo=('fluxo', 'sum'),
+        retorno=('retorno_diario', lambda retornos: (1 + retornos).prod() - 1),
+    )
+
+    print(f"\n{'MÊS':<8} | {'VALOR (R$)':>16} | {'APORTES LÍQ. (R$)':>18} | {'RETORNO':>8}")
+    print("-" * 60)
+    for mes, linha in mensal.iterrows():
+        print(f"{str(mes):<8} | {linha['valor']:>16,.2f} | {linha['fluxo']:>18,.2f} | {linha['retorno'] * 100:>7.2f}%")
+    print("-" * 60)
+
+    # 2. Resumo do período
+    print("\n" + "="*48)
+    print(" RESUMO DO PERÍODO")
+    print("="*48)
+    print(f"  Período:                   {serie.index[0]:%d/%m/%Y} a {serie.index[-1]:%d/%m/%Y}")
+    print(f"  Valor Final:               R$ {historico.valores[-1]:,.2f}")
+    print(f"  Aportes Líquidos:          R$ {historico.total_aportado:,.2f}")
+    print(f"  Retorno no Tempo (TWR):    {historico.retorno_tempo * 100:.2f}% ({historico.retorno_tempo_anual * 100:.2f}% a.a.)")
+    print(f"  Retorno no Dinheiro (MWR): {historico.retorno_dinheiro_anual * 100:.2f}% a.a.")
+    print("="*48)
+    print(f"Calculado em {historico.tempo_ms:.1f} ms ({len(historico.datas)} dias x {len(historico.tickers)} ativos).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exibe o histórico de valor e os retornos da carteira.")
+    parser.add_argument("--desde", type=datetime.date.fromisoformat, help="Data inicial (AAAA-MM-DD); padrão: primeira transação")
+    adicionar_opcao_perfil(parser)
+    args = parser.parse_args()
+
+    DB_URL = "sqlite:///data/portfolio.db"
+    session_manager = DatabaseSessionManager(DB_URL)
+    service = PortfolioService(
+        session_manager, cache_precos=CachePrecos(), cache=CacheAnalises("data/cache_analises")
+    )
+
+    with perfilar(args.profile, service):
+        exibir_historico(service, args.desde)
@@ -1,6 +1,11 @@
 # analisar_risk_parity.py
 
+import argparse
 from db_nexus import DatabaseSessionManager
+from app.cache import CacheAnalises
+from app.perfil import adicionar_opcao_perfil, perfilar
+from app.planejamento import FAIXA_TOLERANCIA
+from app.precos import CachePrecos
 from app.services import PortfolioService
 
 def exibir_tabelas_risk_parity(service: PortfolioService):
@@ -19,15 +24,15 @@ def exibir_tabelas_risk_parity(service: PortfolioService):
     # 2. Itera sobre cada classe de ativo e imprime sua tabela de análise
     for classe, resultados in analise_rp.items():
         print(f"\n--- SUGESTÃO DE ALOCAÇÃO PARA A CLASSE: {classe.upper()} ---")
-        print(f"{'TICKER':<10} | {'VOL. ANUALIZADA':>16} | {'ALOCAÇÃO RP SUGERIDA':>22} | {'FAIXA DE ALOCAÇÃO (+/- 20%)':>28}")
+        print(f"{'TICKER':<10} | {'VOL. ANUALIZADA':>16} | {'ALOCAÇÃO RP SUGERIDA':>22} | {f'FAIXA DE ALOCAÇÃO (+/- {FAIXA_TOLERANCIA:.0%})':>28}")
         print("-" * 85)
 
         for ativo in resultados:
             sugerido_pct = ativo['alocacao_sugerida'] * 100
             
-            # Calcula a faixa de +/- 20%
-            faixa_min = sugerido_pct * 0.80
-            faixa_max = sugerido_pct * 1.20
+            # Calcula a faixa de tolerância em torno da alocação sugerida
+            faixa_min = sugerido_pct * (1 - FAIXA_TOLERANCIA)
+            faixa_max = sugerido_pct * (1 + FAIXA_TOLERANCIA)
             faixa_str = f"{faixa_min:.2f}% a {faixa_max:.2f}%"
 
             print(
@@ -38,9 +43,52 @@ def exibir_tabelas_risk_parity(service: PortfolioService):
             )
         print("-" * 85)
 
+def exibir_tabelas_erc(service: PortfolioService, por_classe: bool = True):
+    """
+    Exibe a alocação de Contribuição de Risco Igual (ERC), que considera as
+    correlações entre os ativos, com as estatísticas de convergência do solver.
+    """
+    print("\n--- Análise de Alocação por Contribuição de Risco Igual (ERC) ---")
+
+    analise_erc = service.calcular_alocacao_erc(por_classe=por_classe)
+
+    if not analise_erc:
+        print("Não foi possível gerar a análise ERC.")
+        return
+
+    for grupo, resultado in analise_erc.items():
+        print(f"\n--- ALOCAÇÃO ERC: {grupo.upper()} ---")
+        print(f"{'TICKER':<10} | {'ALOCAÇÃO ERC':>14} | {'CONTRIB. RISCO':>16}")
+        print("-" * 48)
+
+        for ativo in sorted(resultado.como_registros(), key=lambda x: x['alocacao_sugerida'], reverse=True):
+            print(
+                f"{ativo['ticker']:<10} | "
+                f"{ativo['alocacao_sugerida']:>13.2%} | "
+                f"{ativo['contribuicao_risco']:>15.2%}"
+            )
+        print("-" * 48)
+        status = "convergiu" if resultado.convergiu else "NÃO convergiu"
+        print(
+            f"Vol. do grupo: {resultado.volatilidade_carteira:.2%} | {status} em {resultado.iteracoes} iterações "
+            f"({resultado.tempo_ms:.1f} ms, erro máx. {resultado.erro_maximo:.1e})"
+        )
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Análise de alocação por paridade de risco.")
+    parser.add_argument("--erc", action="store_true", help="Usa Contribuição de Risco Igual (com correlações).")
+    parser.add_argument("--carteira-inteira", action="store_true", help="Com --erc, resolve a carteira inteira em vez de cada classe.")
+    adicionar_opcao_perfil(parser)
+    args = parser.parse_args()
+
     DB_URL = "sqlite:///data/portfolio.db"
     session_manager = DatabaseSessionManager(DB_URL)
-    service = PortfolioService(session_manager)
+    service = PortfolioService(
+        session_manager, cache_precos=CachePrecos(), cache=CacheAnalises("data/cache_analises")
+    )
     
-    exibir_tabelas_risk_parity(service)
\ No newline at end of file
+    with perfilar(args.profile, service):
+        if args.erc:
+            exibir_tabelas_erc(service, por_classe=not args.carteira_inteira)
+        else:
+            exibir_tabelas_risk_parity(service)
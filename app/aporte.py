@@ -0,0 +1,306 @@
+# aporte.py
+
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Tuple
+
+import numpy as np
+
+from .models import TipoAtivo
+
+# Tamanho do lote de negociação de cada tipo de ativo. O mercado fracionário
+# permite comprar de 1 em 1; quem quiser operar só no lote padrão informa 100.
+LOTES_PADRAO: Dict[TipoAtivo, int] = {tipo: 1 for tipo in TipoAtivo}
+
+# Tempo máximo (ms) do branch-and-bound, para manter a resposta interativa;
+# esgotado o tempo, fica a melhor solução encontrada até ali
+TEMPO_MAXIMO_MS_PADRAO = 200.0
+
+# Quantos gaps (somando todas as profundidades) os limites inferiores guardam
+# para reaproveitar; acima disso, só a última profundidade fica guardada
+MAX_GAPS_GUARDADOS = 1_000_000
+
+# --- Estruturas de Dados ---
+
+@dataclass
+class ResultadoAporte:
+    """
+    Resultado da alocação de um aporte em lotes inteiros.
+    'lotes' e 'valores' seguem a ordem dos vetores de entrada.
+    'distancia' é a soma dos quadrados do que ainda falta para cada alvo (em R$).
+    'otimo' indica se a busca terminou provando a otimalidade da solução.
+    """
+    lotes: np.ndarray
+    valores: np.ndarray
+    caixa_restante: float
+    distancia: float
+    otimo: bool
+    nos: int
+    tempo_ms: float
+
+# --- Relaxação Contínua ---
+
+def _distribuir_continuo_em_lote(necessidades: np.ndarray, orcamentos: np.ndarray) -> np.ndarray:
+    """
+    Solução contínua de  min soma((g - x)^2)  com  soma(x) <= orcamento, 0 <= x <= g,
+    para vários orçamentos de uma vez (uma linha por orçamento):
+    x = max(0, g - mu), com o nível 'mu' escolhido para gastar exatamente o orçamento
+    (enchimento de água: os maiores gaps recebem primeiro).
+    """
+    if len(necessidades) == 0:
+        return np.zeros((len(orcamentos), 0))
+    ordenadas = np.sort(necessidades)[::-1]
+    acumuladas = np.cumsum(ordenadas)
+    # Total gasto quando o nível fica no j-ésimo maior gap
+    ativos = np.arange(1, len(ordenadas) + 1)
+    gasto_no_nivel = acumuladas - ativos * ordenadas
+    j = np.maximum(np.searchsorted(gasto_no_nivel, orcamentos, side='right'), 1)
+    mu = np.where(orcamentos >= acumuladas[-1], 0.0, (acumuladas[j - 1] - orcamentos) / j)
+    return np.maximum(necessidades[None, :] - mu[:, None], 0.0)
+
+def _lotes_iniciais(necessidades: np.ndarray, custos_lote: np.ndarray, orcamentos: np.ndarray) -> np.ndarray:
+    """
+    Solução inteira rápida para cada orçamento: a solução contínua arredondada
+    para baixo, completada de forma gulosa com o lote que mais reduz a distância
+    enquanto houver caixa. Todos os orçamentos avançam juntos, uma linha por orçamento.
+    """
+    lotes = np.floor(_distribuir_continuo_em_lote(necessidades, orcamentos) / custos_lote + 1e-9)
+    caixa = orcamentos - lotes @ custos_lote
+    linhas = np.arange(len(orcamentos))
+    while len(custos_lote):
+        falta = necessidades - lotes * custos_lote
+        ganho = custos_lote * (2 * falta - custos_lote)
+        ganho[custos_lote[None, :] > caixa[:, None] + 1e-9] = -np.inf
+        melhor = np.argmax(ganho, axis=1)
+        melhora = ganho[linhas, melhor] > 0
+        if not melhora.any():
+            break
+        lotes[linhas[melhora], melhor[melhora]] += 1
+        caixa[melhora] -= custos_lote[melhor[melhora]]
+    return lotes
+
+class _LimitesInferiores:
+    """
+    Limite inferior da relaxação contínua para os ativos k..n-1 da busca.
+    Os gaps são ordenados uma única vez; os de uma profundidade k são filtrados
+    dessa ordem em O(n) quando a busca chega nela. As profundidades já vistas
+    são guardadas até MAX_GAPS_GUARDADOS (guardar todas custaria O(n²) de memória).
+    """
+    def __init__(self, necessidades: np.ndarray):
+        ordem = np.argsort(-necessidades, kind='stable')
+        self.n = len(necessidades)
+        self.ordenadas = necessidades[ordem]
+        # Profundidade da busca de cada gap, na ordem decrescente dos gaps
+        self.profundidades = ordem
+        self._guardadas: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._total_guardado = 0
+        self._ultima: Tuple[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] | None = None
+
+    def _da_profundidade(self, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Gaps acumulados, gasto em cada nível e quadrados restantes dos ativos k..n-1."""
+        niveis = self._guardadas.get(k)
+        if niveis is not None:
+            return niveis
+        if self._ultima is not None and self._ultima[0] == k:
+            return self._ultima[1]
+
+        ordenadas = self.ordenadas[self.profundidades >= k]
+        acumuladas = np.cumsum(ordenadas)
+        gasto_no_nivel = acumuladas - np.arange(1, len(ordenadas) + 1) * ordenadas
+        # Soma dos quadrados dos gaps a partir da posição j (os que ficam sem nada)
+        quadrados_restantes = np.append(np.cumsum((ordenadas ** 2)[::-1])[::-1], 0.0)
+        niveis = (acumuladas, gasto_no_nivel, quadrados_restantes)
+        if self._total_guardado + len(ordenadas) <= MAX_GAPS_GUARDADOS:
+            self._guardadas[k] = niveis
+            self._total_guardado += len(ordenadas)
+        else:
+            self._ultima = (k, niveis)
+        return niveis
+
+    def _nivel(self, k: int, orcamento: float) -> Tuple[int, float]:
+        """Número de ativos k..n-1 que recebem algo na relaxação contínua e o nível 'mu'."""
+        acumuladas, gasto_no_nivel, _ = self._da_profundidade(k)
+        if acumuladas[-1] <= orcamento:
+            return len(acumuladas), 0.0
+        j = int(np.searchsorted(gasto_no_nivel, orcamento, side='right'))
+        return j, (acumuladas[j - 1] - orcamento) / j
+
+    def calcular(self, k: int, orcamento: float) -> float:
+        """Menor distância possível para os ativos k..n-1 com o orçamento dado."""
+        if k >= self.n:
+            return 0.0
+        acumuladas, _, quadrados_restantes = self._da_profundidade(k)
+        if acumuladas[-1] <= orcamento:
+            return 0.0
+        j, mu = self._nivel(k, orcamento)
+        return j * mu * mu + quadrados_restantes[j]
+
+    def continuo(self, k: int, gap: float, orcamento: float) -> float:
+        """Valor da relaxação contínua para o ativo k (o mesmo de `_distribuir_continuo_em_lote`)."""
+        return max(gap - self._nivel(k, orcamento)[1], 0.0)
+
+# --- Alocador ---
+
+def alocar_aporte_em_lotes(
+    necessidades: np.ndarray,
+    custos_lote: np.ndarray,
+    valor_aporte: float,
+    tempo_maximo_ms: float = TEMPO_MAXIMO_MS_PADRAO,
+) -> ResultadoAporte:
+    """
+    Escolhe quantos lotes comprar de cada ativo para chegar o mais perto possível
+    das necessidades (R$ que faltam para o alvo de cada ativo), sem passar do aporte:
+
+        min soma((g_i - q_i * c_i)^2)   com   soma(q_i * c_i) <= aporte,  q_i inteiro >= 0
+
+    1. Parte da solução contínua (enchimento de água) arredondada para baixo;
+    2. Completa de forma gulosa com o lote que mais reduz a distância;
+    3. Refina com branch-and-bound em profundidade, usando a relaxação contínua
+       como limite inferior. A busca para depois de 'tempo_maximo_ms' e devolve
+       a melhor solução encontrada ('otimo' = False nesse caso).
+    """
+    inicio = time.perf_counter()
+    necessidades = np.maximum(np.nan_to_num(np.asarray(necessidades, dtype=float)), 0.0)
+    custos_lote = np.asarray(custos_lote, dtype=float)
+    n = len(necessidades)
+
+    # Ativos sem gap ou sem preço nunca recebem compras
+    validos = np.flatnonzero((necessidades > 0) & (custos_lote > 0))
+    g = necessidades[validos]
+    c = custos_lote[validos]
+
+    # 1. Ponto de partida: contínuo arredondado para baixo e completado de forma gulosa
+    q = _lotes_iniciais(g, c, np.array([float(valor_aporte)]))[0]
+
+    melhor_q = q.copy()
+    melhor_distancia = float(((g - q * c) ** 2).sum())
+
+    # 2. Branch-and-bound: ativos mais caros primeiro, pois decidem mais do caixa
+    ordem = np.argsort(-c)
+    g_ord, c_ord = g[ordem], c[ordem]
+    limites = _LimitesInferiores(g_ord)
+    max_lotes = np.ceil(g_ord / c_ord).astype(int)
+    # Custo de levar todos os ativos k..n-1 ao teto; se couber no caixa, cada
+    # ativo pode ser decidido sozinho (o número de lotes mais próximo do gap)
+    custo_teto = np.append(np.cumsum((max_lotes * c_ord)[::-1])[::-1], 0.0)
+    independentes = np.rint(g_ord / c_ord)
+
+    nos = 0
+    otimo = True
+    prazo = inicio + tempo_maximo_ms / 1000
+    atual = np.zeros(len(ordem))
+    # Cada entrada: (profundidade, caixa restante, distância acumulada, candidatos pendentes)
+    pilha = [(0, float(valor_aporte), 0.0, None)]
+    while pilha:
+        k, caixa, distancia, candidatos = pilha.pop()
+        if candidatos is None:
+            nos += 1
+            if time.perf_counter() > prazo:
+                otimo = False
+                break
+            if distancia + limites.calcular(k, caixa) >= melhor_distancia - 1e-6:
+                continue
+            if custo_teto[k] <= caixa:
+                atual[k:] = independentes[k:]
+                distancia += float(((g_ord[k:] - independentes[k:] * c_ord[k:]) ** 2).sum())
+                k = len(ordem)
+            if k == len(ordem):
+                if distancia >= melhor_distancia - 1e-6:
+                    continue
+                melhor_distancia = distancia
+                melhor_q = np.empty_like(q)
+                melhor_q[ordem] = atual
+                continue
+            # Filhos em ordem de proximidade ao valor contínuo deste ativo
+            alvo = limites.continuo(k, g_ord[k], caixa) / c_ord[k]
+            teto = min(max_lotes[k], int(caixa // c_ord[k] + 1e-9))
+            candidatos = sorted(range(teto + 1), key=lambda lotes: abs(lotes - alvo), reverse=True)
+        if not candidatos:
+            continue
+        lotes = candidatos.pop()
+        pilha.append((k, caixa, distancia, candidatos))
+        atual[k] = lotes
+        atual[k + 1:] = 0
+        gasto = lotes * c_ord[k]
+        pilha.append((k + 1, caixa - gasto, distancia + (g_ord[k] - gasto) ** 2, None))
+
+    # 3. Monta o resultado na ordem dos vetores de entrada
+    lotes_finais = np.zeros(n, dtype=int)
+    lotes_finais[validos] = melhor_q.astype(int)
+    valores = lotes_finais * np.where(custos_lote > 0, custos_lote, 0.0)
+    return ResultadoAporte(
+        lotes=lotes_finais,
+        valores=valores,
+        caixa_restante=float(valor_aporte - valores.sum()),
+        distancia=melhor_distancia + float((necessidades[np.setdiff1d(np.arange(n), validos)] ** 2).sum()),
+        otimo=otimo,
+        nos=nos,
+        tempo_ms=(time.perf_counter() - inicio) * 1000,
+    )
+
+def custos_por_lote(precos: np.ndarray, tipos: list, lotes: Mapping[TipoAtivo, int] | None = None) -> np.ndarray:
+    """Custo de um lote de cada ativo (preço x tamanho do lote do seu tipo)."""
+    tamanhos = {**LOTES_PADRAO, **(lotes or {})}
+    return np.asarray(precos, dtype=float) * np.array([tamanhos.get(tipo, 1) for tipo in tipos], dtype=float)
+
+# --- Simulação de Vários Aportes ---
+
+@dataclass
+class CenariosAporte:
+    """
+    Planos de aporte para vários valores de uma vez. Cada linha das matrizes
+    corresponde a um valor de 'valores_aporte' e cada coluna a um ticker.
+    'pesos_pos_aporte' é a alocação de cada ativo dentro da sua classe depois
+    das compras e 'erro_medio' a distância média (em pontos de alocação) entre
+    esses pesos e a alocação sugerida.
+    """
+    valores_aporte: np.ndarray
+    tickers: List[str]
+    alocacao_sugerida: np.ndarray
+    lotes: np.ndarray
+    valores: np.ndarray
+    caixa_restante: np.ndarray
+    pesos_pos_aporte: np.ndarray
+    erro_medio: np.ndarray
+    tempo_ms: float
+
+    def como_registros(self) -> List[Dict]:
+        """Resumo de cada cenário, um dicionário por valor de aporte."""
+        return [
+            {
+                "valor_aporte": float(self.valores_aporte[i]),
+                "total_alocado": float(self.valores[i].sum()),
+                "caixa_restante": float(self.caixa_restante[i]),
+                "ordens": int(np.count_nonzero(self.lotes[i])),
+                "erro_medio": float(self.erro_medio[i]),
+            }
+            for i in range(len(self.valores_aporte))
+        ]
+
+def simular_aportes_em_lotes(
+    necessidades: np.ndarray,
+    custos_lote: np.ndarray,
+    valores_aporte: np.ndarray,
+    refinar: bool = False,
+) -> np.ndarray:
+    """
+    Calcula os lotes de cada ativo para todos os 'valores_aporte' numa única
+    passada vetorizada (uma linha por valor). Sem 'refinar', usa a solução
+    contínua arredondada e completada de forma gulosa, a mesma que serve de
+    ponto de partida para `alocar_aporte_em_lotes`; com 'refinar', cada
+    cenário passa também pelo branch-and-bound.
+    """
+    necessidades = np.maximum(np.nan_to_num(np.asarray(necessidades, dtype=float)), 0.0)
+    custos_lote = np.asarray(custos_lote, dtype=float)
+    valores_aporte = np.asarray(valores_aporte, dtype=float)
+
+    if refinar:
+        return np.array(
+            [alocar_aporte_em_lotes(necessidades, custos_lote, valor).lotes for valor in valores_aporte],
+            dtype=int,
+        ).reshape(len(valores_aporte), len(necessidades))
+
+    validos = np.flatnonzero((necessidades > 0) & (custos_lote > 0))
+    lotes = np.zeros((len(valores_aporte), len(necessidades)), dtype=int)
+    lotes[:, validos] = _lotes_iniciais(necessidades[validos], custos_lote[validos], valores_aporte).astype(int)
+    return lotes
@@ -0,0 +1,278 @@
+# backtest.py
+
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from .planejamento import COMPRAR, FAIXA_TOLERANCIA, VENDER, planejar_rebalanceamento
+
+# 252 é o número aproximado de dias de pregão em um ano.
+DIAS_PREGAO_ANO = 252
+
+# --- Estruturas de Dados ---
+
+@dataclass(frozen=True)
+class ConfiguracaoBacktest:
+    """
+    Parâmetros de uma simulação da regra de rebalanceamento por faixas.
+    'frequencia_pregoes' é o intervalo, em pregões, entre as verificações das
+    faixas; 'custo_transacao' é a fração do valor negociado paga em custos.
+    """
+    faixa_tolerancia: float = FAIXA_TOLERANCIA
+    janela_volatilidade_dias: int = 2 * 365
+    frequencia_pregoes: int = 21
+    custo_transacao: float = 0.001
+    capital_inicial: float = 100_000.0
+
+@dataclass
+class ResultadoBacktest:
+    """Métricas de uma simulação. Retornos, volatilidade e turnover são anuais."""
+    configuracao: ConfiguracaoBacktest
+    retorno_total: float
+    retorno_anual: float
+    volatilidade_anual: float
+    max_drawdown: float
+    turnover_anual: float
+    custos_totais: float
+    rebalanceamentos: int
+    tempo_ms: float
+
+    def como_registro(self) -> Dict:
+        registro = asdict(self.configuracao)
+        registro.update({chave: valor for chave, valor in asdict(self).items() if chave != 'configuracao'})
+        return registro
+
+def grade_parametros(
+    faixas: Iterable[float] = (FAIXA_TOLERANCIA,),
+    janelas_dias: Iterable[int] = (2 * 365,),
+    frequencias_pregoes: Iterable[int] = (21,),
+    custos: Iterable[float] = (0.001,),
+    capital_inicial: float = 100_000.0,
+) -> List[ConfiguracaoBacktest]:
+    """Todas as combinações dos parâmetros informados."""
+    return [
+        ConfiguracaoBacktest(faixa, janela, frequencia, custo, capital_inicial)
+        for faixa, janela, frequencia, custo in itertools.product(faixas, janelas_dias, frequencias_pregoes, custos)
+    ]
+
+# --- Matriz de Preços Compartilhada ---
+
+class MatrizCompartilhada:
+    """
+    Copia a matriz de preços uma única vez para a memória compartilhada, de
+    onde os processos do pool a leem sem cópia e somente para leitura.
+    Use como gerenciador de contexto: a memória é liberada na saída.
+    """
+    def __init__(self, matriz: np.ndarray):
+        matriz = np.ascontiguousarray(matriz, dtype=np.float64)
+        self.formato = matriz.shape
+        self.memoria = shared_memory.SharedMemory(create=True, size=max(matriz.nbytes, 1))
+        np.ndarray(self.formato, dtype=np.float64, buffer=self.memoria.buf)[:] = matriz
+
+    @property
+    def descritor(self) -> Tuple[str, Tuple[int, int]]:
+        return self.memoria.name, self.formato
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.memoria.close()
+        self.memoria.unlink()
+
+# Estado de cada processo do pool, preenchido por `_iniciar_processo`
+_DADOS_PROCESSO: Dict = {}
+
+def _iniciar_processo(descritor, datas, codigo_classe, pesos_classes):
+    nome, formato = descritor
+    memoria = shared_memory.SharedMemory(name=nome)
+    precos = np.ndarray(formato, dtype=np.float64, buffer=memoria.buf)
+    precos.flags.writeable = False
+    _DADOS_PROCESSO.update(
+        memoria=memoria, precos=precos, datas=datas,
+        codigo_classe=codigo_classe, pesos_classes=pesos_classes, volatilidades={},
+    )
+
+def _simular_no_processo(configuracao: ConfiguracaoBacktest) -> ResultadoBacktest:
+    dados = _DADOS_PROCESSO
+    janela = configuracao.janela_volatilidade_dias
+    if janela not in dados['volatilidades']:
+        dados['volatilidades'][janela] = volatilidades_moveis(dados['precos'], dados['datas'], janela)
+    return simular(
+        dados['precos'], dados['datas'], dados['codigo_classe'], dados['pesos_classes'],
+        configuracao, dados['volatilidades'][janela],
+    )
+
+# --- Simulação ---
+
+def preencher_adiante(precos: np.ndarray) -> np.ndarray:
+    """Repete o último preço conhecido de cada coluna nos dias sem cotação (NaN antes da primeira)."""
+    conhecidos = ~np.isnan(precos)
+    linha_valida = np.where(conhecidos, np.arange(len(precos))[:, None], 0)
+    np.maximum.accumulate(linha_valida, axis=0, out=linha_valida)
+    preenchidos = precos[linha_valida, np.arange(precos.shape[1])]
+    preenchidos[~np.maximum.accumulate(conhecidos, axis=0)] = np.nan
+    return preenchidos
+
+def volatilidades_moveis(precos: np.ndarray, datas: np.ndarray, janela_dias: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Volatilidade anualizada de cada ticker em cada pregão, usando os retornos
+    dos últimos 'janela_dias' dias corridos (como o serviço faz hoje), calculada
+    de uma vez com somas acumuladas. Retorna (volatilidades, primeira linha com
+    a janela completa).
+    """
+    retornos = np.full(precos.shape, np.nan)
+    retornos[1:] = precos[1:] / precos[:-1] - 1
+    validos = ~np.isnan(retornos)
+    zeros = np.zeros((1, precos.shape[1]))
+    soma = np.concatenate((zeros, np.cumsum(np.where(validos, retornos, 0.0), axis=0)))
+    soma_quadrados = np.concatenate((zeros, np.cumsum(np.where(validos, retornos ** 2, 0.0), axis=0)))
+    contagem = np.concatenate((zeros, np.cumsum(validos, axis=0)))
+
+    # Linha em que começa a janela de cada pregão; o primeiro retorno da janela
+    # é o do dia seguinte ao primeiro preço dentro dela
+    inicio = np.searchsorted(datas, datas - np.timedelta64(janela_dias, 'D'), side='left') + 1
+    fim = np.arange(len(datas)) + 1
+    n = contagem[fim] - contagem[inicio]
+    s = soma[fim] - soma[inicio]
+    s2 = soma_quadrados[fim] - soma_quadrados[inicio]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variancia = (s2 - s * s / n) / (n - 1)
+    volatilidades = np.sqrt(np.maximum(variancia, 0.0)) * math.sqrt(DIAS_PREGAO_ANO)
+    volatilidades[n < 2] = np.nan
+    primeira_linha = int(np.searchsorted(datas, datas[0] + np.timedelta64(janela_dias, 'D'), side='left'))
+    return volatilidades, primeira_linha
+
+def _alocacao_alvo(volatilidades: np.ndarray, codigo_classe: np.ndarray) -> np.ndarray:
+    """Peso inverso da volatilidade dentro de cada classe (0 para quem não tem volatilidade)."""
+    inverso = np.where(volatilidades > 0, 1 / np.where(volatilidades > 0, volatilidades, 1.0), 0.0)
+    soma_classe = np.bincount(codigo_classe, weights=inverso, minlength=codigo_classe.max() + 1)[codigo_classe]
+    return np.divide(inverso, soma_classe, out=np.zeros_like(inverso), where=soma_classe > 0)
+
+def simular(
+    precos: np.ndarray,
+    datas: np.ndarray,
+    codigo_classe: np.ndarray,
+    pesos_classes: np.ndarray,
+    configuracao: ConfiguracaoBacktest,
+    volatilidades: Tuple[np.ndarray, int] | None = None,
+) -> ResultadoBacktest:
+    """
+    Simula a estratégia pregão a pregão sobre a matriz de preços (já preenchida
+    adiante). Começa quando a primeira janela de volatilidade está completa, com
+    cada classe recebendo 'pesos_classes' do capital e, dentro dela, pesos
+    inversos à volatilidade. A cada 'frequencia_pregoes' pregões as faixas são
+    verificadas e o plano de capital neutro (`planejar_rebalanceamento`) é
+    executado, pagando 'custo_transacao' sobre o valor negociado. Entre as
+    verificações a carteira fica parada, então o valor diário de cada trecho é
+    um único produto matriz x vetor.
+    """
+    inicio = time.perf_counter()
+    if volatilidades is None:
+        volatilidades = volatilidades_moveis(precos, datas, configuracao.janela_volatilidade_dias)
+    matriz_vol, primeira_linha = volatilidades
+    n_datas = len(datas)
+    if primeira_linha >= n_datas - 1:
+        raise ValueError("Histórico de preços menor que a janela de volatilidade.")
+
+    precos_zerados = np.nan_to_num(precos, nan=0.0)
+    pesos_classes = np.asarray(pesos_classes, dtype=float)
+
+    # 1. Carteira inicial: peso da classe x peso inverso à volatilidade na classe
+    alvo = _alocacao_alvo(matriz_vol[primeira_linha], codigo_classe)
+    valores_iniciais = configuracao.capital_inicial * pesos_classes[codigo_classe] * alvo
+    quantidades = np.divide(
+        valores_iniciais, precos_zerados[primeira_linha],
+        out=np.zeros_like(valores_iniciais), where=precos_zerados[primeira_linha] > 0,
+    )
+    caixa = configuracao.capital_inicial - valores_iniciais.sum()
+
+    valores = np.empty(n_datas - primeira_linha)
+    negociado = 0.0
+    custos = 0.0
+    rebalanceamentos = 0
+
+    # 2. Trechos entre verificações: valor diário com a carteira parada
+    verificacoes = list(range(primeira_linha, n_datas, configuracao.frequencia_pregoes)) + [n_datas]
+    for linha, proxima in zip(verificacoes[:-1], verificacoes[1:]):
+        if linha > primeira_linha:
+            # 3. Verifica as faixas e executa o plano de capital neutro
+            preco = precos_zerados[linha]
+            _, codigo, valor = planejar_rebalanceamento(
+                codigo_classe, quantidades * preco,
+                _alocacao_alvo(matriz_vol[linha], codigo_classe), preco,
+                configuracao.faixa_tolerancia,
+            )
+            vendas = np.where(codigo == VENDER, valor, 0.0)
+            compras = np.where(codigo == COMPRAR, valor, 0.0)
+            if vendas.any():
+                rebalanceamentos += 1
+                quantidades = quantidades + np.divide(compras - vendas, preco, out=np.zeros_like(preco), where=preco > 0)
+                custo = configuracao.custo_transacao * (vendas.sum() + compras.sum())
+                caixa += vendas.sum() - compras.sum() - custo
+                negociado += (vendas.sum() + compras.sum()) / 2
+                custos += custo
+        valores[linha - primeira_linha:proxima - primeira_linha] = precos_zerados[linha:proxima] @ quantidades + caixa
+
+    # 4. Métricas da série diária de valores
+    retornos = valores[1:] / valores[:-1] - 1
+    anos = (datas[-1] - datas[primeira_linha]).astype('timedelta64[D]').astype(float) / 365.25
+    retorno_total = valores[-1] / valores[0] - 1
+    picos = np.maximum.accumulate(valores)
+    return ResultadoBacktest(
+        configuracao=configuracao,
+        retorno_total=float(retorno_total),
+        retorno_anual=float((1 + retorno_total) ** (1 / anos) - 1) if anos > 0 else float('nan'),
+        volatilidade_anual=float(retornos.std(ddof=1) * math.sqrt(DIAS_PREGAO_ANO)) if len(retornos) > 1 else float('nan'),
+        max_drawdown=float((valores / picos - 1).min()),
+        turnover_anual=float(negociado / valores.mean() / anos) if anos > 0 else float('nan'),
+        custos_totais=float(custos),
+        rebalanceamentos=rebalanceamentos,
+        tempo_ms=(time.perf_counter() - inicio) * 1000,
+    )
+
+# --- Grade de Parâmetros ---
+
+def executar_grade(
+    precos: np.ndarray,
+    datas: np.ndarray,
+    codigo_classe: np.ndarray,
+    pesos_classes: np.ndarray,
+    configuracoes: Sequence[ConfiguracaoBacktest],
+    processos: int | None = None,
+) -> List[ResultadoBacktest]:
+    """
+    Executa uma simulação por configuração. Com mais de um processo, a matriz
+    de preços é colocada uma única vez na memória compartilhada e cada processo
+    do pool a lê sem cópia; volatilidades de uma mesma janela são calculadas uma
+    vez por processo. Os resultados seguem a ordem de 'configuracoes'.
+    """
+    precos = preencher_adiante(np.asarray(precos, dtype=float))
+    datas = np.asarray(datas, dtype='datetime64[D]')
+    codigo_classe = np.asarray(codigo_classe)
+    processos = min(processos or os.cpu_count() or 1, len(configuracoes))
+
+    if processos <= 1:
+        volatilidades: Dict[int, Tuple[np.ndarray, int]] = {}
+        resultados = []
+        for configuracao in configuracoes:
+            janela = configuracao.janela_volatilidade_dias
+            if janela not in volatilidades:
+                volatilidades[janela] = volatilidades_moveis(precos, datas, janela)
+            resultados.append(simular(precos, datas, codigo_classe, pesos_classes, configuracao, volatilidades[janela]))
+        return resultados
+
+    with MatrizCompartilhada(precos) as compartilhada:
+        with ProcessPoolExecutor(
+            max_workers=processos,
+            initializer=_iniciar_processo,
+            initargs=(compartilhada.descritor, datas, codigo_classe, pesos_classes),
+        ) as pool:
+            return list(pool.map(_simular_no_processo, configuracoes))
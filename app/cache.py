@@ -0,0 +1,91 @@
+# cache.py
+
+import copy
+import functools
+import hashlib
+import os
+import pickle
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+class CacheAnalises:
+    """
+    Guarda o resultado de análises junto com o marcador de versão dos dados
+    usados para calculá-las. Um resultado só é reaproveitado enquanto o
+    marcador não mudar. Fica sempre em memória e, se um 'diretorio' for
+    informado, também em disco, para ser reaproveitado entre processos.
+    """
+    def __init__(self, diretorio: str | None = None):
+        self.diretorio = diretorio
+        self._memoria: Dict[str, Tuple[Any, Any]] = {}
+        self._trava = threading.Lock()
+
+    def obter(self, chave: str, marcador: Any, calcular: Callable[[], Any]) -> Any:
+        """
+        Retorna o valor de 'chave' calculado com os dados na versão 'marcador',
+        chamando 'calcular' apenas se não houver um resultado válido guardado.
+        Sempre devolve uma cópia, para que quem chama possa alterá-la à vontade.
+        """
+        with self._trava:
+            guardado = self._memoria.get(chave)
+        if guardado is None or guardado[0] != marcador:
+            guardado = self._ler_disco(chave)
+        if guardado is None or guardado[0] != marcador:
+            guardado = (marcador, calcular())
+            self._gravar_disco(chave, guardado)
+        with self._trava:
+            self._memoria[chave] = guardado
+        return copy.deepcopy(guardado[1])
+
+    def limpar(self):
+        """Descarta todos os resultados guardados em memória."""
+        with self._trava:
+            self._memoria.clear()
+
+    # --- Métodos internos ---
+
+    def _caminho(self, chave: str) -> str:
+        nome = hashlib.sha1(chave.encode('utf-8')).hexdigest()
+        return os.path.join(self.diretorio, f"{nome}.pkl")
+
+    def _ler_disco(self, chave: str) -> Tuple[Any, Any] | None:
+        if self.diretorio is None:
+            return None
+        try:
+            with open(self._caminho(chave), 'rb') as arquivo:
+                return pickle.load(arquivo)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _gravar_disco(self, chave: str, guardado: Tuple[Any, Any]):
+        if self.diretorio is None:
+            return
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho = self._caminho(chave)
+        # Grava em um arquivo temporário e troca de uma vez, para que outro
+        # processo nunca leia um arquivo pela metade
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporario, 'wb') as arquivo:
+            pickle.dump(guardado, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, caminho)
+
+def memoizar(*tabelas: str):
+    """
+    Decorador para métodos do PortfolioService: guarda o resultado no cache do
+    serviço e o invalida quando alguma das 'tabelas' informadas muda.
+    O serviço deve oferecer `cache`, `banco` e `_marcador_dados(tabelas)`.
+    """
+    def decorador(metodo):
+        @functools.wraps(metodo)
+        def envoltorio(self, *args, **kwargs):
+            if self.cache is None:
+                return metodo(self, *args, **kwargs)
+            # O banco e a carteira do serviço fazem parte da chave: cada um tem as suas análises
+            chave = (
+                f"{metodo.__name__}:{self.banco!r}:{getattr(self, 'carteira', None)!r}:"
+                f"{args!r}:{sorted(kwargs.items())!r}"
+            )
+            marcador = self._marcador_dados(tabelas)
+            return self.cache.obter(chave, marcador, lambda: metodo(self, *args, **kwargs))
+        return envoltorio
+    return decorador
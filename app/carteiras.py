@@ -0,0 +1,165 @@
+# carteiras.py
+
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .models import TipoAtivo
+from .planejamento import (
+    COMPRAR,
+    FAIXA_TOLERANCIA,
+    RECOMENDACOES,
+    VENDER,
+    ItemPlano,
+    PlanoRebalanceamento,
+    planejar_rebalanceamento,
+)
+
+# --- Estruturas de Dados ---
+
+@dataclass
+class AnaliseCarteiras:
+    """
+    Análise de várias carteiras calculada de uma só vez. Os vetores por
+    posição ('carteira', 'ativo', 'quantidade', ...) têm um elemento por par
+    carteira x ativo com saldo; 'carteira' e 'ativo' indexam 'nomes' e 'tickers'.
+    Os vetores por carteira ('valor_total', 'volatilidade') seguem 'nomes'.
+    """
+    nomes: List[str]
+    tickers: List[str]
+    tipos: List[TipoAtivo]
+    precos: np.ndarray
+    carteira: np.ndarray
+    ativo: np.ndarray
+    quantidade: np.ndarray
+    valor_mercado: np.ndarray
+    alocacao_atual_na_classe: np.ndarray
+    alocacao_sugerida: np.ndarray
+    recomendacao: np.ndarray
+    valor_a_movimentar: np.ndarray
+    valor_total: np.ndarray
+    volatilidade: np.ndarray
+    faixa_tolerancia: float
+    tempo_ms: float
+
+    def plano(self, nome: str) -> PlanoRebalanceamento:
+        """Plano de rebalanceamento de uma carteira, no mesmo formato do serviço."""
+        indice = self.nomes.index(nome)
+        posicoes = np.flatnonzero(self.carteira == indice)
+        _, classes = np.unique([self.tipos[a].value for a in self.ativo[posicoes]], return_inverse=True)
+        # Por classe (em ordem alfabética), Vender, Comprar e Neutro
+        ordem = posicoes[np.lexsort((self.recomendacao[posicoes], classes))]
+        itens = tuple(
+            ItemPlano(
+                ticker=self.tickers[self.ativo[i]],
+                tipo=self.tipos[self.ativo[i]].value,
+                tipo_ativo=self.tipos[self.ativo[i]],
+                preco_atual=float(self.precos[self.ativo[i]]),
+                valor_mercado=float(self.valor_mercado[i]),
+                alocacao_atual_na_classe=float(self.alocacao_atual_na_classe[i]),
+                alocacao_sugerida=float(self.alocacao_sugerida[i]),
+                recomendacao=RECOMENDACOES[self.recomendacao[i]],
+                valor_a_movimentar=float(self.valor_a_movimentar[i]),
+            )
+            for i in ordem
+        )
+        return PlanoRebalanceamento(itens=itens, faixa_tolerancia=self.faixa_tolerancia)
+
+    def como_registros(self) -> List[Dict]:
+        """Resumo de cada carteira, um dicionário por carteira."""
+        n = len(self.nomes)
+        vendas = np.bincount(self.carteira, weights=np.where(self.recomendacao == VENDER, self.valor_a_movimentar, 0.0), minlength=n)
+        compras = np.bincount(self.carteira, weights=np.where(self.recomendacao == COMPRAR, self.valor_a_movimentar, 0.0), minlength=n)
+        ativos = np.bincount(self.carteira, minlength=n)
+        return [
+            {
+                "carteira": nome,
+                "ativos": int(ativos[i]),
+                "valor_total": float(self.valor_total[i]),
+                "volatilidade": float(self.volatilidade[i]),
+                "total_vendas": float(vendas[i]),
+                "total_compras": float(compras[i]),
+            }
+            for i, nome in enumerate(self.nomes)
+        ]
+
+# --- Análise em Lote ---
+
+def analisar_carteiras_em_lote(
+    nomes: Sequence[str],
+    posicoes: Sequence[Tuple[int, int, float]],
+    tickers: Sequence[str],
+    tipos: Sequence[TipoAtivo],
+    precos: np.ndarray,
+    volatilidades: np.ndarray,
+    covariancia: np.ndarray | None = None,
+    faixa_tolerancia: float = FAIXA_TOLERANCIA,
+) -> AnaliseCarteiras:
+    """
+    Calcula valores de mercado, alocações, alvos de Risk Parity e o plano de
+    rebalanceamento de todas as carteiras com operações sobre vetores.
+
+    'posicoes' são tuplas (índice da carteira, índice do ativo, quantidade);
+    'precos', 'volatilidades' (anualizadas) e 'covariancia' (anualizada) seguem
+    'tickers', a união dos ativos de todas as carteiras, e são calculados uma
+    única vez para todas elas.
+
+    O alvo de cada ativo é o peso inverso à volatilidade entre os ativos da
+    mesma classe que a própria carteira possui.
+    """
+    inicio = time.perf_counter()
+    precos = np.asarray(precos, dtype=float)
+    volatilidades = np.asarray(volatilidades, dtype=float)
+    n_carteiras = len(nomes)
+    colunas = list(zip(*posicoes)) or [(), (), ()]
+    carteira = np.asarray(colunas[0], dtype=int)
+    ativo = np.asarray(colunas[1], dtype=int)
+    quantidade = np.asarray(colunas[2], dtype=float)
+
+    # 1. Valor de mercado de cada posição e total de cada carteira
+    valor_mercado = quantidade * precos[ativo]
+    valor_total = np.bincount(carteira, weights=valor_mercado, minlength=n_carteiras)
+
+    # 2. Um código por par carteira x classe, para subtotais e alvos por grupo
+    _, codigo_tipo = np.unique([tipo.value for tipo in tipos], return_inverse=True)
+    n_tipos = codigo_tipo.max() + 1 if len(tipos) else 1
+    grupo = carteira * n_tipos + codigo_tipo[ativo]
+
+    # 3. Alvo: inverso da volatilidade, normalizado dentro de cada grupo
+    inverso = np.where(volatilidades > 0, 1 / np.where(volatilidades > 0, volatilidades, 1.0), 0.0)[ativo]
+    soma_grupo = np.bincount(grupo, weights=inverso, minlength=n_carteiras * n_tipos)[grupo]
+    alocacao_sugerida = np.divide(inverso, soma_grupo, out=np.full_like(inverso, np.nan), where=soma_grupo > 0)
+
+    # 4. Plano de capital neutro de todas as carteiras numa única chamada
+    alocacao_atual, recomendacao, valor_a_movimentar = planejar_rebalanceamento(
+        grupo, valor_mercado, alocacao_sugerida, precos[ativo], faixa_tolerancia, carteiras=carteira
+    )
+
+    # 5. Volatilidade de cada carteira: sqrt(w' Σ w) para todas de uma vez
+    volatilidade = np.full(n_carteiras, np.nan)
+    if covariancia is not None and len(valor_mercado):
+        pesos = np.zeros((n_carteiras, len(tickers)))
+        np.add.at(pesos, (carteira, ativo), valor_mercado)
+        pesos = np.divide(pesos, valor_total[:, None], out=np.zeros_like(pesos), where=valor_total[:, None] > 0)
+        volatilidade = np.sqrt(np.maximum(np.einsum('ki,ki->k', pesos @ covariancia, pesos), 0.0))
+
+    return AnaliseCarteiras(
+        nomes=list(nomes),
+        tickers=list(tickers),
+        tipos=list(tipos),
+        precos=precos,
+        carteira=carteira,
+        ativo=ativo,
+        quantidade=quantidade,
+        valor_mercado=valor_mercado,
+        alocacao_atual_na_classe=alocacao_atual,
+        alocacao_sugerida=alocacao_sugerida,
+        recomendacao=recomendacao,
+        valor_a_movimentar=valor_a_movimentar,
+        valor_total=valor_total,
+        volatilidade=volatilidade,
+        faixa_tolerancia=faixa_tolerancia,
+        tempo_ms=(time.perf_counter() - inicio) * 1000,
+    )
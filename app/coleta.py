@@ -0,0 +1,233 @@
+# coleta.py
+
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Protocol, Sequence
+
+import numpy as np
+import pandas as pd
+
+# --- Fontes de Cotações ---
+
+class ErroColeta(Exception):
+    """
+    Falha esperada ao baixar cotações (rede, limite da API, resposta inválida).
+    As fontes a usam para separar esses casos de erros de programação, que não
+    devem ser tratados como um lote que simplesmente falhou.
+    """
+
+class FonteCotacoes(Protocol):
+    """
+    Interface de uma fonte de cotações diárias.
+    Qualquer objeto com um método `baixar` compatível pode ser injetado no
+    ColetorHistorico (ex: uma fonte falsa em memória para testes e benchmarks).
+    """
+    def baixar(
+        self, tickers: Sequence[str], data_inicial: str, data_final: str, aguardar: Callable[[], None] | None = None
+    ) -> pd.DataFrame:
+        """
+        Retorna os preços de fechamento no intervalo [data_inicial, data_final).
+        O DataFrame deve ter as datas como índice e um ticker por coluna.
+        'aguardar', se informado, deve ser chamado antes de cada requisição feita
+        à API, para que o limite de taxa valha por requisição e não por lote.
+        Falhas de rede ou da API devem ser levantadas como ErroColeta (ou OSError).
+        """
+        ...
+
+class YahooFinanceFonte:
+    """
+    Fonte de cotações do Yahoo Finance.
+    O yfinance só é importado na primeira chamada, pois é uma dependência pesada.
+    O endpoint de histórico do Yahoo aceita um único ticker por requisição, então
+    um lote sempre custa uma requisição por ticker (o `yf.download` com vários
+    tickers também faz isso, apenas em threads próprias).
+    """
+    def baixar(
+        self, tickers: Sequence[str], data_inicial: str, data_final: str, aguardar: Callable[[], None] | None = None
+    ) -> pd.DataFrame:
+        import yfinance as yf
+        from yfinance.exceptions import YFException
+
+        # O `yf.download` guarda o resultado em variáveis globais do módulo e não
+        # pode ser chamado por várias threads ao mesmo tempo; `Ticker.history`
+        # faz a mesma requisição por ticker e é seguro entre threads.
+        series = {}
+        for ticker in tickers:
+            if aguardar is not None:
+                aguardar()
+            try:
+                historico = yf.Ticker(ticker).history(start=data_inicial, end=data_final)
+            except (OSError, ValueError, YFException) as e:
+                # Rede (as exceções do requests/curl_cffi são OSError), JSON inválido e erros da API
+                raise ErroColeta(f"{ticker}: {e}") from e
+            if historico.empty:
+                continue
+            fechamentos = historico['Close']
+            # As datas vêm com fuso horário; guardamos apenas o dia local do pregão
+            if fechamentos.index.tz is not None:
+                fechamentos.index = fechamentos.index.tz_localize(None)
+            series[ticker] = fechamentos
+
+        if not series:
+            return pd.DataFrame()
+        return pd.concat(series, axis=1)
+
+class FonteCotacoesEmMemoria:
+    """
+    Fonte de cotações que responde a partir de um DataFrame já carregado
+    (datas no índice, tickers da API nas colunas). Útil para testes e benchmarks.
+    """
+    def __init__(self, precos: pd.DataFrame):
+        self.precos = precos.sort_index()
+
+    def baixar(
+        self, tickers: Sequence[str], data_inicial: str, data_final: str, aguardar: Callable[[], None] | None = None
+    ) -> pd.DataFrame:
+        # Uma única consulta em memória por lote
+        if aguardar is not None:
+            aguardar()
+        colunas = [ticker for ticker in tickers if ticker in self.precos.columns]
+        indice = self.precos.index
+        periodo = (indice >= pd.Timestamp(data_inicial)) & (indice < pd.Timestamp(data_final))
+        return self.precos.loc[periodo, colunas]
+
+# --- Controle de Taxa ---
+
+class LimitadorTaxa:
+    """
+    Garante um intervalo mínimo entre requisições, mesmo com várias threads.
+    """
+    def __init__(self, requisicoes_por_segundo: float):
+        self.intervalo = 1.0 / requisicoes_por_segundo if requisicoes_por_segundo > 0 else 0.0
+        self._proxima_liberacao = 0.0
+        self._trava = threading.Lock()
+
+    def aguardar(self):
+        """Bloqueia a thread atual até que a próxima requisição seja permitida."""
+        with self._trava:
+            agora = time.monotonic()
+            espera = self._proxima_liberacao - agora
+            self._proxima_liberacao = max(agora, self._proxima_liberacao) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+# --- Motor de Coleta ---
+
+def ticker_para_api(ticker: str) -> str:
+    """
+    Converte o ticker salvo no banco para o formato do Yahoo Finance.
+    Ativos da B3 precisam do sufixo ".SA"; o Ibovespa ('^BVSP') é uma exceção.
+    """
+    if ticker.endswith(".SA") or ticker == '^BVSP':
+        return ticker
+    return f"{ticker}.SA"
+
+class ColetorHistorico:
+    """
+    Baixa cotações de vários tickers agrupando-os em lotes que são executados
+    em paralelo por um pool de threads limitado, respeitando um limite de taxa.
+    O lote é a unidade de trabalho de cada thread: os tickers dele são baixados
+    em sequência, e o limite de taxa vale para cada requisição feita pela fonte.
+    """
+    def __init__(
+        self,
+        fonte: FonteCotacoes | None = None,
+        tamanho_lote: int = 10,
+        max_threads: int = 4,
+        requisicoes_por_segundo: float = 2.0,
+    ):
+        self.fonte = fonte if fonte is not None else YahooFinanceFonte()
+        self.tamanho_lote = tamanho_lote
+        self.max_threads = max_threads
+        self.limitador = LimitadorTaxa(requisicoes_por_segundo)
+
+    def _baixar_lote(self, tickers_api: List[str], data_inicial: str, data_final: str) -> pd.DataFrame:
+        # O limitador é chamado pela fonte antes de cada requisição HTTP
+        return self.fonte.baixar(tickers_api, data_inicial, data_final, aguardar=self.limitador.aguardar)
+
+    def coletar(self, tickers: Sequence[str], data_inicial: str, data_final: str) -> List[Dict]:
+        """
+        Coleta os fechamentos dos tickers no intervalo [data_inicial, data_final).
+        Retorna uma lista de dicionários no formato de `importar_dados_historicos`:
+        [{'ticker': 'PETR4', 'data': '2025-07-10', 'preco_fechamento': 38.5}]
+        """
+        return self._coletar_por_inicio({data_inicial: list(tickers)}, data_final)
+
+    def coletar_incremental(
+        self,
+        tickers: Sequence[str],
+        ultimas_datas: Dict[str, datetime.date],
+        data_inicial_padrao: datetime.date,
+        data_final: datetime.date,
+    ) -> List[Dict]:
+        """
+        Coleta apenas os dias que ainda faltam no banco para cada ticker.
+        'ultimas_datas' é a marca d'água {ticker: data mais recente gravada}.
+        Tickers sem histórico são buscados desde 'data_inicial_padrao' e tickers
+        que já estão em dia (sem dia útil desde a última cotação) são ignorados.
+        """
+        # 1. Agrupa os tickers pela data de início, para que cada lote tenha um único intervalo
+        tickers_por_inicio: Dict[str, List[str]] = {}
+        em_dia = []
+        for ticker in tickers:
+            ultima_data = ultimas_datas.get(ticker)
+            inicio = ultima_data + datetime.timedelta(days=1) if ultima_data else data_inicial_padrao
+            if np.busday_count(inicio, data_final) <= 0:
+                em_dia.append(ticker)
+                continue
+            tickers_por_inicio.setdefault(inicio.strftime('%Y-%m-%d'), []).append(ticker)
+
+        if em_dia:
+            print(f"  - {len(em_dia)} tickers já estão atualizados e serão ignorados.")
+        if not tickers_por_inicio:
+            return []
+
+        # 2. Coleta os grupos normalmente
+        return self._coletar_por_inicio(tickers_por_inicio, data_final.strftime('%Y-%m-%d'))
+
+    def _coletar_por_inicio(self, tickers_por_inicio: Dict[str, List[str]], data_final: str) -> List[Dict]:
+        # 1. Mapeia o ticker da API de volta para o ticker original (ex: 'CXSE3.SA' -> 'CXSE3')
+        ticker_original = {}
+        lotes = []
+        for data_inicial, tickers in tickers_por_inicio.items():
+            tickers_api = [ticker_para_api(ticker) for ticker in tickers]
+            ticker_original.update(zip(tickers_api, tickers))
+            lotes.extend(
+                (tickers_api[i:i + self.tamanho_lote], data_inicial)
+                for i in range(0, len(tickers_api), self.tamanho_lote)
+            )
+
+        # 2. Dispara os lotes em paralelo
+        resultados = []
+        with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
+            futuros = {
+                executor.submit(self._baixar_lote, lote, data_inicial, data_final): lote
+                for lote, data_inicial in lotes
+            }
+            for futuro in as_completed(futuros):
+                lote = futuros[futuro]
+                try:
+                    dados = futuro.result()
+                except (ErroColeta, OSError) as e:
+                    print(f"    ❌ Erro ao coletar o lote {lote}: {e}")
+                    continue
+
+                sem_dados = [t for t in lote if t not in dados.columns or dados[t].isna().all()]
+                for ticker_api in sem_dados:
+                    print(f"    ⚠️ Nenhum dado retornado para {ticker_api}.")
+                if not dados.empty:
+                    resultados.append(dados)
+                print(f"  - Lote com {len(lote)} tickers concluído.")
+
+        if not resultados:
+            return []
+
+        # 3. Monta o resultado com operações vetorizadas: formato largo -> formato longo
+        precos = pd.concat(resultados, axis=1).rename(columns=ticker_original)
+        precos.index.name = 'data'
+        longo = precos.reset_index().melt(id_vars='data', var_name='ticker', value_name='preco_fechamento')
+        longo = longo.dropna(subset=['preco_fechamento'])
+        longo['data'] = pd.to_datetime(longo['data']).dt.strftime('%Y-%m-%d')
+        return longo[['ticker', 'data', 'preco_fechamento']].to_dict('records')
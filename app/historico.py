@@ -0,0 +1,185 @@
+# historico.py
+
+import time
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Dias corridos em um ano, para anualizar retornos
+DIAS_ANO = 365.25
+
+# --- Estruturas de Dados ---
+
+@dataclass
+class HistoricoCarteira:
+    """
+    Evolução diária da carteira. Vetores e matrizes seguem o eixo 'datas';
+    as colunas de 'posicoes' seguem 'tickers'.
+
+    'fluxos' é o dinheiro que entrou (compras, positivo) ou saiu (vendas,
+    negativo) da carteira em cada dia. As posições anteriores à primeira data
+    entram como um aporte inicial igual ao seu valor de mercado nessa data.
+    """
+    datas: np.ndarray
+    tickers: List[str]
+    posicoes: np.ndarray
+    valores: np.ndarray
+    fluxos: np.ndarray
+    retornos_diarios: np.ndarray
+    retorno_tempo: float
+    retorno_tempo_anual: float
+    retorno_dinheiro_anual: float
+    tempo_ms: float
+
+    @property
+    def total_aportado(self) -> float:
+        return float(self.fluxos.sum())
+
+    def como_dataframe(self) -> pd.DataFrame:
+        """Série diária com valor, fluxo, retorno do dia e retorno acumulado (TWR)."""
+        return pd.DataFrame(
+            {
+                "valor": self.valores,
+                "fluxo": self.fluxos,
+                "retorno_diario": self.retornos_diarios,
+                "retorno_acumulado": np.cumprod(1 + self.retornos_diarios) - 1,
+            },
+            index=pd.DatetimeIndex(self.datas, name='data'),
+        )
+
+# --- Funções Auxiliares ---
+
+def _preencher_adiante(precos: np.ndarray) -> np.ndarray:
+    """Repete o último preço conhecido de cada coluna nos dias sem cotação (sem laços)."""
+    conhecidos = ~np.isnan(precos)
+    linha_valida = np.where(conhecidos, np.arange(len(precos))[:, None], 0)
+    np.maximum.accumulate(linha_valida, axis=0, out=linha_valida)
+    preenchidos = precos[linha_valida, np.arange(precos.shape[1])]
+    # Antes da primeira cotação de um ticker não há preço: vale zero
+    return np.nan_to_num(preenchidos, nan=0.0)
+
+def _taxa_interna_retorno(anos: np.ndarray, fluxos: np.ndarray, valor_final: float, max_iteracoes: int = 100) -> float:
+    """
+    Taxa anual 'r' que zera o valor presente da carteira vista pelo investidor:
+        soma(fluxo_i / (1 + r)^anos_i) = valor_final / (1 + r)^anos_final
+    'anos' traz o momento de cada fluxo (em anos desde o primeiro) e o último
+    elemento é o momento do valor final. Newton no log da taxa, com bissecção
+    de segurança; cada iteração é uma única operação vetorizada.
+    """
+    if len(fluxos) == 0 or anos[-1] <= 0:
+        return float('nan')
+    caixa = np.append(fluxos, -valor_final)
+
+    def vpl(log_taxa: float) -> Tuple[float, float]:
+        desconto = np.exp(-anos * log_taxa)
+        return float(caixa @ desconto), float(-(caixa * anos) @ desconto)
+
+    # Intervalo em que o VPL troca de sinal: taxas anuais de -99.99% a +10000%
+    baixo, alto = np.log(1e-4), np.log(101.0)
+    vpl_baixo, vpl_alto = vpl(baixo)[0], vpl(alto)[0]
+    if np.sign(vpl_baixo) == np.sign(vpl_alto):
+        return float('nan')
+
+    log_taxa = 0.0
+    for _ in range(max_iteracoes):
+        valor, derivada = vpl(log_taxa)
+        if abs(valor) < 1e-9 * max(1.0, np.abs(caixa).max()):
+            break
+        if np.sign(valor) == np.sign(vpl_baixo):
+            baixo = log_taxa
+        else:
+            alto = log_taxa
+        passo = log_taxa - valor / derivada if derivada != 0 else np.nan
+        log_taxa = passo if baixo < passo < alto else (baixo + alto) / 2
+    return float(np.exp(log_taxa) - 1)
+
+# --- Motor de Histórico ---
+
+def calcular_historico(
+    movimentos: Sequence[Tuple[str, str, float, float]],
+    precos: pd.DataFrame,
+) -> HistoricoCarteira | None:
+    """
+    Calcula o valor diário da carteira e os seus retornos.
+
+    'movimentos' são tuplas (ticker, 'AAAA-MM-DD', quantidade, valor) com sinal
+    (ver `TransacaoRepository.find_movimentos`) e 'precos' a matriz de
+    fechamentos datas x tickers. Tudo é feito com operações sobre matrizes:
+      1. cada movimento cai no primeiro pregão na data ou depois dela;
+      2. as posições são a soma acumulada das variações de quantidade;
+      3. valor = soma(posições x preços), com preços repetidos nos dias sem cotação;
+      4. retorno do dia (TWR) = valor / (valor anterior + fluxo do dia) - 1;
+      5. retorno ponderado pelo dinheiro (MWR) = taxa interna de retorno dos fluxos.
+    Movimentos de tickers sem cotação ou posteriores à última data são ignorados.
+    """
+    inicio = time.perf_counter()
+    if not movimentos or precos.empty:
+        return None
+
+    # 1. Colunas dos movimentos e alinhamento com as colunas e datas da matriz
+    coluna_tickers, coluna_datas, quantidades, valores_movimento = zip(*movimentos)
+    posicao_ticker, tickers = pd.factorize(np.char.upper(np.asarray(coluna_tickers, dtype=str)), sort=True)
+    colunas = precos.columns.get_indexer(tickers)
+    datas = precos.index.values.astype('datetime64[D]')
+    datas_movimento = np.asarray(coluna_datas, dtype='datetime64[D]')
+    linha = np.searchsorted(datas, datas_movimento, side='left')
+
+    quantidades = np.asarray(quantidades, dtype=float)
+    valores_movimento = np.asarray(valores_movimento, dtype=float)
+    considerados = (colunas[posicao_ticker] >= 0) & (linha < len(datas))
+    anteriores = considerados & (datas_movimento < datas[0])
+
+    # 2. Matriz de posições: variações espalhadas por (dia, ticker) e acumuladas
+    matriz_precos = _preencher_adiante(precos.to_numpy(dtype=float)[:, colunas[colunas >= 0]])
+    indice_coluna = np.cumsum(colunas >= 0) - 1
+    variacoes = np.zeros(matriz_precos.shape)
+    np.add.at(
+        variacoes,
+        (linha[considerados], indice_coluna[posicao_ticker[considerados]]),
+        quantidades[considerados],
+    )
+    posicoes = np.cumsum(variacoes, axis=0)
+
+    # 3. Valor diário da carteira
+    valores = np.einsum('ij,ij->i', posicoes, matriz_precos)
+
+    # 4. Fluxos: movimentos do período pelo valor negociado; posições anteriores
+    #    ao período entram no primeiro dia pelo seu valor de mercado
+    no_periodo = considerados & ~anteriores
+    fluxos = np.bincount(linha[no_periodo], weights=valores_movimento[no_periodo], minlength=len(datas))
+    posicao_inicial = np.bincount(
+        indice_coluna[posicao_ticker[anteriores]], weights=quantidades[anteriores], minlength=matriz_precos.shape[1]
+    )
+    fluxos[0] += posicao_inicial @ matriz_precos[0]
+
+    # 5. Retornos diários ponderados pelo tempo (fluxos no início do dia)
+    base = np.concatenate(([0.0], valores[:-1])) + fluxos
+    retornos = np.divide(valores, base, out=np.ones_like(valores), where=base > 1e-9) - 1
+    retorno_tempo = float(np.prod(1 + retornos) - 1)
+
+    # Período a partir do primeiro dia com dinheiro na carteira
+    com_fluxo = np.flatnonzero(fluxos)
+    if len(com_fluxo) == 0:
+        return None
+    dias = (datas - datas[com_fluxo[0]]).astype(float)
+    anos_periodo = dias[-1] / DIAS_ANO
+    retorno_tempo_anual = (1 + retorno_tempo) ** (1 / anos_periodo) - 1 if anos_periodo > 0 else float('nan')
+
+    # 6. Retorno ponderado pelo dinheiro (taxa interna de retorno)
+    anos = np.append(dias[com_fluxo], dias[-1]) / DIAS_ANO
+    retorno_dinheiro_anual = _taxa_interna_retorno(anos, fluxos[com_fluxo], float(valores[-1]))
+
+    return HistoricoCarteira(
+        datas=datas,
+        tickers=[str(ticker) for ticker in tickers[colunas >= 0]],
+        posicoes=posicoes,
+        valores=valores,
+        fluxos=fluxos,
+        retornos_diarios=retornos,
+        retorno_tempo=retorno_tempo,
+        retorno_tempo_anual=float(retorno_tempo_anual),
+        retorno_dinheiro_anual=retorno_dinheiro_anual,
+        tempo_ms=(time.perf_counter() - inicio) * 1000,
+    )
@@ -0,0 +1,184 @@
+# migracoes.py
+
+import sqlite3
+from typing import Callable, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+
+from .models import CARTEIRA_PADRAO, ESCALA_PRECO, Base, PrecoDiario, TickerPreco
+
+# --- Perfil de Conexão do SQLite ---
+
+# PRAGMAs aplicados a cada nova conexão SQLite. O WAL deixa leitores e o
+# escritor trabalharem em paralelo e, com ele, synchronous=NORMAL continua
+# seguro contra corrupção (só o último commit pode se perder numa queda de
+# energia). O mmap e o cache maiores evitam cópias e leituras repetidas das
+# páginas quentes; as tabelas temporárias (ORDER BY, GROUP BY) ficam em memória.
+PRAGMAS_CONEXAO = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", str(256 * 1024 * 1024)),
+    ("cache_size", str(-64 * 1024)),  # negativo = KiB, ou seja, 64 MiB
+    ("temp_store", "MEMORY"),
+)
+
+@event.listens_for(Engine, "connect")
+def configurar_conexao_sqlite(conexao_dbapi, registro_conexao):
+    """Aplica PRAGMAS_CONEXAO a toda conexão SQLite aberta por qualquer engine."""
+    if not isinstance(conexao_dbapi, sqlite3.Connection):
+        return
+    cursor = conexao_dbapi.cursor()
+    for nome, valor in PRAGMAS_CONEXAO:
+        cursor.execute(f"PRAGMA {nome} = {valor}")
+    cursor.close()
+
+# --- Migrações ---
+# Cada migração recebe a conexão e deve ser idempotente: bancos antigos podem
+# já ter parte das mudanças (criadas pelas versões anteriores do código).
+
+def _criar_tabelas(conexao: Connection):
+    """Cria as tabelas que ainda não existem (bancos novos ou anteriores a elas)."""
+    Base.metadata.create_all(conexao)
+
+def _atribuir_carteiras(conexao: Connection):
+    """
+    Bancos gerados antes das carteiras: acrescenta 'carteira_id' em 'transacoes'
+    e atribui as transações sem carteira à carteira padrão.
+    """
+    colunas = {linha[1] for linha in conexao.exec_driver_sql("PRAGMA table_info(transacoes)")}
+    if 'carteira_id' not in colunas:
+        conexao.exec_driver_sql("ALTER TABLE transacoes ADD COLUMN carteira_id INTEGER REFERENCES carteiras(id)")
+    conexao.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_transacoes_carteira_id ON transacoes (carteira_id)")
+    conexao.exec_driver_sql("INSERT OR IGNORE INTO carteiras (nome) VALUES (?)", (CARTEIRA_PADRAO,))
+    conexao.exec_driver_sql(
+        "UPDATE transacoes SET carteira_id = (SELECT id FROM carteiras WHERE nome = ?) WHERE carteira_id IS NULL",
+        (CARTEIRA_PADRAO,),
+    )
+
+def _indices_de_desempenho(conexao: Connection):
+    """
+    Índices de cobertura: a cotação mais recente e as janelas de preços de um
+    ticker são lidas só do índice, sem visitar a tabela; o mesmo vale para a
+    checagem de duplicatas da importação. O índice só de 'ticker' fica
+    redundante (é prefixo do novo) e é removido. ANALYZE atualiza as
+    estatísticas usadas pelo planejador de consultas.
+    """
+    conexao.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_dados_historicos_ticker_data_preco "
+        "ON dados_historicos (ticker, data DESC, preco_fechamento)"
+    )
+    conexao.exec_driver_sql("DROP INDEX IF EXISTS ix_dados_historicos_ticker")
+    conexao.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_transacoes_chave_duplicidade "
+        "ON transacoes (ativo_id, data, carteira_id, tipo_operacao, quantidade, preco_unitario)"
+    )
+    conexao.exec_driver_sql("ANALYZE")
+
+# Visão com as colunas da antiga tabela 'dados_historicos', para as leituras
+# que ainda usam o modelo `DadoHistorico`
+SQL_VISAO_DADOS_HISTORICOS = (
+    "SELECT p.ticker_id * 100000 + p.dia AS id, t.ticker AS ticker, "
+    f"date(p.dia * 86400, 'unixepoch') AS data, p.fechamento / {float(ESCALA_PRECO)!r} AS preco_fechamento "
+    "FROM precos_diarios p JOIN tickers_precos t ON t.id = p.ticker_id"
+)
+
+def _atualizar_totais_tickers(conexao: Connection):
+    conexao.exec_driver_sql(
+        "UPDATE tickers_precos SET "
+        "n_cotacoes = (SELECT COUNT(*) FROM precos_diarios p WHERE p.ticker_id = tickers_precos.id), "
+        "ultimo_dia = (SELECT MAX(dia) FROM precos_diarios p WHERE p.ticker_id = tickers_precos.id)"
+    )
+
+def _precos_compactos(conexao: Connection):
+    """
+    Troca a tabela 'dados_historicos' (ticker em texto, data completa, id e
+    índices por linha) pelo formato compacto: dicionário de tickers e
+    cotações WITHOUT ROWID por (ticker_id, dia), com o fechamento inteiro na
+    escala de ESCALA_PRECO. A antiga tabela vira uma visão com as mesmas colunas.
+    Linhas sem preço positivo não têm como ser gravadas e ficam de fora; a
+    tabela antiga só é removida depois de conferir que todas as demais foram
+    copiadas com o mesmo valor (senão a migração falha e nada é alterado).
+    """
+    Base.metadata.create_all(conexao, tables=[TickerPreco.__table__, PrecoDiario.__table__])
+    tipo = conexao.exec_driver_sql("SELECT type FROM sqlite_master WHERE name = 'dados_historicos'").scalar()
+    if tipo == 'table':
+        # 1. Copia as cotações válidas para o formato compacto
+        fechamento = f"CAST(ROUND(d.preco_fechamento * {ESCALA_PRECO}) AS INTEGER)"
+        conexao.exec_driver_sql("INSERT OR IGNORE INTO tickers_precos (ticker, n_cotacoes) SELECT DISTINCT ticker, 0 FROM dados_historicos")
+        conexao.exec_driver_sql(
+            "INSERT OR REPLACE INTO precos_diarios (ticker_id, dia, fechamento) "
+            f"SELECT t.id, CAST(julianday(d.data) - 2440587.5 AS INTEGER), {fechamento} "
+            f"FROM dados_historicos d JOIN tickers_precos t ON t.ticker = d.ticker WHERE {fechamento} > 0"
+        )
+
+        # 2. Confere contagem e valores antes de apagar o original
+        validas = conexao.exec_driver_sql(f"SELECT COUNT(*) FROM dados_historicos d WHERE {fechamento} > 0").scalar()
+        copiadas = conexao.exec_driver_sql("SELECT COUNT(*) FROM precos_diarios").scalar()
+        conferidas = conexao.exec_driver_sql(
+            "SELECT COUNT(*) FROM dados_historicos d "
+            "JOIN tickers_precos t ON t.ticker = d.ticker "
+            "JOIN precos_diarios p ON p.ticker_id = t.id AND p.dia = CAST(julianday(d.data) - 2440587.5 AS INTEGER) "
+            f"WHERE p.fechamento = {fechamento}"
+        ).scalar()
+        if not validas == copiadas == conferidas:
+            raise RuntimeError(
+                f"Conversão das cotações não confere ({validas} válidas, {copiadas} copiadas, "
+                f"{conferidas} com o mesmo valor); 'dados_historicos' foi mantida."
+            )
+        conexao.exec_driver_sql("DROP TABLE dados_historicos")
+    _atualizar_totais_tickers(conexao)
+    conexao.exec_driver_sql(f"CREATE VIEW IF NOT EXISTS dados_historicos AS {SQL_VISAO_DADOS_HISTORICOS}")
+    conexao.exec_driver_sql("ANALYZE")
+
+def _fechamento_em_alta_precisao(conexao: Connection):
+    """
+    A primeira versão do formato compacto guardava o fechamento em centavos,
+    o que zerava cotações abaixo de R$ 0,005. Nesses bancos a coluna passa a
+    'fechamento', na escala de ESCALA_PRECO (a precisão já perdida não volta).
+    """
+    colunas = {linha[1] for linha in conexao.exec_driver_sql("PRAGMA table_info(precos_diarios)")}
+    if 'centavos' not in colunas:
+        return
+    conexao.exec_driver_sql("DROP VIEW IF EXISTS dados_historicos")
+    conexao.exec_driver_sql("ALTER TABLE precos_diarios RENAME COLUMN centavos TO fechamento")
+    # Cotações zeradas pelo arredondamento não são preços: saem da tabela
+    conexao.exec_driver_sql("DELETE FROM precos_diarios WHERE fechamento <= 0")
+    conexao.exec_driver_sql(f"UPDATE precos_diarios SET fechamento = fechamento * {ESCALA_PRECO // 100}")
+    _atualizar_totais_tickers(conexao)
+    conexao.exec_driver_sql(f"CREATE VIEW dados_historicos AS {SQL_VISAO_DADOS_HISTORICOS}")
+
+# Migrações em ordem; a versão do banco (PRAGMA user_version) é o número de
+# migrações já aplicadas. Novas migrações entram sempre no fim da lista.
+MIGRACOES: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("Tabelas do modelo", _criar_tabelas),
+    ("Carteiras nas transações", _atribuir_carteiras),
+    ("Índices de cobertura e ANALYZE", _indices_de_desempenho),
+    ("Cotações no formato compacto", _precos_compactos),
+    ("Fechamento das cotações em alta precisão", _fechamento_em_alta_precisao),
+]
+
+def versao_do_banco(conexao: Connection) -> int:
+    return conexao.exec_driver_sql("PRAGMA user_version").scalar()
+
+def migrar(conexao: Connection) -> List[str]:
+    """
+    Aplica, em ordem, as migrações que o banco ainda não recebeu, gravando a
+    nova versão após cada uma. Retorna a descrição das migrações aplicadas.
+    """
+    aplicadas = []
+    for versao, (descricao, migracao) in enumerate(MIGRACOES, start=1):
+        if versao <= versao_do_banco(conexao):
+            continue
+        migracao(conexao)
+        conexao.exec_driver_sql(f"PRAGMA user_version = {versao}")
+        aplicadas.append(descricao)
+    return aplicadas
+
+def compactar(engine: Engine):
+    """
+    Reescreve o arquivo do banco sem as páginas liberadas pelas migrações
+    (VACUUM). Precisa de uma conexão fora de transação.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conexao:
+        conexao.exec_driver_sql("VACUUM")
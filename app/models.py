@@ -2,6 +2,7 @@
 
 import os
 import datetime
+import math
 import enum  # Usaremos enums para padronizar os tipos
 from typing import List
 from sqlalchemy import (
@@ -10,9 +11,8 @@ from sqlalchemy import (
     Float,
     Date,
     Enum,
-    UniqueConstraint
 )
-from sqlalchemy import create_engine, ForeignKey, String, Float, Date, Enum, UniqueConstraint
+from sqlalchemy import create_engine, ForeignKey, String, Float, Date, Enum, Index, Integer
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 # --- Classes de Enumeração ---
@@ -30,6 +30,37 @@ class TipoOperacao(enum.Enum):
     COMPRA = "Compra"
     VENDA = "Venda"
 
+# Carteira que recebe as transações quando nenhuma é informada (e as de bancos antigos)
+CARTEIRA_PADRAO = "Principal"
+
+# --- Formato Compacto das Cotações ---
+# As cotações guardam o dia como número de dias desde 1970-01-01 e o
+# fechamento como inteiro, em unidades de 1/ESCALA_PRECO real (ver `PrecoDiario`).
+# Centavos não bastam: criptomoedas cotadas abaixo de R$ 0,005 virariam zero.
+# Com 10⁻⁸ real, uma cotação de R$ 0,0001 ainda tem 5 algarismos significativos.
+ESCALA_PRECO = 100_000_000
+ORDINAL_DIA_ZERO = datetime.date(1970, 1, 1).toordinal()
+
+def numero_do_dia(data: datetime.date | str) -> int:
+    """Converte uma data (ou texto 'AAAA-MM-DD') no número do dia."""
+    if isinstance(data, str):
+        data = datetime.date.fromisoformat(data)
+    return data.toordinal() - ORDINAL_DIA_ZERO
+
+def data_do_numero(numero: int) -> datetime.date:
+    return datetime.date.fromordinal(numero + ORDINAL_DIA_ZERO)
+
+def preco_para_inteiro(preco: float) -> int | None:
+    """
+    Converte um fechamento em reais para a escala inteira de ESCALA_PRECO.
+    Retorna None quando o preço não pode ser gravado (não finito, ou que
+    arredonda para zero ou menos), para que a linha seja rejeitada.
+    """
+    if not math.isfinite(preco):
+        return None
+    inteiro = round(preco * ESCALA_PRECO)
+    return inteiro if inteiro > 0 else None
+
 # --- Modelos do Banco de Dados ---
 
 # Classe base para nossos modelos, como definido pelo SQLAlchemy
@@ -61,15 +92,39 @@ class Ativo(Base):
     def __repr__(self) -> str:
         return f"Ativo(ticker='{self.ticker}', nome='{self.nome}', tipo='{self.tipo.value}')"
 
+class Carteira(Base):
+    """
+    Representa uma carteira (conta de um cliente). Cada transação pertence a
+    uma carteira; os ativos e as cotações são compartilhados entre todas.
+    """
+    __tablename__ = "carteiras"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    nome: Mapped[str] = mapped_column(String(100), unique=True, index=True)
+
+    transacoes: Mapped[List["Transacao"]] = relationship(back_populates="carteira")
+
+    def __repr__(self) -> str:
+        return f"Carteira(nome='{self.nome}')"
+
 class Transacao(Base):
     """
     Representa uma operação de compra ou venda de um ativo.
     """
     __tablename__ = "transacoes"
 
+    # Índice de cobertura da checagem de duplicatas na importação (ativo e
+    # intervalo de datas), que assim não precisa ler a tabela.
+    __table_args__ = (
+        Index('ix_transacoes_chave_duplicidade', 'ativo_id', 'data', 'carteira_id', 'tipo_operacao', 'quantidade', 'preco_unitario'),
+    )
+
     id: Mapped[int] = mapped_column(primary_key=True)
     # `ForeignKey` cria o link entre a Transacao e o Ativo. Uma transação DEVE pertencer a um ativo.
     ativo_id: Mapped[int] = mapped_column(ForeignKey("ativos.id"), nullable=False)
+    # Carteira dona da transação. Bancos antigos recebem a coluna depois (ver
+    # `app.migracoes`), por isso ela aceita nulos.
+    carteira_id: Mapped[int | None] = mapped_column(ForeignKey("carteiras.id"), nullable=True, index=True)
     data: Mapped[datetime.date] = mapped_column(Date)
     tipo_operacao: Mapped[TipoOperacao] = mapped_column(Enum(TipoOperacao))
     # Usamos Float para quantidade e preço para suportar ativos fracionários.
@@ -78,30 +133,101 @@ class Transacao(Base):
 
     # Relacionamento reverso: permite acessar o objeto Ativo a partir de uma Transacao. Ex: minha_transacao.ativo
     ativo: Mapped["Ativo"] = relationship(back_populates="transacoes")
+    carteira: Mapped["Carteira | None"] = relationship(back_populates="transacoes")
 
     def __repr__(self) -> str:
         return f"Transacao(ativo='{self.ativo.ticker}', data='{self.data}', tipo='{self.tipo_operacao.value}', qtd={self.quantidade})"
 
-class DadoHistorico(Base):
+class TickerPreco(Base):
     """
-    Armazena os dados de cotação diária para ativos e índices (IBOV, XFIX11).
-    Essencial para calcular volatilidade e performance.
+    Dicionário dos tickers com cotações: cada ticker é guardado uma única vez
+    e as cotações o referenciam pelo id. Também mantém o número de cotações e
+    o último dia de cada ticker, atualizados a cada gravação, para que a versão
+    dos dados e as últimas datas sejam lidas sem percorrer as cotações.
     """
-    __tablename__ = "dados_historicos"
-    
-    # Adicionamos uma restrição para garantir que não teremos duas entradas para o mesmo
-    # ticker no mesmo dia. Isso mantém a integridade dos nossos dados.
-    __table_args__ = (UniqueConstraint('ticker', 'data', name='uix_ticker_data'),)
+    __tablename__ = "tickers_precos"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     # O ticker aqui pode ser de um ativo da nossa carteira (ex: "PETR4")
     # ou de um índice (ex: "IBOV"). Por isso não usamos ForeignKey.
-    ticker: Mapped[str] = mapped_column(String(20), index=True)
-    data: Mapped[datetime.date] = mapped_column(Date, index=True)
+    ticker: Mapped[str] = mapped_column(String(20), unique=True)
+    n_cotacoes: Mapped[int] = mapped_column(Integer, default=0)
+    ultimo_dia: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"TickerPreco(ticker='{self.ticker}', n_cotacoes={self.n_cotacoes})"
+
+class PrecoDiario(Base):
+    """
+    Cotação diária no formato compacto: tabela WITHOUT ROWID cuja chave
+    primária (ticker_id, dia) é a própria ordem física das linhas, com o
+    fechamento inteiro na escala de ESCALA_PRECO. Sem id, sem texto repetido e sem índices
+    extras, as janelas de preços de um ticker são uma leitura contígua.
+    """
+    __tablename__ = "precos_diarios"
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    ticker_id: Mapped[int] = mapped_column(ForeignKey("tickers_precos.id"), primary_key=True)
+    # Dias desde 1970-01-01 (ver `numero_do_dia`)
+    dia: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # Fechamento em unidades de 1/ESCALA_PRECO real (ver `preco_para_inteiro`)
+    fechamento: Mapped[int] = mapped_column(Integer)
+
+    def __repr__(self) -> str:
+        return f"PrecoDiario(ticker_id={self.ticker_id}, data='{data_do_numero(self.dia)}', preco={self.fechamento / ESCALA_PRECO})"
+
+class DadoHistorico(Base):
+    """
+    Cotação diária de ativos e índices (IBOV, XFIX11), essencial para calcular
+    volatilidade e performance. Em bancos migrados, 'dados_historicos' é uma
+    visão somente leitura sobre `PrecoDiario` e `TickerPreco` (ver
+    `app.migracoes`); as gravações vão direto para a tabela compacta.
+    """
+    __tablename__ = "dados_historicos"
+
+    # Na visão, o id é derivado da chave compacta (ticker_id * 100000 + dia)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    ticker: Mapped[str] = mapped_column(String(20))
+    data: Mapped[datetime.date] = mapped_column(Date)
     preco_fechamento: Mapped[float] = mapped_column(Float)
 
     def __repr__(self) -> str:
         return f"DadoHistorico(ticker='{self.ticker}', data='{self.data}', preco='{self.preco_fechamento}')"
+
+class EstadoVolatilidade(Base):
+    """
+    Guarda os momentos acumulados dos retornos diários de um ticker dentro da
+    janela de volatilidade (contagem, média e M2, como no algoritmo de Welford).
+    Com eles a volatilidade é lida em O(1), sem reprocessar todo o histórico.
+    """
+    __tablename__ = "estado_volatilidade"
+
+    ticker: Mapped[str] = mapped_column(String(20), primary_key=True)
+    # Primeira cotação da janela: o primeiro retorno considerado começa nela.
+    inicio_janela: Mapped[datetime.date] = mapped_column(Date)
+    # Última cotação já incorporada e o seu preço, base do próximo retorno.
+    ultima_data: Mapped[datetime.date] = mapped_column(Date)
+    ultimo_preco: Mapped[float] = mapped_column(Float)
+    n_retornos: Mapped[int] = mapped_column(Integer)
+    media: Mapped[float] = mapped_column(Float)
+    m2: Mapped[float] = mapped_column(Float)
+
+    def __repr__(self) -> str:
+        return f"EstadoVolatilidade(ticker='{self.ticker}', n={self.n_retornos}, ultima_data='{self.ultima_data}')"
+
+class MarcadorDados(Base):
+    """
+    Contador de escritas por tabela, incrementado uma vez a cada importação.
+    Junto com contagens e máximos, permite saber se os dados mudaram, inclusive
+    quando linhas existentes foram apenas atualizadas.
+    """
+    __tablename__ = "marcadores_dados"
+
+    tabela: Mapped[str] = mapped_column(String(50), primary_key=True)
+    versao: Mapped[int] = mapped_column(Integer, default=0)
+
+    def __repr__(self) -> str:
+        return f"MarcadorDados(tabela='{self.tabela}', versao={self.versao})"
     
 
 # --- FUNÇÃO DE SETUP CENTRALIZADA ---
@@ -110,13 +236,25 @@ def setup_inicial_se_necessario():
     Verifica se o banco de dados existe. Se não existir, cria a estrutura
     inicial. Esta função agora é a única fonte da verdade para o setup.
     Retorna True se o banco já existia, False se foi criado agora.
+    Em ambos os casos, aplica as migrações pendentes (ver `app.migracoes`).
     """
+    from .migracoes import compactar, migrar
+
     DATA_DIR = "data"
     DB_FILE = f"{DATA_DIR}/portfolio.db"
     DB_URL = f"sqlite:///{DB_FILE}"
     
     if os.path.exists(DB_FILE):
-        return True # Banco já existe, pode continuar
+        # Banco já existe: só traz o esquema para a versão atual
+        engine = create_engine(DB_URL)
+        with engine.begin() as conexao:
+            aplicadas = migrar(conexao)
+        for descricao in aplicadas:
+            print(f"🔧 Migração aplicada: {descricao}")
+        if aplicadas:
+            # Devolve ao sistema o espaço liberado (ex: tabelas convertidas)
+            compactar(engine)
+        return True
 
     print(f"O banco de dados '{DB_FILE}' não foi encontrado.")
     print("Criando estrutura inicial do banco de dados...")
@@ -124,8 +262,9 @@ def setup_inicial_se_necessario():
     os.makedirs(DATA_DIR, exist_ok=True)
     engine = create_engine(DB_URL)
     
-    # Usa a 'Base' deste mesmo arquivo para criar as tabelas
-    Base.metadata.create_all(engine)
+    # As migrações criam as tabelas (da 'Base' deste arquivo), os índices e a versão
+    with engine.begin() as conexao:
+        migrar(conexao)
     
     print("✅ Banco de dados criado com sucesso!")
     return False # Banco foi criado agora
\ No newline at end of file
@@ -0,0 +1,192 @@
+# monte_carlo.py
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from .backtest import MatrizCompartilhada
+
+METODOS = ("bootstrap", "normal")
+
+# Memória máxima (em MB) de retornos simulados gerados de uma vez por lote
+LIMITE_MEMORIA_MB = 128
+
+# --- Estruturas de Dados ---
+
+@dataclass
+class ResultadoMonteCarlo:
+    """
+    Projeção do valor da carteira. 'bandas' tem uma linha por percentil de
+    'percentis' e uma coluna por dia de 'dias'. VaR e CVaR são perdas em R$
+    no fim do horizonte, por nível de confiança.
+    """
+    metodo: str
+    valor_inicial: float
+    horizonte_dias: int
+    n_caminhos: int
+    dias: np.ndarray
+    percentis: Tuple[float, ...]
+    bandas: np.ndarray
+    var: Dict[float, float]
+    cvar: Dict[float, float]
+    valores_finais: np.ndarray
+    n_lotes: int
+    processos: int
+    tempo_ms: float
+
+    @property
+    def caminhos_por_segundo(self) -> float:
+        return self.n_caminhos / (self.tempo_ms / 1000) if self.tempo_ms > 0 else float('inf')
+
+# --- Geração dos Caminhos ---
+
+def _raiz_covariancia(retornos: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Média e uma raiz da covariância (por autovalores, tolera matrizes singulares)."""
+    media = retornos.mean(axis=0)
+    covariancia = np.atleast_2d(np.cov(retornos, rowvar=False))
+    autovalores, autovetores = np.linalg.eigh(covariancia)
+    return media, autovetores * np.sqrt(np.maximum(autovalores, 0.0))
+
+def _simular_lote(
+    retornos: np.ndarray,
+    valores: np.ndarray,
+    n_caminhos: int,
+    horizonte: int,
+    dias: np.ndarray,
+    metodo: str,
+    tamanho_bloco: int,
+    semente: np.random.SeedSequence,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Simula 'n_caminhos' caminhos de log-retornos diários (caminhos x dias x ativos)
+    e devolve o valor da carteira nos 'dias' pedidos e no fim do horizonte.
+    A carteira fica parada (sem rebalanceamento) durante o horizonte.
+    """
+    gerador = np.random.default_rng(semente)
+    n_historico = len(retornos)
+
+    if metodo == "bootstrap":
+        # Blocos circulares de dias consecutivos preservam a autocorrelação e
+        # a correlação entre os ativos de cada dia sorteado
+        n_blocos = -(-horizonte // tamanho_bloco)
+        inicios = gerador.integers(0, n_historico, size=(n_caminhos, n_blocos, 1))
+        indices = (inicios + np.arange(tamanho_bloco)).reshape(n_caminhos, -1)[:, :horizonte] % n_historico
+        simulados = retornos[indices]
+    else:
+        media, raiz = _raiz_covariancia(retornos)
+        n_ativos = retornos.shape[1]
+        # Um único produto 2D (caminhos*dias x ativos) aproveita melhor o BLAS
+        simulados = (gerador.standard_normal((n_caminhos * horizonte, n_ativos)) @ raiz.T).reshape(n_caminhos, horizonte, n_ativos)
+        simulados += media
+
+    # Crescimento acumulado de cada ativo e valor da carteira (sem cópias extras)
+    np.cumsum(simulados, axis=1, out=simulados)
+    np.exp(simulados, out=simulados)
+    carteira = simulados @ valores
+    return carteira[:, dias - 1], carteira[:, -1]
+
+# Estado de cada processo do pool, preenchido por `_iniciar_processo`
+_DADOS_PROCESSO: Dict = {}
+
+def _iniciar_processo(descritor, valores, parametros):
+    nome, formato = descritor
+    memoria = shared_memory.SharedMemory(name=nome)
+    retornos = np.ndarray(formato, dtype=np.float64, buffer=memoria.buf)
+    retornos.flags.writeable = False
+    _DADOS_PROCESSO.update(memoria=memoria, retornos=retornos, valores=valores, parametros=parametros)
+
+def _simular_lote_no_processo(tarefa):
+    n_caminhos, semente = tarefa
+    dados = _DADOS_PROCESSO
+    return _simular_lote(dados['retornos'], dados['valores'], n_caminhos, semente=semente, **dados['parametros'])
+
+# --- Motor ---
+
+def simular_monte_carlo(
+    retornos: np.ndarray,
+    valores: np.ndarray,
+    horizonte_dias: int = 252,
+    n_caminhos: int = 10_000,
+    metodo: str = "bootstrap",
+    tamanho_bloco: int = 10,
+    niveis_confianca: Sequence[float] = (0.95, 0.99),
+    percentis: Sequence[float] = (5, 25, 50, 75, 95),
+    n_pontos: int = 20,
+    processos: int | None = 1,
+    semente: int | None = None,
+    limite_memoria_mb: float = LIMITE_MEMORIA_MB,
+) -> ResultadoMonteCarlo:
+    """
+    Projeta o valor da carteira 'horizonte_dias' pregões à frente.
+
+    'retornos' é a matriz de log-retornos diários históricos (dias x ativos,
+    sem NaN) e 'valores' o valor atual de cada posição. Os caminhos vêm de
+    bootstrap em blocos dos dias históricos ou de uma normal multivariada com
+    a média e a covariância históricas.
+
+    Os caminhos são gerados em lotes cujo tamanho respeita 'limite_memoria_mb';
+    cada lote tem a sua semente derivada de 'semente' (SeedSequence.spawn), então
+    o resultado é o mesmo com qualquer número de 'processos'. Com mais de um
+    processo, os retornos históricos ficam na memória compartilhada.
+    """
+    if metodo not in METODOS:
+        raise ValueError(f"Método desconhecido: '{metodo}'. Use um de {METODOS}.")
+    inicio = time.perf_counter()
+    retornos = np.ascontiguousarray(retornos, dtype=float)
+    valores = np.asarray(valores, dtype=float)
+    if len(retornos) < 2 or retornos.shape[1] != len(valores):
+        raise ValueError("Histórico de retornos insuficiente ou desalinhado com as posições.")
+
+    # 1. Dias em que as bandas são medidas e divisão dos caminhos em lotes
+    dias = np.unique(np.linspace(1, horizonte_dias, min(n_pontos, horizonte_dias)).round().astype(int))
+    bytes_por_caminho = horizonte_dias * retornos.shape[1] * 8
+    por_lote = max(1, min(n_caminhos, int(limite_memoria_mb * 2**20 // bytes_por_caminho)))
+    tamanhos = [por_lote] * (n_caminhos // por_lote) + ([n_caminhos % por_lote] if n_caminhos % por_lote else [])
+    sementes = np.random.SeedSequence(semente).spawn(len(tamanhos))
+    parametros = dict(horizonte=horizonte_dias, dias=dias, metodo=metodo, tamanho_bloco=tamanho_bloco)
+
+    # 2. Simula os lotes, em sequência ou em um pool de processos
+    processos = max(1, min(processos or os.cpu_count() or 1, len(tamanhos)))
+    if processos == 1:
+        lotes = [_simular_lote(retornos, valores, n, semente=s, **parametros) for n, s in zip(tamanhos, sementes)]
+    else:
+        with MatrizCompartilhada(retornos) as compartilhada:
+            with ProcessPoolExecutor(
+                max_workers=processos,
+                initializer=_iniciar_processo,
+                initargs=(compartilhada.descritor, valores, parametros),
+            ) as pool:
+                lotes = list(pool.map(_simular_lote_no_processo, zip(tamanhos, sementes)))
+
+    valores_pontos = np.concatenate([pontos for pontos, _ in lotes])
+    valores_finais = np.concatenate([finais for _, finais in lotes])
+
+    # 3. Percentis ao longo do horizonte e risco no fim dele
+    valor_inicial = float(valores.sum())
+    perdas = valor_inicial - valores_finais
+    var, cvar = {}, {}
+    for nivel in niveis_confianca:
+        var[nivel] = float(np.quantile(perdas, nivel))
+        cauda = perdas[perdas >= var[nivel]]
+        cvar[nivel] = float(cauda.mean()) if len(cauda) else var[nivel]
+
+    return ResultadoMonteCarlo(
+        metodo=metodo,
+        valor_inicial=valor_inicial,
+        horizonte_dias=horizonte_dias,
+        n_caminhos=n_caminhos,
+        dias=dias,
+        percentis=tuple(percentis),
+        bandas=np.percentile(valores_pontos, percentis, axis=0),
+        var=var,
+        cvar=cvar,
+        valores_finais=valores_finais,
+        n_lotes=len(tamanhos),
+        processos=processos,
+        tempo_ms=(time.perf_counter() - inicio) * 1000,
+    )
@@ -0,0 +1,258 @@
+# perfil.py
+
+import contextlib
+import functools
+import inspect
+import json
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from db_nexus import BaseRepository
+
+# Chamadas repetidas a partir das quais um trecho com SQL é sinalizado como N+1
+LIMITE_N_MAIS_UM = 10
+
+# --- Estruturas de Dados ---
+
+@dataclass
+class Trecho:
+    """
+    Um trecho medido (uma chamada de método, ou várias chamadas do mesmo método
+    sob o mesmo pai, somadas). Os contadores de SQL são próprios do trecho;
+    os totais com os filhos são calculados em `como_dict`.
+    """
+    nome: str
+    chamadas: int = 0
+    tempo_ms: float = 0.0
+    sql_consultas: int = 0
+    sql_linhas: int = 0
+    sql_ms: float = 0.0
+    memoria_pico_kb: float = 0.0
+    filhos: Dict[str, "Trecho"] = field(default_factory=dict)
+
+    def como_dict(self) -> dict:
+        filhos = [filho.como_dict() for filho in self.filhos.values()]
+        return {
+            "nome": self.nome,
+            "chamadas": self.chamadas,
+            "tempo_ms": self.tempo_ms,
+            "tempo_proprio_ms": self.tempo_ms - sum(filho["tempo_ms"] for filho in filhos),
+            "sql_consultas": self.sql_consultas + sum(filho["sql_consultas"] for filho in filhos),
+            "sql_consultas_proprias": self.sql_consultas,
+            "sql_linhas": self.sql_linhas + sum(filho["sql_linhas"] for filho in filhos),
+            "sql_ms": self.sql_ms + sum(filho["sql_ms"] for filho in filhos),
+            "memoria_pico_kb": self.memoria_pico_kb,
+            "filhos": filhos,
+        }
+
+# --- Perfilador ---
+
+class Perfilador:
+    """
+    Instrumentação opcional: envolve os métodos do PortfolioService e dos seus
+    repositórios em trechos cronometrados e, pelos eventos do SQLAlchemy,
+    conta as consultas SQL, as linhas lidas ou gravadas e o tempo no banco de
+    cada trecho. Com 'memoria', acompanha também o pico de memória alocada
+    (tracemalloc, que é global: com várias threads o pico é aproximado).
+
+    Chamadas repetidas do mesmo método sob o mesmo pai viram um único trecho
+    com o número de chamadas, de modo que laços N+1 aparecem de imediato.
+    """
+    def __init__(self, memoria: bool = True):
+        self.memoria = memoria
+        self.raiz = Trecho("total")
+        self.ativo = False
+        self._local = threading.local()
+        self._trava = threading.Lock()
+        self._instrumentados: set = set()
+        self._inicio = 0.0
+        self._memoria_inicial = 0
+
+    # --- Ciclo de vida ---
+
+    def iniciar(self):
+        event.listen(Engine, "before_cursor_execute", self._antes_sql)
+        event.listen(Engine, "after_cursor_execute", self._depois_sql)
+        if self.memoria and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._memoria_inicial = self._registrar_pico() if self.memoria else 0
+        self.raiz.chamadas = 1
+        self._inicio = time.perf_counter()
+        self.ativo = True
+
+    def parar(self):
+        self.ativo = False
+        self.raiz.tempo_ms += (time.perf_counter() - self._inicio) * 1000
+        event.remove(Engine, "before_cursor_execute", self._antes_sql)
+        event.remove(Engine, "after_cursor_execute", self._depois_sql)
+        if self.memoria and tracemalloc.is_tracing():
+            self._registrar_pico()
+            self.raiz.memoria_pico_kb = (self._local.picos[0] - self._memoria_inicial) / 1024
+            tracemalloc.stop()
+
+    # --- Trechos ---
+
+    def _pilha(self) -> List[Trecho]:
+        if not hasattr(self._local, "pilha"):
+            self._local.pilha = [self.raiz]
+            self._local.picos = [0]
+        return self._local.pilha
+
+    def _registrar_pico(self) -> int:
+        """
+        Repassa o pico de memória desde a última leitura a todas as chamadas
+        abertas da thread, reinicia a contagem e devolve a memória atual.
+        """
+        self._pilha()
+        atual, pico = tracemalloc.get_traced_memory()
+        picos = self._local.picos
+        for i, anterior in enumerate(picos):
+            picos[i] = max(anterior, pico)
+        tracemalloc.reset_peak()
+        return atual
+
+    @contextlib.contextmanager
+    def trecho(self, nome: str):
+        """Mede o bloco como um filho do trecho atual da thread."""
+        if not self.ativo:
+            yield
+            return
+        pilha = self._pilha()
+        with self._trava:
+            atual = pilha[-1].filhos.setdefault(nome, Trecho(nome))
+            atual.chamadas += 1
+        medir_memoria = self.memoria and tracemalloc.is_tracing()
+        if medir_memoria:
+            memoria_inicial = self._registrar_pico()
+            self._local.picos.append(memoria_inicial)
+        pilha.append(atual)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            atual.tempo_ms += (time.perf_counter() - inicio) * 1000
+            pilha.pop()
+            if medir_memoria:
+                self._registrar_pico()
+                pico = self._local.picos.pop() - memoria_inicial
+                atual.memoria_pico_kb = max(atual.memoria_pico_kb, pico / 1024)
+
+    def _envolver(self, nome: str, funcao: Callable) -> Callable:
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            with self.trecho(nome):
+                return funcao(*args, **kwargs)
+        return envoltorio
+
+    def instrumentar(self, objeto: Any):
+        """Envolve todos os métodos (exceto os especiais) de 'objeto' em trechos."""
+        if id(objeto) in self._instrumentados:
+            return
+        self._instrumentados.add(id(objeto))
+        classe = type(objeto).__name__
+        for nome, atributo in inspect.getmembers(type(objeto)):
+            if nome.startswith("__") or not inspect.isfunction(atributo):
+                continue
+            setattr(objeto, nome, self._envolver(f"{classe}.{nome}", getattr(objeto, nome)))
+
+    def instrumentar_servico(self, service: Any):
+        """Instrumenta o serviço, os seus repositórios e o cache de preços, se houver."""
+        self.instrumentar(service)
+        for valor in list(vars(service).values()):
+            if isinstance(valor, BaseRepository) or type(valor).__name__ == "CachePrecos":
+                self.instrumentar(valor)
+
+    # --- Eventos do SQLAlchemy ---
+
+    def _antes_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.ativo:
+            return
+        trecho = self._pilha()[-1]
+        conn.info.setdefault("perfil_inicio_sql", []).append(time.perf_counter())
+        # Cursores do sqlite3 aceitam uma fábrica de linhas: contamos cada linha lida
+        if getattr(cursor, "row_factory", False) is None:
+            def contar_linha(_cursor, linha, trecho=trecho):
+                trecho.sql_linhas += 1
+                return linha
+            cursor.row_factory = contar_linha
+
+    def _depois_sql(self, conn, cursor, statement, parameters, context, executemany):
+        inicios = conn.info.get("perfil_inicio_sql")
+        if not self.ativo or not inicios:
+            return
+        trecho = self._pilha()[-1]
+        trecho.sql_ms += (time.perf_counter() - inicios.pop()) * 1000
+        trecho.sql_consultas += 1
+        # Escritas não devolvem linhas: vale a contagem de linhas afetadas
+        if cursor.description is None and cursor.rowcount > 0:
+            trecho.sql_linhas += cursor.rowcount
+
+    # --- Saída ---
+
+    def como_dict(self) -> dict:
+        return self.raiz.como_dict()
+
+    def salvar_json(self, caminho: str):
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            json.dump(self.como_dict(), arquivo, indent=2, ensure_ascii=False)
+
+    def exibir(self):
+        """Imprime a árvore de trechos, com tempos, SQL e memória."""
+        print("\n--- Perfil de Execução ---")
+        print(f"{'TRECHO':<58} | {'TEMPO (ms)':>10} | {'PRÓPRIO':>9} | {'SQL':>5} | {'LINHAS':>8} | {'SQL (ms)':>9} | {'MEM. (KB)':>10}")
+        print("-" * 126)
+        alertas = []
+
+        def imprimir(no: dict, nivel: int):
+            nome = "  " * nivel + no["nome"] + (f" ×{no['chamadas']}" if no["chamadas"] > 1 else "")
+            print(
+                f"{nome[:58]:<58} | {no['tempo_ms']:>10.1f} | {no['tempo_proprio_ms']:>9.1f} | {no['sql_consultas']:>5} | "
+                f"{no['sql_linhas']:>8} | {no['sql_ms']:>9.1f} | {no['memoria_pico_kb']:>10,.0f}"
+            )
+            if no["chamadas"] >= LIMITE_N_MAIS_UM and no["sql_consultas_proprias"] >= no["chamadas"]:
+                alertas.append(no)
+            for filho in sorted(no["filhos"], key=lambda f: f["tempo_ms"], reverse=True):
+                imprimir(filho, nivel + 1)
+
+        imprimir(self.como_dict(), 0)
+        print("-" * 126)
+        for no in alertas:
+            print(f"⚠️ Possível N+1: '{no['nome']}' chamado {no['chamadas']} vezes com {no['sql_consultas_proprias']} consultas.")
+
+# --- Linha de Comando ---
+
+def adicionar_opcao_perfil(parser):
+    """Acrescenta a opção --profile [ARQUIVO.json] a um ArgumentParser."""
+    parser.add_argument(
+        "--profile", nargs="?", const="-", metavar="ARQUIVO.json",
+        help="Mede tempo, SQL e memória de cada etapa; exibe no terminal ou grava em JSON.",
+    )
+
+@contextlib.contextmanager
+def perfilar(destino: str | None, *servicos, memoria: bool = True):
+    """
+    Perfila o bloco quando 'destino' é informado ('-' exibe no terminal; outro
+    valor é o arquivo JSON). Sem destino, não faz nada e devolve None.
+    """
+    if destino is None:
+        yield None
+        return
+    perfilador = Perfilador(memoria=memoria)
+    for service in servicos:
+        perfilador.instrumentar_servico(service)
+    perfilador.iniciar()
+    try:
+        yield perfilador
+    finally:
+        perfilador.parar()
+        if destino == "-":
+            perfilador.exibir()
+        else:
+            perfilador.salvar_json(destino)
+            print(f"\n📊 Perfil salvo em '{destino}'.")
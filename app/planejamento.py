@@ -0,0 +1,124 @@
+# planejamento.py
+
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Tuple
+
+import numpy as np
+
+from .models import TipoAtivo
+
+# Tolerância padrão em torno da alocação sugerida (+/- 20%)
+FAIXA_TOLERANCIA = 0.20
+
+# Códigos das recomendações, na ordem em que aparecem no plano
+VENDER, COMPRAR, NEUTRO, NEUTRO_INSUFICIENTE = 0, 1, 2, 3
+RECOMENDACOES = ("Vender", "Comprar", "Neutro", "Neutro (Valor Insuf.)")
+
+# --- Estruturas de Dados ---
+
+@dataclass(frozen=True)
+class ItemPlano:
+    """Recomendação para um ativo dentro do plano de rebalanceamento."""
+    ticker: str
+    tipo: str
+    tipo_ativo: TipoAtivo
+    preco_atual: float
+    valor_mercado: float
+    alocacao_atual_na_classe: float
+    alocacao_sugerida: float
+    recomendacao: str
+    valor_a_movimentar: float
+
+@dataclass(frozen=True)
+class PlanoRebalanceamento:
+    """
+    Plano de rebalanceamento imutável. 'itens' segue a ordem Vender, Comprar,
+    Neutro dentro de cada classe; 'classes' agrupa os mesmos itens por classe.
+    """
+    itens: Tuple[ItemPlano, ...] = ()
+    faixa_tolerancia: float = FAIXA_TOLERANCIA
+    classes: Mapping[str, Tuple[ItemPlano, ...]] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        agrupados: Dict[str, List[ItemPlano]] = {}
+        for item in self.itens:
+            agrupados.setdefault(item.tipo, []).append(item)
+        classes = MappingProxyType({classe: tuple(itens) for classe, itens in agrupados.items()})
+        object.__setattr__(self, 'classes', classes)
+
+    def __len__(self) -> int:
+        return len(self.itens)
+
+    @property
+    def total_vendas(self) -> float:
+        return sum(item.valor_a_movimentar for item in self.itens if item.recomendacao == RECOMENDACOES[VENDER])
+
+    @property
+    def total_compras(self) -> float:
+        return sum(item.valor_a_movimentar for item in self.itens if item.recomendacao == RECOMENDACOES[COMPRAR])
+
+# --- Planejador Vetorizado ---
+
+def planejar_rebalanceamento(
+    classes: np.ndarray,
+    valor_mercado: np.ndarray,
+    alocacao_sugerida: np.ndarray,
+    preco_atual: np.ndarray,
+    faixa_tolerancia: float = FAIXA_TOLERANCIA,
+    carteiras: np.ndarray | None = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calcula o rebalanceamento com capital neutro sobre vetores alinhados
+    (um elemento por ativo). 'classes' traz o código inteiro da classe de cada ativo.
+
+    Ativos acima da faixa vendem o excedente; o caixa gerado é distribuído entre
+    os ativos abaixo da faixa, na proporção do que falta para atingirem o mínimo.
+    Compras menores que o preço de uma cota viram "Neutro (Valor Insuf.)".
+    Cada etapa é uma única passada vetorizada.
+
+    Para planejar várias carteiras de uma vez, 'carteiras' traz o código da
+    carteira de cada elemento: o caixa das vendas de uma carteira só é usado
+    nas compras dela. Os códigos de 'classes' devem então ser distintos entre
+    carteiras (um código por par carteira x classe).
+
+    Retorna (alocacao_atual_na_classe, codigo_recomendacao, valor_a_movimentar).
+    """
+    classes = np.asarray(classes)
+    valor_mercado = np.asarray(valor_mercado, dtype=float)
+    alocacao_sugerida = np.asarray(alocacao_sugerida, dtype=float)
+    preco_atual = np.asarray(preco_atual, dtype=float)
+
+    # 1. Subtotal da classe de cada ativo e alocação atual dentro da classe
+    subtotal = np.bincount(classes, weights=valor_mercado)[classes]
+    alocacao_atual = np.divide(valor_mercado, subtotal, out=np.full_like(valor_mercado, np.nan), where=subtotal != 0)
+
+    # 2. Classificação pelas faixas (NaN nunca cai em Vender/Comprar)
+    faixa_max = alocacao_sugerida * (1 + faixa_tolerancia)
+    faixa_min = alocacao_sugerida * (1 - faixa_tolerancia)
+    vender = alocacao_atual > faixa_max
+    comprar = alocacao_atual < faixa_min
+
+    codigo = np.full(len(valor_mercado), NEUTRO)
+    codigo[vender] = VENDER
+    codigo[comprar] = COMPRAR
+
+    # 3. Excedente das vendas e caixa gerado em cada carteira
+    carteiras = np.zeros(len(valor_mercado), dtype=int) if carteiras is None else np.asarray(carteiras)
+    valor = np.zeros(len(valor_mercado))
+    valor[vender] = (alocacao_atual[vender] - faixa_max[vender]) * subtotal[vender]
+    caixa = np.bincount(carteiras, weights=valor)
+
+    # 4. Distribui o caixa proporcionalmente ao gap de cada candidato à compra
+    if caixa.any() and comprar.any():
+        indices = np.flatnonzero(comprar)
+        gap = (faixa_min[comprar] - alocacao_atual[comprar]) * subtotal[comprar]
+        gap_total = np.bincount(carteiras[comprar], weights=gap, minlength=len(caixa))[carteiras[comprar]]
+        caixa_carteira = caixa[carteiras[comprar]]
+        com_caixa = (caixa_carteira > 0) & (gap_total > 0)
+        valor_compra = np.divide(caixa_carteira * gap, gap_total, out=np.zeros_like(gap), where=com_caixa)
+        insuficiente = com_caixa & (valor_compra < preco_atual[comprar])
+        codigo[indices[insuficiente]] = NEUTRO_INSUFICIENTE
+        valor[indices[com_caixa & ~insuficiente]] = valor_compra[com_caixa & ~insuficiente]
+
+    return alocacao_atual, codigo, valor
@@ -0,0 +1,328 @@
+# precos.py
+
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from .models import ESCALA_PRECO
+from .repositories import DadoHistoricoRepository
+
+# Gerações substituídas há mais que isto (em segundos) são removidas do disco;
+# as mais novas podem ainda estar sendo gravadas ou copiadas por outro processo
+IDADE_MINIMA_GERACAO_S = 60.0
+
+# Uma trava de acréscimo mais antiga que isto (em segundos) foi deixada por um
+# processo que caiu: a geração deixa de receber acréscimos e é reconstruída
+IDADE_MAXIMA_TRAVA_S = 30.0
+
+def carregar_matriz_precos(
+    session: Session,
+    repositorio: DadoHistoricoRepository,
+    tickers: Iterable[str],
+    data_inicial: datetime.date | None = None,
+) -> pd.DataFrame:
+    """
+    Monta a matriz de fechamentos (datas nas linhas, tickers nas colunas) lendo
+    as cotações no formato compacto (ticker_id, dia, fechamento), já filtradas no
+    SQL pelos tickers e pela janela de datas. A matriz é preenchida diretamente
+    com NumPy, sem pivot.
+    """
+    nomes, linhas = repositorio.find_precos_compactos(session, tickers, data_inicial)
+    if not linhas:
+        return pd.DataFrame()
+    return _montar_matriz(nomes, linhas)
+
+def _montar_matriz(nomes: dict, linhas) -> pd.DataFrame:
+    """
+    Espalha linhas (ticker_id, dia, fechamento) em uma matriz datas x tickers,
+    com as colunas em ordem de ticker. 'nomes' traduz ticker_id em ticker.
+    """
+    # 1. Tudo é inteiro: uma única conversão para NumPy e números distintos em ordem
+    valores = np.fromiter(itertools.chain.from_iterable(linhas), dtype=np.int64, count=3 * len(linhas)).reshape(-1, 3)
+    dias, posicao_data = np.unique(valores[:, 1], return_inverse=True)
+    ids, posicao_id = np.unique(valores[:, 0], return_inverse=True)
+
+    # 2. Coluna de cada ticker_id na ordem alfabética dos tickers
+    nomes_tickers = np.array([nomes[ticker_id] for ticker_id in ids.tolist()], dtype=object)
+    ordem = np.argsort(nomes_tickers, kind='stable')
+    coluna = np.empty(len(ordem), dtype=np.intp)
+    coluna[ordem] = np.arange(len(ordem))
+
+    # 3. Espalha os preços (escala inteira -> reais); dias sem cotação ficam como NaN
+    matriz = np.full((len(dias), len(ids)), np.nan)
+    matriz[posicao_data, coluna[posicao_id]] = valores[:, 2] / ESCALA_PRECO
+
+    # 4. Os dias já são números desde 1970-01-01: viram datas sem interpretar texto
+    indice = pd.DatetimeIndex(pd.to_datetime(dias, unit='D'), name='data')
+    colunas = pd.Index(nomes_tickers[ordem].tolist(), name='ticker')
+    return pd.DataFrame(matriz, index=indice, columns=colunas)
+
+# --- Cache em Disco ---
+
+class CachePrecos:
+    """
+    Guarda em disco a matriz completa de fechamentos (datas x tickers) de
+    `dados_historicos`, como um arquivo binário aberto por memória mapeada.
+    A matriz é identificada pela versão da tabela de cotações, que inclui o
+    contador de correções; quando a tabela só recebeu dias novos, as linhas são
+    acrescentadas ao fim do arquivo em vez de a matriz inteira ser lida do
+    banco de novo.
+
+    Cada reconstrução cria uma geração nova (um subdiretório) e só então troca
+    os metadados, que apontam para ela. Um acréscimo grava as linhas novas
+    depois das 'n_datas' já publicadas, que nunca são alteradas, e publica o
+    novo 'n_datas' pelos metadados; quem já mapeou o arquivo continua lendo
+    as linhas antigas. Assim o conjunto muda de uma vez, mesmo com outros
+    processos lendo ou gravando.
+
+    Arquivos no diretório:
+      - metadados.json            -> versão da tabela, tickers, geração, n_datas e arquivo de datas
+      - g-<...>/precos.f8         -> float64, ordem C, formato (n_datas, n_tickers)
+      - g-<...>/datas-<n>.npy     -> datas (datetime64[D]) das n primeiras linhas
+      - g-<...>/acrescimo.trava   -> existe enquanto um processo acrescenta linhas
+    """
+    def __init__(self, diretorio: str = "data/cache_precos"):
+        self.diretorio = diretorio
+        self.caminho_metadados = os.path.join(diretorio, "metadados.json")
+        # Última matriz aberta ((versão, assinatura dos metadados), DataFrame),
+        # reaproveitada enquanto a tabela e os arquivos do cache não mudarem.
+        # A trava serializa as atualizações entre threads.
+        self._aberta: tuple | None = None
+        self._trava = threading.RLock()
+
+    def abrir(self, session: Session, repositorio: DadoHistoricoRepository) -> pd.DataFrame:
+        """
+        Retorna a matriz completa como um DataFrame somente leitura apoiado no
+        arquivo mapeado (sem cópia). Se a tabela mudou, o cache é atualizado antes.
+        """
+        versao = list(repositorio.get_versao_dados(session))
+        with self._trava:
+            # Outro processo pode ter reconstruído o cache para a mesma versão
+            # (ex: `reconstruir=True`), trocando os metadados. Por isso a matriz
+            # aberta vale para a versão e para a gravação atual dos metadados.
+            if self._aberta is not None and self._aberta[0] == (versao, self._assinatura_metadados()):
+                return self._aberta[1]
+            # A assinatura é lida antes dos metadados: se eles forem trocados no
+            # meio tempo (inclusive pela atualização abaixo), a próxima chamada reabre
+            assinatura = self._assinatura_metadados()
+            metadados = self._ler_metadados()
+            if metadados is None or metadados['versao'] != versao:
+                metadados = self.atualizar(session, repositorio)
+                assinatura = None
+            try:
+                matriz = self._mapear(metadados)
+            except FileNotFoundError:
+                # A geração lida foi substituída e removida por outro processo
+                metadados = self.atualizar(session, repositorio)
+                assinatura = None
+                matriz = self._mapear(metadados)
+            self._aberta = ((metadados['versao'], assinatura), matriz)
+            return matriz
+
+    def atualizar(self, session: Session, repositorio: DadoHistoricoRepository, reconstruir: bool = False) -> dict:
+        """
+        Sincroniza o cache com a tabela. Acrescenta apenas os dias novos quando
+        possível; caso contrário (tickers novos, datas antigas preenchidas,
+        cotações alteradas) reconstrói a matriz inteira.
+        Retorna os metadados gravados.
+        """
+        with self._trava:
+            return self._sincronizar(session, repositorio, reconstruir)
+
+    # --- Métodos internos ---
+
+    def _sincronizar(self, session: Session, repositorio: DadoHistoricoRepository, reconstruir: bool) -> dict:
+        versao = list(repositorio.get_versao_dados(session))
+        # Uma segunda tentativa cobre o caso de outro processo ter acabado de
+        # acrescentar as mesmas linhas enquanto esperávamos a trava
+        for _ in range(2):
+            metadados = None if reconstruir else self._ler_metadados()
+            if metadados is not None and metadados['versao'] == versao:
+                return metadados
+            if metadados is None or metadados['ultima_data'] is None:
+                break
+
+            nomes, novas_linhas = repositorio.find_precos_compactos(
+                session, None, apos_data=datetime.date.fromisoformat(metadados['ultima_data'])
+            )
+            # O acréscimo só é seguro se nenhuma cotação gravada foi corrigida, se as
+            # linhas novas explicam toda a diferença de contagem e se não trazem
+            # tickers que ainda não têm coluna
+            tickers_cache = set(metadados['tickers'])
+            if not (
+                novas_linhas
+                and versao[3:] == metadados['versao'][3:]
+                and len(novas_linhas) == versao[0] - metadados['versao'][0]
+                and all(nomes[ticker_id] in tickers_cache for ticker_id, _, _ in novas_linhas)
+            ):
+                break
+            try:
+                acrescentados = self._acrescentar(metadados, nomes, novas_linhas, versao)
+            except FileNotFoundError:
+                # A geração foi removida por outro processo: refaz do zero
+                break
+            if acrescentados is not None:
+                return acrescentados
+
+        return self._reconstruir(session, repositorio, versao)
+
+    def _assinatura_metadados(self) -> tuple | None:
+        """Identifica a gravação atual dos metadados (muda a cada `os.replace`)."""
+        try:
+            estado = os.stat(self.caminho_metadados)
+        except FileNotFoundError:
+            return None
+        return (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+
+    def _caminhos(self, metadados: dict) -> tuple:
+        """Arquivos (preços, datas) apontados pelos metadados."""
+        pasta = os.path.join(self.diretorio, metadados['geracao'])
+        return os.path.join(pasta, "precos.f8"), os.path.join(pasta, metadados['datas'])
+
+    def _ler_metadados(self) -> dict | None:
+        try:
+            with open(self.caminho_metadados, encoding='utf-8') as arquivo:
+                metadados = json.load(arquivo)
+        except (FileNotFoundError, ValueError):
+            return None
+        # Metadados sem geração ou sem arquivo de datas são de formatos anteriores
+        if 'geracao' not in metadados or 'datas' not in metadados:
+            return None
+        # O arquivo de preços pode ter linhas além das publicadas (um acréscimo em
+        # andamento), mas nunca menos: isso indicaria uma geração incompleta
+        caminho_precos, _ = self._caminhos(metadados)
+        tamanho_publicado = metadados['n_datas'] * len(metadados['tickers']) * 8
+        if not os.path.exists(caminho_precos) or os.path.getsize(caminho_precos) < tamanho_publicado:
+            return None
+        return metadados
+
+    def _nova_geracao(self) -> str:
+        """Cria o subdiretório de uma geração, com nome único entre processos e threads."""
+        geracao = f"g-{time.time_ns()}-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(os.path.join(self.diretorio, geracao))
+        return geracao
+
+    def _publicar(self, metadados: dict):
+        """
+        Troca os metadados de uma vez, passando a apontar para a geração nova,
+        e remove as gerações antigas que nenhuma gravação em curso pode estar usando.
+        """
+        temporario = f"{self.caminho_metadados}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(metadados, arquivo)
+        os.replace(temporario, self.caminho_metadados)
+
+        limite = time.time() - IDADE_MINIMA_GERACAO_S
+        for entrada in os.scandir(self.diretorio):
+            if (
+                entrada.is_dir()
+                and entrada.name.startswith("g-")
+                and entrada.name != metadados['geracao']
+                and entrada.stat().st_mtime < limite
+            ):
+                # Leitores que já mapearam a geração continuam com ela (no Windows,
+                # a remoção falha enquanto ela estiver aberta e fica para depois)
+                shutil.rmtree(entrada.path, ignore_errors=True)
+
+    def _reconstruir(self, session: Session, repositorio: DadoHistoricoRepository, versao: list) -> dict:
+        os.makedirs(self.diretorio, exist_ok=True)
+        nomes, linhas = repositorio.find_precos_compactos(session, None)
+        matriz = _montar_matriz(nomes, linhas) if linhas else pd.DataFrame()
+
+        # A geração nova só fica visível quando os metadados passam a apontar para ela
+        metadados = {
+            'versao': versao,
+            'geracao': self._nova_geracao(),
+            'tickers': [str(ticker) for ticker in matriz.columns],
+            'n_datas': len(matriz.index),
+            'datas': f"datas-{len(matriz.index)}.npy",
+            'ultima_data': matriz.index[-1].date().isoformat() if len(matriz.index) else None,
+        }
+        caminho_precos, caminho_datas = self._caminhos(metadados)
+        np.ascontiguousarray(matriz.to_numpy(dtype=np.float64)).tofile(caminho_precos)
+        np.save(caminho_datas, matriz.index.to_numpy().astype('datetime64[D]'))
+        self._publicar(metadados)
+        return metadados
+
+    def _acrescentar(self, metadados: dict, nomes: dict, novas_linhas, versao: list) -> dict | None:
+        """
+        Acrescenta os dias novos ao fim do arquivo de preços da geração atual.
+        Retorna None, sem gravar nada, se outro processo estiver acrescentando
+        linhas à mesma geração (depois de esperar que ele termine) ou já tiver
+        publicado um acréscimo depois da leitura de 'metadados'.
+        """
+        pasta = os.path.join(self.diretorio, metadados['geracao'])
+        caminho_trava = os.path.join(pasta, "acrescimo.trava")
+        try:
+            trava = os.open(caminho_trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # Espera o outro processo; uma trava antiga é de um processo que caiu
+            while True:
+                try:
+                    if time.time() - os.path.getmtime(caminho_trava) > IDADE_MAXIMA_TRAVA_S:
+                        break
+                except FileNotFoundError:
+                    break
+                time.sleep(0.05)
+            return None
+        try:
+            # Com a trava, confere se os metadados ainda são os lidos antes dela
+            if self._ler_metadados() != metadados:
+                return None
+
+            # Monta o bloco dos dias novos já com as colunas na ordem do cache
+            bloco = _montar_matriz(nomes, novas_linhas).reindex(columns=metadados['tickers'])
+            caminho_precos, caminho_datas_atual = self._caminhos(metadados)
+            datas = np.load(caminho_datas_atual)
+
+            # Grava logo depois das linhas publicadas, descartando o que tenha sobrado
+            # de um acréscimo interrompido (essas linhas nunca foram publicadas)
+            with open(caminho_precos, 'r+b') as arquivo:
+                arquivo.seek(metadados['n_datas'] * len(metadados['tickers']) * 8)
+                arquivo.truncate()
+                np.ascontiguousarray(bloco.to_numpy(dtype=np.float64)).tofile(arquivo)
+
+            n_datas = metadados['n_datas'] + len(bloco.index)
+            novos = {
+                **metadados,
+                'versao': versao,
+                'n_datas': n_datas,
+                'datas': f"datas-{n_datas}.npy",
+                'ultima_data': bloco.index[-1].date().isoformat(),
+            }
+            _, caminho_datas = self._caminhos(novos)
+            np.save(caminho_datas, np.concatenate([datas, bloco.index.to_numpy().astype('datetime64[D]')]))
+            self._publicar(novos)
+
+            # Mantém só as datas atuais e as anteriores, que um leitor pode estar abrindo
+            for entrada in os.scandir(pasta):
+                if entrada.name.startswith("datas-") and entrada.name not in (novos['datas'], metadados['datas']):
+                    os.remove(entrada.path)
+            return novos
+        finally:
+            os.close(trava)
+            # A geração pode ter sido removida por uma reconstrução de outro processo
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(caminho_trava)
+
+    def _mapear(self, metadados: dict) -> pd.DataFrame:
+        if metadados['n_datas'] == 0 or not metadados['tickers']:
+            return pd.DataFrame()
+        caminho_precos, caminho_datas = self._caminhos(metadados)
+        matriz = np.memmap(
+            caminho_precos, dtype=np.float64, mode='r',
+            shape=(metadados['n_datas'], len(metadados['tickers'])),
+        )
+        indice = pd.DatetimeIndex(np.load(caminho_datas), name='data')
+        colunas = pd.Index(metadados['tickers'], name='ticker')
+        return pd.DataFrame(matriz, index=indice, columns=colunas, copy=False)
@@ -1,9 +1,13 @@
 # repositories.py
 
 import datetime 
+import itertools
+from typing import Dict, Iterable, List, Set, Tuple
+from sqlalchemy import String, case, delete, func, insert, select, type_coerce
 from sqlalchemy.orm import Session
 from db_nexus import BaseRepository, RecordNotFoundError  # Importamos nossa classe base
-from .models import Ativo, Transacao, DadoHistorico, TipoOperacao  # Importamos nossos modelos
+from .models import Ativo, Carteira, Transacao, DadoHistorico, EstadoVolatilidade, MarcadorDados, PrecoDiario, TickerPreco, TipoOperacao  # Importamos nossos modelos
+from .models import ESCALA_PRECO, data_do_numero, numero_do_dia, preco_para_inteiro
 
 class AtivoRepository(BaseRepository[Ativo]):
     """
@@ -41,6 +45,30 @@ class AtivoRepository(BaseRepository[Ativo]):
         # O SQLAlchemy atualiza o objeto 'novo_ativo' com o ID após o add
         return novo_ativo
 
+    def map_ids_por_ticker(self, session: Session, tickers: Iterable[str]) -> Dict[str, int]:
+        """
+        Resolve os IDs de vários tickers com uma única consulta.
+        Retorna um dicionário {ticker: id} apenas com os ativos que já existem.
+        """
+        tickers = {ticker.upper() for ticker in tickers}
+        if not tickers:
+            return {}
+        consulta = select(self.model.ticker, self.model.id).where(self.model.ticker.in_(tickers))
+        return {ticker: ativo_id for ticker, ativo_id in session.execute(consulta)}
+
+    def criar_em_lote(self, session: Session, novos_ativos: Dict[str, dict]) -> None:
+        """
+        Cria vários ativos de uma vez com um único INSERT (executemany).
+        'novos_ativos' mapeia o ticker para os seus dados, ex:
+        {'PETR4': {'nome': 'Petrobras', 'tipo': TipoAtivo.ACAO}}
+        """
+        if not novos_ativos:
+            return
+        session.execute(
+            insert(self.model),
+            [{'ticker': ticker.upper(), **dados} for ticker, dados in novos_ativos.items()]
+        )
+
 class TransacaoRepository(BaseRepository[Transacao]):
     """
     Repositório para operações com o modelo Transacao.
@@ -56,14 +84,16 @@ class TransacaoRepository(BaseRepository[Transacao]):
         """
         return session.query(self.model).filter_by(ativo_id=ativo_id).order_by(self.model.data.asc()).all()
     
-    def existe_transacao_identica(self, session: Session, ativo_id: int, data: datetime.date, tipo_op: TipoOperacao, qtd: float, preco: float) -> bool:
+    def existe_transacao_identica(self, session: Session, ativo_id: int, data: datetime.date, tipo_op: TipoOperacao, qtd: float, preco: float, carteira_id: int | None = None) -> bool:
         """
-        Verifica se uma transação com exatamente os mesmos parâmetros já existe.
+        Verifica se uma transação com exatamente os mesmos parâmetros já existe
+        na mesma carteira.
         """
         # SQLAlchemy nos permite construir queries complexas de forma legível
         return session.query(
             session.query(self.model)
             .filter_by(
+                carteira_id=carteira_id,
                 ativo_id=ativo_id,
                 data=data,
                 tipo_operacao=tipo_op,
@@ -72,11 +102,161 @@ class TransacaoRepository(BaseRepository[Transacao]):
             ).exists()
         ).scalar()
 
+    def find_chaves_existentes(self, session: Session, ativo_ids: Iterable[int], data_inicial: datetime.date, data_final: datetime.date) -> Set[Tuple]:
+        """
+        Versão em lote de `existe_transacao_identica`: busca, com uma única consulta,
+        as transações já gravadas para os ativos e o intervalo de datas informados.
+        Retorna um conjunto de tuplas
+        (carteira_id, ativo_id, data, tipo_operacao, quantidade, preco_unitario).
+        """
+        ativo_ids = set(ativo_ids)
+        if not ativo_ids:
+            return set()
+        consulta = select(
+            self.model.carteira_id,
+            self.model.ativo_id,
+            self.model.data,
+            self.model.tipo_operacao,
+            self.model.quantidade,
+            self.model.preco_unitario,
+        ).where(
+            self.model.ativo_id.in_(ativo_ids),
+            self.model.data.between(data_inicial, data_final),
+        )
+        return {tuple(linha) for linha in session.execute(consulta)}
+
+    def get_versao_dados(self, session: Session) -> Tuple[int, int, int, int]:
+        """
+        Retorna um marcador barato de versão das transações e dos ativos:
+        (nº de transações, maior id de transação, nº de ativos, maior id de ativo).
+        """
+        return tuple(session.execute(select(
+            select(func.count()).select_from(self.model).scalar_subquery(),
+            select(func.coalesce(func.max(self.model.id), 0)).scalar_subquery(),
+            select(func.count()).select_from(Ativo).scalar_subquery(),
+            select(func.coalesce(func.max(Ativo.id), 0)).scalar_subquery(),
+        )).one())
+
+    def agregar_posicoes(self, session: Session, quantidade_minima: float = 0.0001, carteira_id: int | None = None) -> List[Tuple]:
+        """
+        Consolida as posições diretamente no banco, com um único GROUP BY por ativo.
+        Compras somam quantidade e custo; vendas apenas reduzem a quantidade.
+        Ativos com quantidade menor ou igual a 'quantidade_minima' (totalmente
+        vendidos) são descartados. Com 'carteira_id', considera só essa carteira;
+        sem ele, soma todas.
+        Retorna tuplas (ticker, tipo, quantidade_total, custo_total), na ordem
+        em que cada ativo foi negociado pela primeira vez.
+        """
+        eh_compra = self.model.tipo_operacao == TipoOperacao.COMPRA
+        eh_venda = self.model.tipo_operacao == TipoOperacao.VENDA
+        quantidade_total = func.sum(case(
+            (eh_compra, self.model.quantidade),
+            (eh_venda, -self.model.quantidade),
+            else_=0.0,
+        ))
+        custo_total = func.sum(case(
+            (eh_compra, self.model.quantidade * self.model.preco_unitario),
+            else_=0.0,
+        ))
+        consulta = (
+            select(Ativo.ticker, Ativo.tipo, quantidade_total, custo_total)
+            .join(Ativo, Ativo.id == self.model.ativo_id)
+            .group_by(Ativo.id)
+            .having(quantidade_total > quantidade_minima)
+            .order_by(func.min(self.model.id))
+        )
+        if carteira_id is not None:
+            consulta = consulta.where(self.model.carteira_id == carteira_id)
+        return [tuple(linha) for linha in session.execute(consulta)]
+
+    def agregar_posicoes_por_carteira(self, session: Session, carteira_ids: Iterable[int] | None = None, quantidade_minima: float = 0.0001) -> List[Tuple]:
+        """
+        Versão de `agregar_posicoes` para várias carteiras com um único GROUP BY
+        (carteira, ativo). Retorna tuplas (carteira_id, ticker, tipo, quantidade_total).
+        """
+        quantidade_total = func.sum(case(
+            (self.model.tipo_operacao == TipoOperacao.VENDA, -self.model.quantidade),
+            else_=self.model.quantidade,
+        ))
+        consulta = (
+            select(self.model.carteira_id, Ativo.ticker, Ativo.tipo, quantidade_total)
+            .join(Ativo, Ativo.id == self.model.ativo_id)
+            .group_by(self.model.carteira_id, Ativo.id)
+            .having(quantidade_total > quantidade_minima)
+        )
+        if carteira_ids is not None:
+            consulta = consulta.where(self.model.carteira_id.in_(set(carteira_ids)))
+        return session.execute(consulta).all()
+
+    def find_movimentos(self, session: Session, carteira_id: int | None = None) -> List[Tuple[str, str, float, float]]:
+        """
+        Busca as transações (de uma carteira ou de todas) como movimentos com
+        sinal, em ordem cronológica: (ticker, data 'AAAA-MM-DD', quantidade, valor).
+        Compras entram positivas e vendas negativas, tanto na quantidade quanto
+        no valor financeiro.
+        """
+        sinal = case((self.model.tipo_operacao == TipoOperacao.VENDA, -1.0), else_=1.0)
+        consulta = (
+            select(
+                Ativo.ticker,
+                type_coerce(self.model.data, String),
+                sinal * self.model.quantidade,
+                sinal * self.model.quantidade * self.model.preco_unitario,
+            )
+            .join(Ativo, Ativo.id == self.model.ativo_id)
+            .order_by(self.model.data, self.model.id)
+        )
+        if carteira_id is not None:
+            consulta = consulta.where(self.model.carteira_id == carteira_id)
+        return session.execute(consulta).all()
+
+    def inserir_em_lote(self, session: Session, transacoes: List[dict]) -> None:
+        """
+        Insere várias transações com um único INSERT (executemany), sem
+        materializar um objeto ORM por linha.
+        """
+        if transacoes:
+            session.execute(insert(self.model), transacoes)
+
+
+class CarteiraRepository(BaseRepository[Carteira]):
+    """
+    Repositório para as carteiras (contas) às quais as transações pertencem.
+    """
+    def __init__(self):
+        super().__init__(Carteira)
+
+    def map_ids_por_nome(self, session: Session, nomes: Iterable[str], criar: bool = False) -> Dict[str, int]:
+        """
+        Resolve vários nomes de carteira de uma vez. Retorna {nome: id}.
+        Com 'criar', as carteiras que ainda não existem são criadas.
+        """
+        nomes = set(nomes)
+        if not nomes:
+            return {}
+        consulta = select(self.model.nome, self.model.id).where(self.model.nome.in_(nomes))
+        ids = dict(session.execute(consulta).all())
+        faltantes = nomes - ids.keys()
+        if criar and faltantes:
+            session.execute(insert(self.model), [{'nome': nome} for nome in sorted(faltantes)])
+            ids.update(session.execute(select(self.model.nome, self.model.id).where(self.model.nome.in_(faltantes))).all())
+        return ids
+
+    def list_nomes(self, session: Session) -> Dict[int, str]:
+        """Todas as carteiras cadastradas, em ordem de nome: {id: nome}."""
+        return dict(session.execute(select(self.model.id, self.model.nome).order_by(self.model.nome)).all())
+
 
 class DadoHistoricoRepository(BaseRepository[DadoHistorico]):
     """
     Repositório para operações com o modelo DadoHistorico.
+    Os métodos que devolvem objetos DadoHistorico leem a visão 'dados_historicos';
+    os demais (leituras em massa, janelas de preços e gravação) usam direto as
+    tabelas compactas `TickerPreco` e `PrecoDiario`.
     """
+    # Contador (em `marcadores_dados`) das gravações que alteraram cotações existentes
+    MARCADOR_CORRECOES = "dados_historicos:correcoes"
+
     def __init__(self):
         super().__init__(DadoHistorico)
 
@@ -99,4 +279,243 @@ class DadoHistoricoRepository(BaseRepository[DadoHistorico]):
         return session.query(self.model)\
             .filter(self.model.ticker == ticker.upper())\
             .order_by(self.model.data.desc())\
-            .first()
\ No newline at end of file
+            .first()
+
+    def _ids_por_ticker(self, session: Session, tickers: Iterable[str] | None) -> Dict[int, str]:
+        """Resolve os tickers (None = todos) no dicionário compacto: {ticker_id: ticker}."""
+        consulta = select(TickerPreco.id, TickerPreco.ticker)
+        if tickers is not None:
+            consulta = consulta.where(TickerPreco.ticker.in_({ticker.upper() for ticker in tickers}))
+        return dict(session.execute(consulta).all())
+
+    def find_precos_compactos(self, session: Session, tickers: Iterable[str] | None, data_inicial: datetime.date | None = None, apos_data: datetime.date | None = None) -> Tuple[Dict[int, str], List[Tuple[int, int, int]]]:
+        """
+        Busca as cotações dos tickers informados (None = todos) a partir de
+        'data_inicial' (inclusive) ou de 'apos_data' (exclusive) no formato
+        compacto, sem criar objetos ORM nem converter datas.
+        Retorna ({ticker_id: ticker}, linhas (ticker_id, dia, fechamento)), com o
+        fechamento na escala inteira de ESCALA_PRECO.
+        """
+        nomes = self._ids_por_ticker(session, tickers)
+        if not nomes:
+            return {}, []
+        consulta = select(PrecoDiario.ticker_id, PrecoDiario.dia, PrecoDiario.fechamento)
+        if tickers is not None:
+            consulta = consulta.where(PrecoDiario.ticker_id.in_(nomes))
+        if data_inicial is not None:
+            consulta = consulta.where(PrecoDiario.dia >= numero_do_dia(data_inicial))
+        if apos_data is not None:
+            consulta = consulta.where(PrecoDiario.dia > numero_do_dia(apos_data))
+        return nomes, session.execute(consulta).all()
+
+    def get_versao_dados(self, session: Session) -> Tuple[int, int, str | None, int]:
+        """
+        Retorna um marcador barato de versão das cotações: (número de cotações,
+        maior id de ticker, data mais recente, número de correções). Muda sempre
+        que cotações são inseridas ou alteradas. Lê apenas o dicionário de
+        tickers, que guarda os totais, e o contador de correções.
+        """
+        correcoes = (
+            select(MarcadorDados.versao).where(MarcadorDados.tabela == self.MARCADOR_CORRECOES).scalar_subquery()
+        )
+        total, maior_id, ultimo_dia, n_correcoes = session.execute(
+            select(
+                func.coalesce(func.sum(TickerPreco.n_cotacoes), 0),
+                func.max(TickerPreco.id),
+                func.max(TickerPreco.ultimo_dia),
+                func.coalesce(correcoes, 0),
+            )
+        ).one()
+        ultima_data = data_do_numero(ultimo_dia).isoformat() if ultimo_dia is not None else None
+        return total, maior_id or 0, ultima_data, n_correcoes
+
+    def find_precos_ticker(self, session: Session, ticker: str, data_inicial: datetime.date | None = None, data_final: datetime.date | None = None, limite: int | None = None) -> List[Tuple[datetime.date, float]]:
+        """
+        Busca (data, preco_fechamento) de um ticker em ordem cronológica, com
+        'data_inicial' inclusiva e 'data_final' exclusiva (ambas opcionais).
+        A janela é um trecho contíguo da chave primária (ticker_id, dia).
+        """
+        consulta = select(PrecoDiario.dia, PrecoDiario.fechamento)\
+            .join(TickerPreco, TickerPreco.id == PrecoDiario.ticker_id)\
+            .where(TickerPreco.ticker == ticker.upper())\
+            .order_by(PrecoDiario.dia.asc())
+        if data_inicial is not None:
+            consulta = consulta.where(PrecoDiario.dia >= numero_do_dia(data_inicial))
+        if data_final is not None:
+            consulta = consulta.where(PrecoDiario.dia < numero_do_dia(data_final))
+        if limite is not None:
+            consulta = consulta.limit(limite)
+        return [(data_do_numero(dia), fechamento / ESCALA_PRECO) for dia, fechamento in session.execute(consulta)]
+
+    def get_latest_prices(self, session: Session, tickers: Iterable[str]) -> Dict[str, Tuple[float, datetime.date]]:
+        """
+        Versão em lote de `get_latest_price`: busca o fechamento mais recente de
+        vários tickers com uma única consulta (o último dia de cada ticker fica
+        no dicionário, então cada cotação é uma busca direta pela chave).
+        Retorna um dicionário {ticker: (preco_fechamento, data)}; tickers sem
+        cotação ficam de fora.
+        """
+        tickers = {ticker.upper() for ticker in tickers}
+        if not tickers:
+            return {}
+        consulta = select(TickerPreco.ticker, PrecoDiario.fechamento, PrecoDiario.dia).join(
+            PrecoDiario,
+            (PrecoDiario.ticker_id == TickerPreco.id) & (PrecoDiario.dia == TickerPreco.ultimo_dia),
+        ).where(TickerPreco.ticker.in_(tickers))
+        return {ticker: (fechamento / ESCALA_PRECO, data_do_numero(dia)) for ticker, fechamento, dia in session.execute(consulta)}
+
+    def get_ultimas_datas(self, session: Session, tickers: Iterable[str] | None = None) -> Dict[str, datetime.date]:
+        """
+        Busca a data mais recente gravada para cada ticker, lida do dicionário
+        de tickers. Retorna um dicionário {ticker: data}.
+        """
+        consulta = select(TickerPreco.ticker, TickerPreco.ultimo_dia).where(TickerPreco.ultimo_dia.is_not(None))
+        if tickers is not None:
+            consulta = consulta.where(TickerPreco.ticker.in_({ticker.upper() for ticker in tickers}))
+        return {ticker: data_do_numero(dia) for ticker, dia in session.execute(consulta)}
+
+    def upsert_em_lote(self, session: Session, registros: Iterable[Tuple[str, str, float]], tamanho_lote: int = 50_000, atualizar: bool = True) -> Dict[str, int]:
+        """
+        Grava cotações em massa na tabela compacta com `INSERT ... ON CONFLICT(ticker_id, dia)`,
+        usando executemany. Recebe tuplas simples (ticker, 'AAAA-MM-DD', preco_fechamento);
+        tickers novos entram no dicionário e o preço é gravado na escala inteira de
+        ESCALA_PRECO. Preços que não podem ser gravados (não finitos, ou que
+        arredondam para zero ou menos) são rejeitados em vez de virarem zero.
+        Com 'atualizar=True' um preço diferente substitui o gravado; caso contrário
+        o registro existente é mantido. Duplicatas nunca desfazem o lote.
+        Retorna as contagens de 'inserted', 'updated', 'skipped' e 'rejected'.
+        """
+        if atualizar:
+            acao_conflito = "DO UPDATE SET fechamento = excluded.fechamento WHERE fechamento IS NOT excluded.fechamento"
+        else:
+            acao_conflito = "DO NOTHING"
+        sql = (
+            f"INSERT INTO {PrecoDiario.__tablename__} (ticker_id, dia, fechamento) VALUES (?, ?, ?) "
+            f"ON CONFLICT(ticker_id, dia) {acao_conflito}"
+        )
+        sql_totais = (
+            f"UPDATE {TickerPreco.__tablename__} SET "
+            f"n_cotacoes = (SELECT COUNT(*) FROM {PrecoDiario.__tablename__} WHERE ticker_id = ?), "
+            f"ultimo_dia = (SELECT MAX(dia) FROM {PrecoDiario.__tablename__} WHERE ticker_id = ?) "
+            "WHERE id = ?"
+        )
+
+        conexao = session.connection()
+        contagem = {'inserted': 0, 'updated': 0, 'skipped': 0, 'rejected': 0}
+        ids_por_ticker: Dict[str, int] = {}
+        dias: Dict[str, int] = {}
+        registros = iter(registros)
+        while True:
+            lote = list(itertools.islice(registros, tamanho_lote))
+            if not lote:
+                break
+            # 1. Converte os preços e descarta os que não podem ser gravados
+            convertidos = [(ticker, data, preco_para_inteiro(preco)) for ticker, data, preco in lote]
+            lote = [registro for registro in convertidos if registro[2] is not None]
+            contagem['rejected'] += len(convertidos) - len(lote)
+            if not lote:
+                continue
+
+            # 2. Tickers novos entram no dicionário, todos de uma vez
+            faltantes = {ticker for ticker, _, _ in lote} - ids_por_ticker.keys()
+            if faltantes:
+                conexao.exec_driver_sql(
+                    f"INSERT OR IGNORE INTO {TickerPreco.__tablename__} (ticker, n_cotacoes) VALUES (?, 0)",
+                    [(ticker,) for ticker in faltantes],
+                )
+                consulta = select(TickerPreco.ticker, TickerPreco.id).where(TickerPreco.ticker.in_(faltantes))
+                ids_por_ticker.update(session.execute(consulta).all())
+
+            # 3. Converte as datas (cada data distinta é convertida uma única vez)
+            for _, data, _ in lote:
+                if data not in dias:
+                    dias[data] = numero_do_dia(data)
+            linhas = [(ids_por_ticker[ticker], dias[data], fechamento) for ticker, data, fechamento in lote]
+
+            # 4. O rowcount do executemany soma inserções e atualizações; as inserções
+            # são o quanto cresceu o total de cotações dos tickers do lote
+            afetados = sorted({ticker_id for ticker_id, _, _ in linhas})
+            total_anterior = self._total_cotacoes(session, afetados)
+            alteradas = conexao.exec_driver_sql(sql, linhas).rowcount
+            conexao.exec_driver_sql(sql_totais, [(ticker_id, ticker_id, ticker_id) for ticker_id in afetados])
+            inseridas = self._total_cotacoes(session, afetados) - total_anterior
+            contagem['inserted'] += inseridas
+            contagem['updated'] += alteradas - inseridas
+            contagem['skipped'] += len(lote) - alteradas
+
+        # Cotações alteradas não mudam contagens nem datas: o contador de
+        # correções avisa quem guarda a matriz de preços (ver `get_versao_dados`)
+        if contagem['updated']:
+            MarcadorDadosRepository().incrementar(session, self.MARCADOR_CORRECOES)
+        return contagem
+
+    def _total_cotacoes(self, session: Session, ticker_ids: List[int]) -> int:
+        consulta = select(func.coalesce(func.sum(TickerPreco.n_cotacoes), 0)).where(TickerPreco.id.in_(ticker_ids))
+        return session.execute(consulta).scalar()
+
+
+class EstadoVolatilidadeRepository(BaseRepository[EstadoVolatilidade]):
+    """
+    Repositório para o estado incremental das volatilidades.
+    """
+    def __init__(self):
+        super().__init__(EstadoVolatilidade)
+
+    def find_by_tickers(self, session: Session, tickers: Iterable[str]) -> Dict[str, EstadoVolatilidade]:
+        """Busca o estado de vários tickers de uma vez. Retorna {ticker: estado}."""
+        tickers = {ticker.upper() for ticker in tickers}
+        if not tickers:
+            return {}
+        # populate_existing: os upserts de `gravar_em_lote` não passam pelos objetos da sessão
+        consulta = select(self.model).where(self.model.ticker.in_(tickers)).execution_options(populate_existing=True)
+        return {estado.ticker: estado for estado in session.scalars(consulta)}
+
+    def gravar_em_lote(self, session: Session, estados: Iterable[EstadoVolatilidade]) -> None:
+        """
+        Grava vários estados com `INSERT ... ON CONFLICT(ticker) DO UPDATE`
+        (executemany): idempotente, mesmo que outra sessão tenha gravado o
+        mesmo ticker antes. Os estados não precisam estar na sessão.
+        """
+        linhas = [
+            (
+                estado.ticker, estado.inicio_janela.isoformat(), estado.ultima_data.isoformat(),
+                estado.ultimo_preco, estado.n_retornos, estado.media, estado.m2,
+            )
+            for estado in estados
+        ]
+        if not linhas:
+            return
+        session.connection().exec_driver_sql(
+            f"INSERT INTO {self.model.__tablename__} "
+            "(ticker, inicio_janela, ultima_data, ultimo_preco, n_retornos, media, m2) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(ticker) DO UPDATE SET inicio_janela = excluded.inicio_janela, "
+            "ultima_data = excluded.ultima_data, ultimo_preco = excluded.ultimo_preco, "
+            "n_retornos = excluded.n_retornos, media = excluded.media, m2 = excluded.m2",
+            linhas,
+        )
+
+    def remover(self, session: Session, tickers: Iterable[str]) -> None:
+        """Apaga o estado dos tickers informados, se houver."""
+        tickers = {ticker.upper() for ticker in tickers}
+        if tickers:
+            session.execute(delete(self.model).where(self.model.ticker.in_(tickers)))
+
+
+class MarcadorDadosRepository(BaseRepository[MarcadorDados]):
+    """
+    Repositório para os contadores de escrita de cada tabela.
+    """
+    def __init__(self):
+        super().__init__(MarcadorDados)
+
+    def incrementar(self, session: Session, tabela: str) -> None:
+        """Registra que 'tabela' recebeu uma nova escrita."""
+        session.connection().exec_driver_sql(
+            f"INSERT INTO {self.model.__tablename__} (tabela, versao) VALUES (?, 1) "
+            "ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1",
+            (tabela,),
+        )
+
+    def get_versoes(self, session: Session) -> Dict[str, int]:
+        """Retorna o contador de escritas de cada tabela {tabela: versao}."""
+        return {tabela: versao for tabela, versao in session.execute(select(self.model.tabela, self.model.versao))}
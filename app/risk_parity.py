@@ -0,0 +1,164 @@
+# risk_parity.py
+
+import time
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+
+# --- Estruturas de Dados ---
+
+@dataclass
+class ResultadoERC:
+    """
+    Resultado de uma alocação de Contribuição de Risco Igual (ERC).
+    As contribuições de risco são frações do risco total (somam 1).
+    """
+    tickers: List[str]
+    pesos: np.ndarray
+    contribuicoes_risco: np.ndarray
+    volatilidade_carteira: float
+    iteracoes: int
+    convergiu: bool
+    erro_maximo: float
+    tempo_ms: float
+
+    def como_registros(self) -> List[Dict]:
+        """Converte o resultado em uma lista de dicionários, um por ticker."""
+        return [
+            {
+                "ticker": ticker,
+                "alocacao_sugerida": float(peso),
+                "contribuicao_risco": float(contribuicao),
+            }
+            for ticker, peso, contribuicao in zip(self.tickers, self.pesos, self.contribuicoes_risco)
+        ]
+
+# --- Solver ---
+
+def _contribuicoes(covariancia: np.ndarray, pesos: np.ndarray) -> np.ndarray:
+    risco_marginal = covariancia @ pesos
+    variancia = pesos @ risco_marginal
+    return pesos * risco_marginal / variancia if variancia > 0 else np.full(len(pesos), np.nan)
+
+def calcular_pesos_erc(
+    covariancia: np.ndarray,
+    tickers: List[str] | None = None,
+    pesos_iniciais: np.ndarray | None = None,
+    tolerancia: float = 1e-10,
+    max_iteracoes: int = 100,
+) -> ResultadoERC:
+    """
+    Calcula os pesos em que cada ativo contribui igualmente para o risco total,
+    considerando as correlações (matriz de covariância).
+
+    Resolve pelo método de Newton o problema convexo
+        min 1/2 y'Σy - b'ln(y),  y > 0,   com b_i = 1/n,
+    cuja solução normalizada (w = y / soma(y)) é a carteira ERC. Cada iteração
+    é um sistema linear n x n, então centenas de ativos convergem em poucos
+    milissegundos. 'pesos_iniciais' permite partir da solução anterior.
+    Ativos sem variância (ex.: renda fixa com preço constante) não têm risco a
+    equilibrar: ficam com peso zero e o problema é resolvido com os demais.
+    """
+    inicio = time.perf_counter()
+    covariancia = np.asarray(covariancia, dtype=float)
+    n = covariancia.shape[0]
+    tickers = list(tickers) if tickers is not None else [str(i) for i in range(n)]
+
+    # 0. Separa os ativos sem variância, que tornariam o ponto de partida infinito
+    com_risco = np.diag(covariancia) > 0
+    if not com_risco.all():
+        return _com_ativos_sem_risco(covariancia, tickers, pesos_iniciais, com_risco, tolerancia, max_iteracoes, inicio)
+
+    orcamento = np.full(n, 1.0 / n)
+
+    # 1. Ponto de partida: solução anterior ou inverso da volatilidade
+    if pesos_iniciais is not None and len(pesos_iniciais) == n and np.all(np.asarray(pesos_iniciais) > 0):
+        y = np.asarray(pesos_iniciais, dtype=float)
+    else:
+        y = 1.0 / np.sqrt(np.diag(covariancia))
+    # Escala ótima ao longo da direção inicial: y'Σy = soma(b)
+    y = y * np.sqrt(orcamento.sum() / (y @ covariancia @ y))
+
+    def objetivo(v: np.ndarray) -> float:
+        return 0.5 * v @ covariancia @ v - orcamento @ np.log(v)
+
+    # 2. Iterações de Newton com busca linear que mantém y > 0
+    iteracoes = 0
+    convergiu = False
+    for iteracoes in range(1, max_iteracoes + 1):
+        gradiente = covariancia @ y - orcamento / y
+        hessiana = covariancia + np.diag(orcamento / y**2)
+        passo = -np.linalg.solve(hessiana, gradiente)
+
+        negativos = passo < 0
+        alfa = min(1.0, 0.95 * np.min(-y[negativos] / passo[negativos])) if negativos.any() else 1.0
+        valor_atual = objetivo(y)
+        while alfa > 1e-12 and objetivo(y + alfa * passo) > valor_atual + 1e-4 * alfa * (gradiente @ passo):
+            alfa *= 0.5
+        y = y + alfa * passo
+
+        if np.max(np.abs(gradiente)) < tolerancia:
+            convergiu = True
+            break
+
+    # 3. Normaliza e mede a qualidade da solução
+    pesos = y / y.sum()
+    contribuicoes = _contribuicoes(covariancia, pesos)
+    erro_maximo = float(np.max(np.abs(contribuicoes - orcamento)))
+    return ResultadoERC(
+        tickers=tickers,
+        pesos=pesos,
+        contribuicoes_risco=contribuicoes,
+        volatilidade_carteira=float(np.sqrt(pesos @ covariancia @ pesos)),
+        iteracoes=iteracoes,
+        convergiu=convergiu or erro_maximo < 1e-8,
+        erro_maximo=erro_maximo,
+        tempo_ms=(time.perf_counter() - inicio) * 1000,
+    )
+
+def _com_ativos_sem_risco(
+    covariancia: np.ndarray,
+    tickers: List[str],
+    pesos_iniciais: np.ndarray | None,
+    com_risco: np.ndarray,
+    tolerancia: float,
+    max_iteracoes: int,
+    inicio: float,
+) -> ResultadoERC:
+    """Resolve o ERC só com os ativos de variância positiva e devolve peso zero aos demais."""
+    n = len(tickers)
+    pesos = np.zeros(n)
+    contribuicoes = np.zeros(n)
+    if not com_risco.any():
+        # Nenhum ativo com risco: não há o que equilibrar, então divide igualmente
+        return ResultadoERC(
+            tickers=tickers,
+            pesos=np.full(n, 1.0 / n),
+            contribuicoes_risco=contribuicoes,
+            volatilidade_carteira=0.0,
+            iteracoes=0,
+            convergiu=True,
+            erro_maximo=0.0,
+            tempo_ms=(time.perf_counter() - inicio) * 1000,
+        )
+
+    indices = np.flatnonzero(com_risco)
+    iniciais = None
+    if pesos_iniciais is not None and len(pesos_iniciais) == n:
+        iniciais = np.asarray(pesos_iniciais, dtype=float)[indices]
+    parcial = calcular_pesos_erc(
+        covariancia[np.ix_(indices, indices)], [tickers[i] for i in indices], iniciais, tolerancia, max_iteracoes
+    )
+    pesos[indices] = parcial.pesos
+    contribuicoes[indices] = parcial.contribuicoes_risco
+    return ResultadoERC(
+        tickers=tickers,
+        pesos=pesos,
+        contribuicoes_risco=contribuicoes,
+        volatilidade_carteira=parcial.volatilidade_carteira,
+        iteracoes=parcial.iteracoes,
+        convergiu=parcial.convergiu,
+        erro_maximo=parcial.erro_maximo,
+        tempo_ms=(time.perf_counter() - inicio) * 1000,
+    )
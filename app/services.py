@@ -1,15 +1,49 @@
 # services.py
 
+from __future__ import annotations
+
 import datetime
-import pandas as pd
-import numpy as np
+import functools
+import os
+import threading
+import time
 from dataclasses import dataclass, field
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict
 
 # Dependências da nossa aplicação
 from db_nexus import DatabaseSessionManager
-from .models import Ativo, Transacao, DadoHistorico, TipoAtivo, TipoOperacao
-from .repositories import AtivoRepository, TransacaoRepository, DadoHistoricoRepository
+from .models import CARTEIRA_PADRAO, Ativo, Transacao, TipoAtivo, TipoOperacao
+from .repositories import (
+    AtivoRepository,
+    TransacaoRepository,
+    CarteiraRepository,
+    DadoHistoricoRepository,
+    EstadoVolatilidadeRepository,
+    MarcadorDadosRepository,
+)
+from .cache import CacheAnalises, memoizar
+from .migracoes import migrar
+
+# pandas, numpy e os motores numéricos só são importados dentro dos métodos
+# que os usam: relatórios simples (posições, distribuição) não pagam esse custo.
+if TYPE_CHECKING:
+    import pandas as pd
+    from .precos import CachePrecos
+    from .volatilidade import MotorVolatilidade
+    from .historico import HistoricoCarteira
+    from .backtest import ConfiguracaoBacktest, ResultadoBacktest
+    from .monte_carlo import ResultadoMonteCarlo
+    from .carteiras import AnaliseCarteiras
+    from .risk_parity import ResultadoERC
+    from .aporte import CenariosAporte
+    from .planejamento import PlanoRebalanceamento
+
+# Janela (em dias corridos) usada no cálculo das volatilidades
+JANELA_VOLATILIDADE_DIAS = 2 * 365
+
+# Fração mínima de retornos na janela (em relação ao ativo mais completo do
+# grupo) para um ativo entrar no ERC; ativos recém-listados ficam de fora
+FRACAO_MINIMA_HISTORICO_ERC = 0.5
 
 # --- Estruturas de Dados ---
 
@@ -39,13 +73,50 @@ class PortfolioService:
     Orquestra as operações relacionadas à análise de portfólio.
     Esta é a camada de lógica de negócio.
     """
-    def __init__(self, session_manager: DatabaseSessionManager):
+    def __init__(
+        self,
+        session_manager: DatabaseSessionManager,
+        cache_precos: CachePrecos | None = None,
+        cache: CacheAnalises | None = None,
+        carteira: str | None = None,
+    ):
         # Injeção de Dependência: o serviço recebe o gerenciador de sessão.
         self.session_manager = session_manager
+        # Carteira analisada e que recebe as novas transações. Sem ela, as
+        # análises somam todas as carteiras e as importações vão para a padrão.
+        self.carteira = carteira
+        # Cache opcional da matriz de preços em disco (memória mapeada).
+        self.cache_precos = cache_precos
+        # Cache opcional das análises, invalidado quando transações ou cotações mudam.
+        # Sem ele, toda análise é recalculada; com um diretório, vale entre processos.
+        self.cache = cache
         # O serviço instancia os repositórios que ele precisa.
         self.ativo_repo = AtivoRepository()
         self.transacao_repo = TransacaoRepository()
         self.dado_historico_repo = DadoHistoricoRepository()
+        self.marcador_repo = MarcadorDadosRepository()
+        self.carteira_repo = CarteiraRepository()
+        # Últimos pesos ERC calculados por grupo, usados como ponto de partida do solver.
+        # A trava protege o dicionário quando o serviço atende várias threads (servidor).
+        self._pesos_erc: Dict[str, pd.Series] = {}
+        self._trava_erc = threading.Lock()
+        # Traz o banco para a versão atual do esquema antes de qualquer uso.
+        with self.session_manager.get_session() as session:
+            migrar(session.connection())
+            url = session.get_bind().url
+        # Identifica o banco nas chaves do cache de análises, que pode ser
+        # compartilhado em disco por serviços sobre bancos diferentes
+        if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+            self.banco = os.path.abspath(url.database)
+        else:
+            self.banco = url.render_as_string(hide_password=True)
+
+    @functools.cached_property
+    def volatilidade(self) -> MotorVolatilidade:
+        """Estado incremental das volatilidades, atualizado a cada importação de cotações."""
+        from .volatilidade import MotorVolatilidade
+
+        return MotorVolatilidade(JANELA_VOLATILIDADE_DIAS, self.dado_historico_repo, EstadoVolatilidadeRepository())
 
     def adicionar_transacao_completa(
         self,
@@ -66,8 +137,9 @@ class PortfolioService:
             dados_ativo = {'nome': nome_ativo, 'tipo': tipo_ativo}
             ativo = self.ativo_repo.find_or_create(session, ticker, defaults=dados_ativo)
 
-            # 2. Cria o objeto da transação, ligando ao ID do ativo.
+            # 2. Cria o objeto da transação, ligando ao ID do ativo e à carteira.
             nova_transacao = Transacao(
+                carteira_id=self._id_carteira_destino(session),
                 data=data,
                 tipo_operacao=tipo_operacao,
                 quantidade=quantidade,
@@ -84,6 +156,8 @@ class PortfolioService:
             # 5. Força o envio do INSERT para o banco e a obtenção do ID.
             session.flush()
             
+            self.marcador_repo.incrementar(session, 'transacoes')
+
             # 6. Agora o refresh pode ser feito, pois o objeto tem um ID e existe no banco.
             # O 'with' garante o commit. O SQLAlchemy atualiza 'nova_transacao' com seu ID.
             return nova_transacao
@@ -98,12 +172,14 @@ class PortfolioService:
             ativo = self.ativo_repo.find_or_create(session, ticker, defaults={'nome': nome_ativo, 'tipo': tipo_ativo})
             session.flush() # Garante que o ativo tenha um ID, mesmo se for novo
 
-            # Agora, verifica se a transação já existe usando o ID do ativo
-            if self.transacao_repo.existe_transacao_identica(session, ativo.id, data, tipo_operacao, quantidade, preco_unitario):
+            # Agora, verifica se a transação já existe na carteira usando o ID do ativo
+            carteira_id = self._id_carteira_destino(session)
+            if self.transacao_repo.existe_transacao_identica(session, ativo.id, data, tipo_operacao, quantidade, preco_unitario, carteira_id):
                 return {'status': 'skipped', 'ticker': ticker}
             
             # Se não existe, cria e adiciona a nova transação
             nova_transacao = Transacao(
+                carteira_id=carteira_id,
                 ativo_id=ativo.id,
                 data=data,
                 tipo_operacao=tipo_operacao,
@@ -111,74 +187,173 @@ class PortfolioService:
                 preco_unitario=preco_unitario,
             )
             self.transacao_repo.add(session, nova_transacao)
+            self.marcador_repo.incrementar(session, 'transacoes')
             
             return {'status': 'imported', 'ticker': ticker}
 
+    def importar_transacoes_em_lote(self, registros: List[Dict]) -> dict:
+        """
+        Versão em lote de `importar_transacao_se_nova`, pensada para arquivos grandes.
+        Cada registro deve ter as chaves: 'ticker', 'nome', 'tipo_ativo', 'data',
+        'tipo_operacao', 'quantidade' e 'preco_unitario'; a chave opcional
+        'carteira' escolhe a carteira (padrão: a do serviço).
+        Usa uma única sessão e um número constante de consultas por lote.
+        Retorna um dicionário com as contagens de 'imported' e 'skipped'.
+        """
+        if not registros:
+            return {'imported': 0, 'skipped': 0}
+
+        with self.session_manager.get_session() as session:
+            # 1. Resolve todos os tickers do lote em uma única consulta
+            ids_por_ticker = self.ativo_repo.map_ids_por_ticker(session, (r['ticker'] for r in registros))
+
+            # 2. Cria de uma vez os ativos que ainda não existem
+            ativos_faltantes = {}
+            for registro in registros:
+                ticker = registro['ticker'].upper()
+                if ticker not in ids_por_ticker and ticker not in ativos_faltantes:
+                    ativos_faltantes[ticker] = {'nome': registro['nome'], 'tipo': registro['tipo_ativo']}
+            if ativos_faltantes:
+                self.ativo_repo.criar_em_lote(session, ativos_faltantes)
+                ids_por_ticker.update(self.ativo_repo.map_ids_por_ticker(session, ativos_faltantes))
+
+            # Resolve (e cria) as carteiras de destino do lote de uma vez
+            destino_padrao = self.carteira or CARTEIRA_PADRAO
+            ids_por_carteira = self.carteira_repo.map_ids_por_nome(
+                session, {r.get('carteira') or destino_padrao for r in registros}, criar=True
+            )
+
+            # 3. Busca as transações já existentes com uma única consulta por conjunto
+            datas = [r['data'] for r in registros]
+            chaves_existentes = self.transacao_repo.find_chaves_existentes(
+                session, ids_por_ticker.values(), min(datas), max(datas)
+            )
+
+            # 4. Separa apenas as transações novas (inclusive duplicatas dentro do próprio lote)
+            novas_transacoes = []
+            for registro in registros:
+                chave = (
+                    ids_por_carteira[registro.get('carteira') or destino_padrao],
+                    ids_por_ticker[registro['ticker'].upper()],
+                    registro['data'],
+                    registro['tipo_operacao'],
+                    registro['quantidade'],
+                    registro['preco_unitario'],
+                )
+                if chave in chaves_existentes:
+                    continue
+                chaves_existentes.add(chave)
+                novas_transacoes.append({
+                    'carteira_id': chave[0],
+                    'ativo_id': chave[1],
+                    'data': chave[2],
+                    'tipo_operacao': chave[3],
+                    'quantidade': chave[4],
+                    'preco_unitario': chave[5],
+                })
+
+            # 5. Grava todas as novas transações com um único executemany
+            self.transacao_repo.inserir_em_lote(session, novas_transacoes)
+            if novas_transacoes or ativos_faltantes:
+                self.marcador_repo.incrementar(session, 'transacoes')
+
+        return {'imported': len(novas_transacoes), 'skipped': len(registros) - len(novas_transacoes)}
+
+    def _id_carteira_destino(self, session) -> int:
+        """Id da carteira que recebe novas transações (criada se ainda não existir)."""
+        nome = self.carteira or CARTEIRA_PADRAO
+        return self.carteira_repo.map_ids_por_nome(session, [nome], criar=True)[nome]
+
+    def _id_carteira_analisada(self, session) -> int | None:
+        """Id da carteira analisada, ou None para somar todas as carteiras."""
+        if self.carteira is None:
+            return None
+        # Uma carteira ainda sem transações não tem id: -1 não casa com nenhuma
+        return self.carteira_repo.map_ids_por_nome(session, [self.carteira]).get(self.carteira, -1)
+
+    def _marcador_dados(self, tabelas) -> tuple:
+        """
+        Monta o marcador de versão das tabelas das quais uma análise depende.
+        Usa os contadores de escrita, máximos (lidos direto dos índices) e
+        contagens. O COUNT(*) das transações e dos ativos percorre o menor índice
+        da tabela, então cresce com o número de linhas, embora seja bem mais
+        barato que a análise; o das cotações vem dos totais do dicionário de tickers.
+        """
+        marcador = []
+        with self.session_manager.get_session() as session:
+            # Contadores de escrita: pegam também as atualizações de linhas existentes
+            versoes = self.marcador_repo.get_versoes(session)
+            marcador.append(tuple(versoes.get(tabela, 0) for tabela in tabelas))
+            if 'transacoes' in tabelas:
+                marcador.append(self.transacao_repo.get_versao_dados(session))
+            if 'dados_historicos' in tabelas:
+                marcador.append(self.dado_historico_repo.get_versao_dados(session))
+                # A janela de volatilidade anda com o calendário, mesmo sem dados novos
+                marcador.append(datetime.date.today().isoformat())
+        return tuple(marcador)
+
+    @memoizar('transacoes')
     def calcular_portfolio_atual(self) -> List[PosicaoAtivo]:
         """
         Calcula a posição atual de cada ativo na carteira com base em todas as transações.
+        A agregação é feita no banco (GROUP BY), então o custo é de uma única consulta
+        independentemente do número de transações.
         """
         with self.session_manager.get_session() as session:
-            todas_as_transacoes = self.transacao_repo.list_all(session, limit=10000) # Limite alto
-            
-            # Dicionário para agregar os dados por ticker
-            posicoes: Dict[str, Dict] = {}
-
-            for transacao in todas_as_transacoes:
-                ticker = transacao.ativo.ticker
-                
-                # Se for a primeira vez que vemos este ticker, inicializa sua posição
-                if ticker not in posicoes:
-                    posicoes[ticker] = {
-                        "tipo_ativo": transacao.ativo.tipo,
-                        "quantidade_total": 0.0,
-                        "custo_total": 0.0
-                    }
-                
-                # Atualiza a posição com base no tipo de operação
-                if transacao.tipo_operacao == TipoOperacao.COMPRA:
-                    posicoes[ticker]["quantidade_total"] += transacao.quantidade
-                    posicoes[ticker]["custo_total"] += transacao.quantidade * transacao.preco_unitario
-                elif transacao.tipo_operacao == TipoOperacao.VENDA:
-                    # Simplificação: para vendas, apenas reduzimos a quantidade.
-                    # O cálculo de custo em vendas (preço médio, FIFO) pode ser complexo.
-                    # Por enquanto, focamos na posição atual.
-                    posicoes[ticker]["quantidade_total"] -= transacao.quantidade
-            
-            # Converte o dicionário de posições em uma lista de objetos PosicaoAtivo
-            portfolio_final = []
-            for ticker, dados in posicoes.items():
-                # Ignora ativos que foram totalmente vendidos
-                if dados["quantidade_total"] > 0.0001: 
-                    posicao = PosicaoAtivo(
-                        ticker=ticker,
-                        tipo_ativo=dados["tipo_ativo"],
-                        quantidade_total=dados["quantidade_total"],
-                        custo_total=dados["custo_total"],
-                    )
-                    portfolio_final.append(posicao)
-            
-            return portfolio_final
+            # Simplificação: para vendas, apenas reduzimos a quantidade.
+            # O cálculo de custo em vendas (preço médio, FIFO) pode ser complexo.
+            # Por enquanto, focamos na posição atual.
+            posicoes = self.transacao_repo.agregar_posicoes(session, carteira_id=self._id_carteira_analisada(session))
+
+            # Converte as linhas agregadas em uma lista de objetos PosicaoAtivo
+            return [
+                PosicaoAtivo(
+                    ticker=ticker,
+                    tipo_ativo=tipo_ativo,
+                    quantidade_total=quantidade_total,
+                    custo_total=custo_total,
+                )
+                for ticker, tipo_ativo, quantidade_total, custo_total in posicoes
+            ]
 
-    def importar_dados_historicos(self, dados: List[Dict]):
+    def importar_dados_historicos(self, dados: List[Dict], tamanho_lote: int = 50_000, atualizar: bool = True) -> Dict[str, int]:
         """
         Importa uma lista de dados históricos para o banco.
         'dados' deve ser uma lista de dicionários, ex:
         [{'ticker': 'BOVA11', 'data': '2025-07-10', 'preco_fechamento': 120.50}]
+        Usa upsert em massa: pares (ticker, data) já existentes são atualizados
+        (ou mantidos, com 'atualizar=False') em vez de desfazer a importação.
+        Preços que não podem ser gravados (ex: que arredondam para zero) são
+        rejeitados e contados à parte.
+        Retorna as contagens de 'inserted', 'updated', 'skipped' e 'rejected'.
         """
+        # Tuplas simples são bem mais baratas que um objeto ORM por linha
+        tuplas = [
+            (registro['ticker'], str(registro['data']), float(registro['preco_fechamento']))
+            for registro in dados
+        ]
+        # Data mais antiga gravada por ticker, para decidir como atualizar as volatilidades
+        menores_datas: Dict[str, str] = {}
+        for ticker, data, _ in tuplas:
+            if data < menores_datas.get(ticker, '9999-12-31'):
+                menores_datas[ticker] = data
+
         with self.session_manager.get_session() as session:
             print(f"Importando {len(dados)} registros de dados históricos...")
-            for registro in dados:
-                # O ideal aqui seria verificar se o registro já não existe para não duplicar
-                # mas nossa UniqueConstraint no modelo já nos protege de duplicatas exatas.
-                dado_historico = DadoHistorico(
-                    ticker=registro['ticker'],
-                    data=datetime.date.fromisoformat(registro['data']),
-                    preco_fechamento=registro['preco_fechamento']
-                )
-                self.dado_historico_repo.add(session, dado_historico)
-            print("Importação concluída.")
+            contagem = self.dado_historico_repo.upsert_em_lote(session, tuplas, tamanho_lote, atualizar)
+            if contagem['inserted'] or contagem['updated']:
+                self.marcador_repo.incrementar(session, 'dados_historicos')
+            self.volatilidade.atualizar(
+                session, {ticker: datetime.date.fromisoformat(data) for ticker, data in menores_datas.items()}
+            )
+            print(
+                f"Importação concluída: {contagem['inserted']} inseridos, "
+                f"{contagem['updated']} atualizados, {contagem['skipped']} sem alteração."
+            )
+            if contagem['rejected']:
+                print(f"⚠️ {contagem['rejected']} registros rejeitados: preço inválido ou abaixo da precisão gravada.")
             # Commit é feito automaticamente ao sair do 'with'
+        return contagem
     
     def get_all_asset_tickers(self) -> List[str]:
         """Busca e retorna uma lista com os tickers de todos os ativos cadastrados."""
@@ -188,69 +363,232 @@ class PortfolioService:
             resultados = session.query(Ativo.ticker).all()
             return [ticker for (ticker,) in resultados]
         
+    def get_ultimas_datas_historico(self) -> Dict[str, datetime.date]:
+        """Retorna a data da cotação mais recente já gravada para cada ticker."""
+        with self.session_manager.get_session() as session:
+            return self.dado_historico_repo.get_ultimas_datas(session)
+
+    def atualizar_cache_precos(self, reconstruir: bool = False):
+        """Sincroniza o cache em disco da matriz de preços, se houver um configurado."""
+        if self.cache_precos is None:
+            return
+        with self.session_manager.get_session() as session:
+            metadados = self.cache_precos.atualizar(session, self.dado_historico_repo, reconstruir=reconstruir)
+        print(f"Cache de preços atualizado: {metadados['n_datas']} datas x {len(metadados['tickers'])} tickers.")
+
+    def _carregar_precos(self, session, tickers: List[str], data_inicial: datetime.date | None) -> pd.DataFrame:
+        """
+        Retorna a matriz de fechamentos dos tickers a partir de 'data_inicial'
+        (None = todo o histórico).
+        Usa o cache em disco quando configurado; senão, lê direto do banco.
+        """
+        import pandas as pd
+        from .precos import carregar_matriz_precos
+
+        if self.cache_precos is None:
+            return carregar_matriz_precos(session, self.dado_historico_repo, tickers, data_inicial)
+
+        matriz = self.cache_precos.abrir(session, self.dado_historico_repo)
+        if matriz.empty:
+            return matriz
+        colunas = matriz.columns.intersection([ticker.upper() for ticker in tickers])
+        if data_inicial is not None:
+            matriz = matriz.loc[matriz.index >= pd.Timestamp(data_inicial)]
+        janela = matriz.loc[:, colunas]
+        # Descarta as datas em que nenhum dos tickers pedidos teve cotação
+        return janela.dropna(how='all')
+
+    @memoizar('transacoes', 'dados_historicos')
+    def calcular_historico_carteira(self, data_inicial: datetime.date | None = None) -> HistoricoCarteira | None:
+        """
+        Calcula o valor diário da carteira desde 'data_inicial' (padrão: a primeira
+        transação), com os fluxos de caixa e os retornos ponderados pelo tempo (TWR)
+        e pelo dinheiro (MWR). São duas consultas (movimentos e matriz de preços);
+        o restante é feito sobre matrizes (ver `calcular_historico`).
+        """
+        from .historico import calcular_historico
+
+        with self.session_manager.get_session() as session:
+            movimentos = self.transacao_repo.find_movimentos(session, self._id_carteira_analisada(session))
+            if not movimentos:
+                return None
+            tickers = sorted({ticker.upper() for ticker, _, _, _ in movimentos})
+            inicio = data_inicial or datetime.date.fromisoformat(movimentos[0][1])
+            precos = self._carregar_precos(session, tickers, inicio)
+        return calcular_historico(movimentos, precos)
+
+    def projetar_monte_carlo(
+        self,
+        horizonte_dias: int = 252,
+        n_caminhos: int = 10_000,
+        metodo: str = "bootstrap",
+        processos: int | None = 1,
+        semente: int | None = None,
+        **opcoes,
+    ) -> ResultadoMonteCarlo | None:
+        """
+        Projeta o valor das posições atuais com Monte Carlo (ver `simular_monte_carlo`),
+        a partir dos log-retornos diários da mesma janela usada nas volatilidades.
+        Dias em que algum ativo ainda não tinha cotação ficam de fora da amostra.
+        """
+        import numpy as np
+        from .monte_carlo import simular_monte_carlo
+
+        portfolio = [ativo for ativo in self.get_market_value_portfolio() if ativo['valor_mercado'] > 0]
+        if not portfolio:
+            return None
+
+        with self.session_manager.get_session() as session:
+            precos = self._carregar_precos(
+                session, [ativo['ticker'] for ativo in portfolio], self.volatilidade.data_limite()
+            )
+        if precos.empty:
+            return None
+
+        # Log-retornos com preços repetidos nos dias sem cotação
+        retornos = np.log(precos.ffill()).diff().dropna()
+        valores = {ativo['ticker'].upper(): ativo['valor_mercado'] for ativo in portfolio}
+        return simular_monte_carlo(
+            retornos.to_numpy(),
+            np.array([valores[ticker] for ticker in retornos.columns]),
+            horizonte_dias=horizonte_dias,
+            n_caminhos=n_caminhos,
+            metodo=metodo,
+            processos=processos,
+            semente=semente,
+            **opcoes,
+        )
+
+    def executar_backtest(
+        self,
+        configuracoes: List[ConfiguracaoBacktest],
+        processos: int | None = None,
+        data_inicial: datetime.date | None = None,
+    ) -> List[ResultadoBacktest]:
+        """
+        Testa a regra de rebalanceamento por faixas sobre o histórico de cotações,
+        para cada configuração (ver `executar_grade`). O universo são os ativos
+        da carteira atual e cada classe mantém o seu peso atual no valor total.
+        """
+        import numpy as np
+        import pandas as pd
+        from .backtest import executar_grade
+
+        portfolio = [ativo for ativo in self.get_market_value_portfolio() if ativo['valor_mercado'] > 0]
+        if not portfolio or not configuracoes:
+            return []
+
+        with self.session_manager.get_session() as session:
+            precos = self._carregar_precos(session, [ativo['ticker'] for ativo in portfolio], data_inicial)
+        if precos.empty:
+            return []
+
+        # Classe de cada coluna da matriz e peso atual de cada classe
+        por_ticker = {ativo['ticker'].upper(): ativo for ativo in portfolio}
+        classes = [por_ticker[ticker]['tipo_ativo'] for ticker in precos.columns]
+        codigo_classe, _ = pd.factorize(pd.Series([classe.value for classe in classes]))
+        valor_por_classe = np.bincount(
+            codigo_classe, weights=[por_ticker[ticker]['valor_mercado'] for ticker in precos.columns]
+        )
+        pesos_classes = valor_por_classe / valor_por_classe.sum()
+
+        return executar_grade(
+            precos.to_numpy(), precos.index.values, codigo_classe, pesos_classes, configuracoes, processos
+        )
+
+    @memoizar('transacoes', 'dados_historicos')
     def get_market_value_portfolio(self) -> List[Dict]:
         """
         Calcula a posição atual da carteira e enriquece com o valor de mercado atual.
         Retorna uma lista de dicionários com todos os dados.
+        São apenas duas consultas ao todo: posições e últimas cotações.
         """
         posicoes_custo = self.calcular_portfolio_atual()
         portfolio_valor_mercado = []
 
         with self.session_manager.get_session() as session:
-            for posicao in posicoes_custo:
-                # Busca o preço mais recente no nosso banco de dados
-                dado_recente = self.dado_historico_repo.get_latest_price(session, posicao.ticker)
-
-                preco_atual = dado_recente.preco_fechamento if dado_recente else 0
-                valor_mercado = posicao.quantidade_total * preco_atual
-
-                portfolio_valor_mercado.append({
-                    "ticker": posicao.ticker,
-                    "tipo_ativo": posicao.tipo_ativo,
-                    "quantidade": posicao.quantidade_total,
-                    "preco_medio_custo": posicao.preco_medio,
-                    "custo_total": posicao.custo_total,
-                    "preco_atual": preco_atual,
-                    "valor_mercado": valor_mercado,
-                    "data_ultima_cotacao": dado_recente.data if dado_recente else None
-                })
+            # Busca de uma só vez o preço mais recente de todos os ativos
+            ultimos_precos = self.dado_historico_repo.get_latest_prices(
+                session, [posicao.ticker for posicao in posicoes_custo]
+            )
+
+        for posicao in posicoes_custo:
+            preco_atual, data_ultima_cotacao = ultimos_precos.get(posicao.ticker.upper(), (0, None))
+            valor_mercado = posicao.quantidade_total * preco_atual
+
+            portfolio_valor_mercado.append({
+                "ticker": posicao.ticker,
+                "tipo_ativo": posicao.tipo_ativo,
+                "quantidade": posicao.quantidade_total,
+                "preco_medio_custo": posicao.preco_medio,
+                "custo_total": posicao.custo_total,
+                "preco_atual": preco_atual,
+                "valor_mercado": valor_mercado,
+                "data_ultima_cotacao": data_ultima_cotacao
+            })
 
         return portfolio_valor_mercado
+
+    @memoizar('transacoes', 'dados_historicos')
+    def calcular_distribuicao(self) -> dict:
+        """
+        Distribuição da carteira por valor de mercado: o valor de cada classe e,
+        dentro dela, o peso de cada ativo na carteira e na classe. As classes
+        e os ativos vêm em ordem decrescente de valor.
+        """
+        portfolio = self.get_market_value_portfolio()
+        valor_total = sum(ativo['valor_mercado'] for ativo in portfolio)
+        if valor_total == 0:
+            return {}
+
+        classes: Dict[str, List[Dict]] = {}
+        for ativo in sorted(portfolio, key=lambda a: a['valor_mercado'], reverse=True):
+            classes.setdefault(ativo['tipo_ativo'].value, []).append(ativo)
+
+        distribuicao = []
+        for classe, ativos in classes.items():
+            subtotal = sum(ativo['valor_mercado'] for ativo in ativos)
+            for ativo in ativos:
+                ativo['alocacao_carteira'] = ativo['valor_mercado'] / valor_total
+                ativo['alocacao_classe'] = ativo['valor_mercado'] / subtotal if subtotal > 0 else 0.0
+            distribuicao.append({
+                "classe": classe,
+                "valor_mercado": subtotal,
+                "alocacao": subtotal / valor_total,
+                "ativos": ativos,
+            })
+        distribuicao.sort(key=lambda c: c['valor_mercado'], reverse=True)
+        return {"valor_total": valor_total, "classes": distribuicao}
     
+    @memoizar('transacoes', 'dados_historicos')
     def calcular_alocacao_risk_parity_por_classe(self) -> dict:
         """
         Calcula a alocação de paridade de risco (Risk Parity) para cada classe de ativo.
         A análise é baseada na volatilidade dos últimos 2 anos.
         """
+        import pandas as pd
+
         with self.session_manager.get_session() as session:
-            # 1. Busca todos os dados necessários do banco
-            historico_query = session.query(DadoHistorico).all()
-            ativos_query = session.query(Ativo).all()
+            # 1. Busca os ativos cadastrados
+            ativos = session.query(Ativo.ticker, Ativo.tipo).all()
 
-            if not historico_query or not ativos_query:
+            # 2. Lê as volatilidades anualizadas já mantidas pelo estado incremental
+            # (desvio padrão dos retornos diários da janela * raiz de 252)
+            volatilidades = pd.Series(
+                self.volatilidade.volatilidades(session, [ticker for ticker, _ in ativos]), dtype=float
+            )
+
+            if volatilidades.empty or not ativos:
                 print("⚠️ Dados históricos ou de ativos insuficientes para a análise.")
                 return {}
 
-            # 2. Converte os dados para DataFrames do Pandas para facilitar a análise
-            df_historico = pd.DataFrame([h.__dict__ for h in historico_query])
-            df_ativos = pd.DataFrame([a.__dict__ for a in ativos_query])
-            df_ativos['tipo'] = df_ativos['tipo'].apply(lambda x: x.value)
-
-            # 3. Prepara a matriz de preços: tickers nas colunas, datas como índice
-            df_precos = df_historico.pivot(index='data', columns='ticker', values='preco_fechamento')
-
-            # 4. Calcula os retornos diários
-            df_retornos = df_precos.pct_change().dropna()
-
-            # 5. Calcula a volatilidade anualizada (desvio padrão dos retornos * raiz de 252)
-            # 252 é o número aproximado de dias de pregão em um ano.
-            volatilidades = df_retornos.std() * np.sqrt(252)
-
-            # 6. Agrupa os tickers pela sua classe (tipo)
-            tickers_por_classe = df_ativos.groupby('tipo')['ticker'].apply(list).to_dict()
+            # 3. Agrupa os tickers pela sua classe (tipo), em ordem alfabética de classe
+            tickers_por_classe: Dict[str, List[str]] = {}
+            for ticker, tipo in sorted(ativos, key=lambda ativo: ativo[1].value):
+                tickers_por_classe.setdefault(tipo.value, []).append(ticker)
 
             resultado_final = {}
-            # 7. Calcula o Risk Parity para cada classe de ativo
+            # 4. Calcula o Risk Parity para cada classe de ativo
             for classe, tickers_na_classe in tickers_por_classe.items():
                 # Filtra as volatilidades apenas para os ativos desta classe
                 vol_classe = volatilidades.reindex(tickers_na_classe).dropna()
@@ -281,11 +619,73 @@ class PortfolioService:
 
             return resultado_final
         
+    def calcular_alocacao_erc(self, por_classe: bool = True) -> Dict[str, ResultadoERC]:
+        """
+        Calcula a alocação de Contribuição de Risco Igual (ERC) a partir da matriz
+        de covariância dos retornos dos últimos 2 anos, considerando as correlações.
+        Com 'por_classe=True' resolve um problema por classe de ativo; senão, um
+        único problema para a carteira inteira (chave 'Carteira').
+        Cada chamada parte da solução anterior do mesmo grupo, quando existir.
+        """
+        import pandas as pd
+        from .risk_parity import calcular_pesos_erc
+
+        with self.session_manager.get_session() as session:
+            # 1. Busca os ativos e a matriz de preços da janela
+            ativos = session.query(Ativo.ticker, Ativo.tipo).all()
+            data_inicial = datetime.date.today() - datetime.timedelta(days=JANELA_VOLATILIDADE_DIAS)
+            df_precos = self._carregar_precos(session, [ticker for ticker, _ in ativos], data_inicial)
+
+        if df_precos.empty or not ativos:
+            print("⚠️ Dados históricos ou de ativos insuficientes para a análise.")
+            return {}
+
+        # 2. Monta os grupos: uma entrada por classe ou a carteira inteira
+        grupos: Dict[str, List[str]] = {}
+        for ticker, tipo in sorted(ativos, key=lambda ativo: ativo[1].value):
+            grupos.setdefault(tipo.value if por_classe else "Carteira", []).append(ticker)
+
+        resultado_final = {}
+        for grupo, tickers in grupos.items():
+            # 3. Ativos com histórico curto na janela esvaziariam as datas comuns ao grupo
+            colunas = df_precos.columns.intersection(tickers)
+            df_retornos = df_precos[colunas].pct_change(fill_method=None)
+            observacoes = df_retornos.count()
+            curtos = observacoes.index[observacoes < observacoes.max() * FRACAO_MINIMA_HISTORICO_ERC]
+            if len(curtos):
+                print(f"⚠️ {grupo}: {', '.join(curtos)} sem histórico suficiente na janela, fora do ERC.")
+                colunas = colunas.difference(curtos, sort=False)
+
+            # 4. Covariância anualizada dos retornos diários nas datas comuns aos demais
+            df_retornos = df_retornos[colunas].dropna()
+            if df_retornos.empty:
+                print(f"⚠️ {grupo}: sem datas com retornos de todos os ativos, ERC não calculado.")
+                continue
+            covariancia = df_retornos.cov().to_numpy() * 252
+
+            # 5. Parte da solução anterior, alinhada aos tickers atuais
+            with self._trava_erc:
+                pesos_anteriores = self._pesos_erc.get(grupo)
+            pesos_iniciais = None
+            if pesos_anteriores is not None:
+                alinhados = pesos_anteriores.reindex(colunas)
+                pesos_iniciais = alinhados.fillna(alinhados.mean()).to_numpy()
+
+            resultado = calcular_pesos_erc(covariancia, list(colunas), pesos_iniciais)
+            with self._trava_erc:
+                self._pesos_erc[grupo] = pd.Series(resultado.pesos, index=colunas)
+            resultado_final[grupo] = resultado
+
+        return resultado_final
+        
+    @memoizar('transacoes', 'dados_historicos')
     def gerar_analise_consolidada(self) -> dict:
         """
         Combina a análise de portfólio atual (valor de mercado) com a análise
         de Risk Parity, retornando uma estrutura de dados completa para o relatório.
         """
+        import pandas as pd
+
         # 1. Busca as duas análises que já temos
         portfolio_atual = self.get_market_value_portfolio()
         analise_rp = self.calcular_alocacao_risk_parity_por_classe()
@@ -323,131 +723,218 @@ class PortfolioService:
 
         return resultado_final
     
-    def gerar_plano_rebalanceamento_capital_neutro(self) -> dict:
+    def gerar_plano_rebalanceamento_capital_neutro(self, faixa_tolerancia: float | None = None) -> PlanoRebalanceamento:
         """
         Gera um plano de rebalanceamento com capital neutro, com uma lógica explícita
         de separação entre ativos de Venda, Compra e Neutro.
+        O cálculo é feito sobre vetores alinhados (ver `planejar_rebalanceamento`)
+        e a análise consolidada não é alterada. Sem 'faixa_tolerancia', usa
+        FAIXA_TOLERANCIA.
         """
+        import numpy as np
+        from .planejamento import (
+            FAIXA_TOLERANCIA,
+            RECOMENDACOES,
+            ItemPlano,
+            PlanoRebalanceamento,
+            planejar_rebalanceamento,
+        )
+
+        if faixa_tolerancia is None:
+            faixa_tolerancia = FAIXA_TOLERANCIA
         analise_bruta = self.gerar_analise_consolidada()
         if not analise_bruta:
-            return {}
-
-        ativos_venda = []
-        ativos_compra_candidatos = []
-        ativos_neutros = []
-        
-        # --- FASE 1: Classificar explicitamente cada ativo ---
-        for classe, ativos in analise_bruta.items():
-            subtotal_classe = sum(ativo['valor_mercado'] for ativo in ativos)
-            for ativo in ativos:
-                aloc_atual_pct = ativo['alocacao_atual_na_classe'] * 100
-                aloc_sugerida_pct = ativo['alocacao_sugerida'] * 100
-                faixa_max_pct = aloc_sugerida_pct * 1.20
-                faixa_min_pct = aloc_sugerida_pct * 0.80
-
-                if aloc_atual_pct > faixa_max_pct:
-                    # É uma ordem de venda
-                    percentual_excedente = aloc_atual_pct - faixa_max_pct
-                    ativo['valor_a_movimentar'] = (percentual_excedente / 100) * subtotal_classe
-                    ativo['recomendacao'] = "Vender"
-                    ativos_venda.append(ativo)
-                elif aloc_atual_pct < faixa_min_pct:
-                    # É um candidato à compra
-                    ativo['valor_a_movimentar'] = 0 # Valor será calculado depois
-                    ativo['recomendacao'] = "Comprar"
-                    ativos_compra_candidatos.append(ativo)
-                else:
-                    # É uma posição neutra
-                    ativo['valor_a_movimentar'] = 0
-                    ativo['recomendacao'] = "Neutro"
-                    ativos_neutros.append(ativo)
-
-        # --- FASE 2: Calcular o caixa total gerado pelas vendas ---
-        caixa_gerado_pelas_vendas = sum(ativo['valor_a_movimentar'] for ativo in ativos_venda)
-
-        # --- FASE 3: Distribuir o caixa entre os candidatos à compra ---
-        if caixa_gerado_pelas_vendas > 0 and ativos_compra_candidatos:
-            # Calcula o "gap" total de compra
-            gap_total_compra = 0
-            for ativo in ativos_compra_candidatos:
-                subtotal_classe_ativo = sum(p['valor_mercado'] for p in analise_bruta[ativo['tipo']])
-                aloc_atual_pct = ativo['alocacao_atual_na_classe'] * 100
-                aloc_sugerida_pct = ativo['alocacao_sugerida'] * 100
-                faixa_min_pct = aloc_sugerida_pct * 0.80
-                ativo['gap_compra'] = (faixa_min_pct - aloc_atual_pct) / 100 * subtotal_classe_ativo
-                gap_total_compra += ativo['gap_compra']
-            
-            # Distribui o caixa proporcionalmente
-            if gap_total_compra > 0:
-                for ativo in ativos_compra_candidatos:
-                    proporcao = ativo['gap_compra'] / gap_total_compra
-                    valor_compra = caixa_gerado_pelas_vendas * proporcao
-                    
-                    if valor_compra < ativo['preco_atual']:
-                        ativo['recomendacao'] = "Neutro (Valor Insuf.)"
-                        ativos_neutros.append(ativo) # Move da lista de compra para neutro
-                    else:
-                        ativo['valor_a_movimentar'] = valor_compra
-            # Remove os ativos que se tornaram neutros da lista de compra
-            ativos_compra_candidatos = [a for a in ativos_compra_candidatos if a['recomendacao'] == "Comprar"]
-
-        # --- FASE 4: Reagrupar tudo para o relatório final ---
-        plano_final = {}
-        todos_os_ativos = ativos_venda + ativos_compra_candidatos + ativos_neutros
-        for ativo in todos_os_ativos:
-            classe = ativo['tipo']
-            if classe not in plano_final:
-                plano_final[classe] = []
-            plano_final[classe].append(ativo)
-
-        return plano_final
+            return PlanoRebalanceamento(faixa_tolerancia=faixa_tolerancia)
+
+        # --- FASE 1: Alinha os dados da análise em vetores, um elemento por ativo ---
+        ativos = [ativo for ativos_classe in analise_bruta.values() for ativo in ativos_classe]
+        nomes_classes = list(analise_bruta)
+        codigo_classe = np.repeat(np.arange(len(nomes_classes)), [len(a) for a in analise_bruta.values()])
+        valor_mercado = np.array([ativo['valor_mercado'] for ativo in ativos], dtype=float)
+        alocacao_sugerida = np.array([ativo['alocacao_sugerida'] for ativo in ativos], dtype=float)
+        preco_atual = np.array([ativo['preco_atual'] for ativo in ativos], dtype=float)
+
+        # --- FASE 2: Classifica, vende o excedente e distribui o caixa (vetorizado) ---
+        alocacao_atual, recomendacao, valor_a_movimentar = planejar_rebalanceamento(
+            codigo_classe, valor_mercado, alocacao_sugerida, preco_atual, faixa_tolerancia
+        )
+
+        # --- FASE 3: Monta o plano imutável: por classe, Vender, Comprar e Neutro ---
+        ordem = np.lexsort((recomendacao, codigo_classe))
+        itens = tuple(
+            ItemPlano(
+                ticker=ativos[i]['ticker'],
+                tipo=nomes_classes[codigo_classe[i]],
+                tipo_ativo=ativos[i]['tipo_ativo'],
+                preco_atual=float(preco_atual[i]),
+                valor_mercado=float(valor_mercado[i]),
+                alocacao_atual_na_classe=float(alocacao_atual[i]),
+                alocacao_sugerida=float(alocacao_sugerida[i]),
+                recomendacao=RECOMENDACOES[recomendacao[i]],
+                valor_a_movimentar=float(valor_a_movimentar[i]),
+            )
+            for i in ordem
+        )
+        return PlanoRebalanceamento(itens=itens, faixa_tolerancia=faixa_tolerancia)
     
-    def gerar_plano_de_aporte(self, valor_aporte: float) -> dict:
+    @memoizar('transacoes', 'dados_historicos')
+    def analisar_carteiras(
+        self, nomes: List[str] | None = None, faixa_tolerancia: float | None = None
+    ) -> AnaliseCarteiras | None:
         """
-        Gera um plano de alocação para um novo aporte em dinheiro, priorizando
-        as compras dos ativos mais subalocados sem gerar vendas.
+        Analisa várias carteiras (padrão: todas) de uma só vez: valor de mercado,
+        volatilidade, alvos de Risk Parity e plano de rebalanceamento de cada uma.
+        Posições, cotações, volatilidades e covariância são lidas uma única vez
+        para a união dos ativos; o restante é vetorizado (ver `analisar_carteiras_em_lote`).
+        Sem 'faixa_tolerancia', usa FAIXA_TOLERANCIA.
         """
+        import numpy as np
+        import pandas as pd
+        from .carteiras import analisar_carteiras_em_lote
+        from .planejamento import FAIXA_TOLERANCIA
+
+        with self.session_manager.get_session() as session:
+            # 1. Carteiras pedidas e posições de todas elas em um único GROUP BY
+            carteiras = self.carteira_repo.list_nomes(session)
+            if nomes is not None:
+                carteiras = {id_: nome for id_, nome in carteiras.items() if nome in set(nomes)}
+            linhas = self.transacao_repo.agregar_posicoes_por_carteira(session, carteiras)
+            if not linhas:
+                return None
+
+            # 2. União dos ativos e dados de mercado compartilhados entre as carteiras
+            tipos_por_ticker = {ticker.upper(): tipo for _, ticker, tipo, _ in linhas}
+            tickers = sorted(tipos_por_ticker)
+            ultimos_precos = self.dado_historico_repo.get_latest_prices(session, tickers)
+            volatilidades = pd.Series(self.volatilidade.volatilidades(session, tickers), dtype=float)
+            precos = self._carregar_precos(session, tickers, self.volatilidade.data_limite())
+
+        # 3. Covariância anualizada dos retornos diários (pares sem dados valem zero)
+        covariancia = (
+            precos.ffill().pct_change(fill_method=None).cov().reindex(index=tickers, columns=tickers).fillna(0.0) * 252
+        ).to_numpy()
+
+        ids = list(carteiras)
+        indice_carteira = {id_: i for i, id_ in enumerate(ids)}
+        indice_ativo = {ticker: i for i, ticker in enumerate(tickers)}
+        return analisar_carteiras_em_lote(
+            [carteiras[id_] for id_ in ids],
+            [(indice_carteira[id_], indice_ativo[ticker.upper()], qtd) for id_, ticker, _, qtd in linhas],
+            tickers,
+            [tipos_por_ticker[ticker] for ticker in tickers],
+            np.array([ultimos_precos.get(ticker, (0, None))[0] for ticker in tickers], dtype=float),
+            volatilidades.reindex(tickers).fillna(0.0).to_numpy(),
+            covariancia,
+            FAIXA_TOLERANCIA if faixa_tolerancia is None else faixa_tolerancia,
+        )
+
+    def gerar_plano_de_aporte(self, valor_aporte: float, lotes: Dict[TipoAtivo, int] | None = None) -> dict:
+        """
+        Gera um plano de alocação para um novo aporte em dinheiro, sem gerar vendas.
+        As compras já saem em lotes inteiros ('lotes' define o tamanho do lote por
+        TipoAtivo; padrão 1) e são escolhidas para deixar cada ativo o mais perto
+        possível do seu alvo de Risk Parity (ver `alocar_aporte_em_lotes`).
+        """
+        import numpy as np
+        from .aporte import LOTES_PADRAO, alocar_aporte_em_lotes
+
         analise_bruta = self.gerar_analise_consolidada()
         if not analise_bruta:
             return {}
 
-        ativos_compra_candidatos = []
-        
-        # --- FASE 1: Identificar todos os candidatos à compra ---
-        for classe, ativos in analise_bruta.items():
-            for ativo in ativos:
-                aloc_atual_pct = ativo['alocacao_atual_na_classe'] * 100
-                aloc_sugerida_pct = ativo['alocacao_sugerida'] * 100
-                faixa_min_pct = aloc_sugerida_pct * 0.80
-
-                if aloc_atual_pct < faixa_min_pct:
-                    # Calcula o "gap" monetário para atingir o alvo mínimo
-                    subtotal_classe = sum(p['valor_mercado'] for p in analise_bruta[classe])
-                    gap_percentual = faixa_min_pct - aloc_atual_pct
-                    ativo['valor_necessario'] = (gap_percentual / 100) * subtotal_classe
-                    ativos_compra_candidatos.append(ativo)
-        
-        # --- FASE 2: Alocação em Cascata do Aporte ---
-        # Ordena os candidatos pelo maior "gap" (mais necessitado primeiro)
-        ativos_compra_candidatos.sort(key=lambda x: x['valor_necessario'], reverse=True)
-
-        caixa_disponivel = valor_aporte
-        ordens_de_compra = []
+        # --- FASE 1: Quanto falta (em R$) para cada ativo atingir o seu alvo ---
+        ativos = [ativo for ativos_classe in analise_bruta.values() for ativo in ativos_classe]
+        tamanhos_lote = {**LOTES_PADRAO, **(lotes or {})}
+        _, _, necessidades, custos = self._vetores_aporte(analise_bruta, tamanhos_lote)
 
-        for ativo in ativos_compra_candidatos:
-            if caixa_disponivel < 0.01:
-                break # Dinheiro do aporte acabou
+        # --- FASE 2: Escolhe o número de lotes de cada ativo ---
+        resultado = alocar_aporte_em_lotes(necessidades, custos, valor_aporte)
 
-            # O valor a comprar é o menor entre o caixa que temos e o que o ativo "precisa"
-            valor_a_comprar = min(caixa_disponivel, ativo['valor_necessario'])
+        ordens_de_compra = []
+        for indice in np.argsort(-resultado.valores, kind='stable'):
+            if resultado.lotes[indice] == 0:
+                continue
+            ativo = ativos[indice]
+            ativo['lote'] = tamanhos_lote.get(ativo['tipo_ativo'], 1)
+            # 'quantidade' continua sendo a posição atual; a compra vai à parte
+            ativo['quantidade_a_comprar'] = int(resultado.lotes[indice]) * ativo['lote']
+            ativo['valor_a_movimentar'] = float(resultado.valores[indice])
+            ordens_de_compra.append(ativo)
 
-            if valor_a_comprar >= ativo['preco_atual']:
-                # Atualiza o valor final a ser movimentado e o caixa restante
-                ativo['valor_a_movimentar'] = valor_a_comprar
-                caixa_disponivel -= valor_a_comprar
-                ordens_de_compra.append(ativo)
-        
         return {
             "ordens_de_compra": ordens_de_compra,
-            "caixa_restante": caixa_disponivel
+            "caixa_restante": resultado.caixa_restante,
+            "otimo": resultado.otimo,
+            "tempo_ms": resultado.tempo_ms,
         }
+
+    def simular_aportes(
+        self,
+        valores_aporte: List[float],
+        lotes: Dict[TipoAtivo, int] | None = None,
+        refinar: bool = False,
+    ) -> CenariosAporte | None:
+        """
+        Simula o plano de aporte para vários valores de uma vez, sobre uma única
+        análise consolidada. Retorna os lotes comprados, o caixa restante e os
+        pesos de cada ativo na sua classe depois de cada aporte.
+        Sem 'refinar', os planos usam a solução gulosa em lotes (sem o
+        branch-and-bound de `gerar_plano_de_aporte`), calculada para todos os
+        valores numa única passada vetorizada.
+        """
+        import numpy as np
+        from .aporte import LOTES_PADRAO, CenariosAporte, simular_aportes_em_lotes
+
+        inicio = time.perf_counter()
+        analise_bruta = self.gerar_analise_consolidada()
+        if not analise_bruta:
+            return None
+
+        # 1. Vetores alinhados da análise, montados uma única vez
+        ativos = [ativo for ativos_classe in analise_bruta.values() for ativo in ativos_classe]
+        tamanhos_lote = {**LOTES_PADRAO, **(lotes or {})}
+        codigo_classe, valor_mercado, necessidades, custos = self._vetores_aporte(analise_bruta, tamanhos_lote)
+        alocacao_sugerida = np.array([ativo['alocacao_sugerida'] for ativo in ativos], dtype=float)
+        valores_aporte = np.asarray(valores_aporte, dtype=float)
+
+        # 2. Lotes de todos os cenários (uma linha por valor de aporte)
+        lotes_comprados = simular_aportes_em_lotes(necessidades, custos, valores_aporte, refinar=refinar)
+        valores = lotes_comprados * custos
+
+        # 3. Pesos dentro da classe depois das compras, para todos os cenários
+        valor_final = valor_mercado[None, :] + valores
+        classes_uma_a_uma = np.eye(codigo_classe.max() + 1)[codigo_classe]
+        subtotal_final = (valor_final @ classes_uma_a_uma)[:, codigo_classe]
+        pesos = valor_final / subtotal_final
+        erro_medio = np.nanmean(np.abs(pesos - alocacao_sugerida[None, :]), axis=1)
+
+        return CenariosAporte(
+            valores_aporte=valores_aporte,
+            tickers=[ativo['ticker'] for ativo in ativos],
+            alocacao_sugerida=alocacao_sugerida,
+            lotes=lotes_comprados,
+            valores=valores,
+            caixa_restante=valores_aporte - valores.sum(axis=1),
+            pesos_pos_aporte=pesos,
+            erro_medio=erro_medio,
+            tempo_ms=(time.perf_counter() - inicio) * 1000,
+        )
+
+    def _vetores_aporte(self, analise_bruta: dict, tamanhos_lote: Dict[TipoAtivo, int]):
+        """
+        Alinha a análise consolidada em vetores (um elemento por ativo, na ordem
+        das classes): código da classe, valor de mercado, quanto falta em R$ para
+        o alvo de Risk Parity e custo de um lote.
+        """
+        import numpy as np
+        from .aporte import custos_por_lote
+
+        ativos = [ativo for ativos_classe in analise_bruta.values() for ativo in ativos_classe]
+        codigo_classe = np.repeat(np.arange(len(analise_bruta)), [len(a) for a in analise_bruta.values()])
+        valor_mercado = np.array([ativo['valor_mercado'] for ativo in ativos], dtype=float)
+        subtotal = np.bincount(codigo_classe, weights=valor_mercado)[codigo_classe]
+        alocacao_sugerida = np.array([ativo['alocacao_sugerida'] for ativo in ativos], dtype=float)
+        necessidades = alocacao_sugerida * subtotal - valor_mercado
+        precos = np.array([ativo['preco_atual'] for ativo in ativos], dtype=float)
+        custos = custos_por_lote(precos, [ativo['tipo_ativo'] for ativo in ativos], tamanhos_lote)
+        return codigo_classe, valor_mercado, necessidades, custos
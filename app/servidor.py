@@ -0,0 +1,258 @@
+# servidor.py
+
+import dataclasses
+import datetime
+import enum
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from db_nexus import DatabaseSessionManager
+from .cache import CacheAnalises
+from .planejamento import FAIXA_TOLERANCIA
+from .precos import CachePrecos
+from .services import PortfolioService
+
+# Intervalo padrão (em segundos) entre as verificações de mudança no banco
+INTERVALO_ATUALIZACAO = 5.0
+
+# Tabelas cujas mudanças disparam o reaquecimento das análises
+TABELAS_VIGIADAS = ('transacoes', 'dados_historicos')
+
+# --- Conversão para JSON ---
+
+def para_json(valor: Any) -> Any:
+    """
+    Converte os resultados do serviço (dataclasses, Enums, datas, tipos do
+    numpy) em estruturas aceitas pelo JSON. NaN e infinitos viram null.
+    """
+    if dataclasses.is_dataclass(valor) and not isinstance(valor, type):
+        return {campo.name: para_json(getattr(valor, campo.name)) for campo in dataclasses.fields(valor)}
+    if isinstance(valor, dict):
+        return {str(para_json(chave)): para_json(item) for chave, item in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [para_json(item) for item in valor]
+    if isinstance(valor, np.ndarray):
+        return para_json(valor.tolist())
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, enum.Enum):
+        return valor.value
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        return valor.isoformat()
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    return valor
+
+# --- Estado Aquecido ---
+
+class ServidorAnalises:
+    """
+    Mantém o gerenciador de sessão, a matriz de preços e as análises já
+    calculadas em memória, com um PortfolioService por carteira (todos
+    compartilham os mesmos caches).
+
+    Uma thread vigia o marcador de versão dos dados: quando o banco muda
+    (novas transações ou cotações), a matriz de preços é sincronizada de forma
+    incremental e as análises das carteiras já usadas são recalculadas antes
+    que alguém as peça.
+    """
+    def __init__(
+        self,
+        session_manager: DatabaseSessionManager,
+        cache_precos: CachePrecos | None = None,
+        cache: CacheAnalises | None = None,
+    ):
+        self.session_manager = session_manager
+        self.cache_precos = cache_precos or CachePrecos()
+        self.cache = cache or CacheAnalises()
+        self._servicos: Dict[str | None, PortfolioService] = {}
+        self._trava = threading.Lock()
+        self._parar = threading.Event()
+        self.marcador = None
+        self.iniciado_em = datetime.datetime.now()
+        self.atualizado_em: datetime.datetime | None = None
+        self.atualizacoes = 0
+
+    def servico(self, carteira: str | None = None) -> PortfolioService:
+        """Serviço da carteira pedida (None = todas), criado no primeiro uso."""
+        with self._trava:
+            if carteira not in self._servicos:
+                self._servicos[carteira] = PortfolioService(
+                    self.session_manager, cache_precos=self.cache_precos, cache=self.cache, carteira=carteira
+                )
+            return self._servicos[carteira]
+
+    def atualizar(self, forcar: bool = False) -> bool:
+        """
+        Verifica se os dados mudaram desde a última vez e, se sim, sincroniza a
+        matriz de preços e reaquece as análises. Retorna True se houve mudança.
+        """
+        principal = self.servico()
+        marcador = principal._marcador_dados(TABELAS_VIGIADAS)
+        if marcador == self.marcador and not forcar:
+            return False
+
+        # 1. Matriz de preços: acrescenta apenas os dias novos quando possível
+        with self.session_manager.get_session() as session:
+            self.cache_precos.abrir(session, principal.dado_historico_repo)
+
+        # 2. Recalcula as análises mais pedidas de cada carteira já usada
+        with self._trava:
+            servicos = list(self._servicos.values())
+        for servico in servicos:
+            servico.calcular_distribuicao()
+            servico.gerar_plano_rebalanceamento_capital_neutro()
+
+        self.marcador = marcador
+        self.atualizado_em = datetime.datetime.now()
+        self.atualizacoes += 1
+        return True
+
+    def vigiar(self, intervalo: float = INTERVALO_ATUALIZACAO) -> threading.Thread:
+        """Inicia a thread que chama `atualizar` a cada 'intervalo' segundos."""
+        def laco():
+            while not self._parar.wait(intervalo):
+                try:
+                    if self.atualizar():
+                        print(f"🔄 Dados alterados: análises recalculadas às {self.atualizado_em:%H:%M:%S}.")
+                except Exception as e:
+                    print(f"⚠️ Falha ao atualizar as análises: {e}")
+
+        thread = threading.Thread(target=laco, name="vigia-dados", daemon=True)
+        thread.start()
+        return thread
+
+    def parar(self):
+        self._parar.set()
+
+    def estado(self) -> dict:
+        with self._trava:
+            carteiras = list(self._servicos)
+        return {
+            "status": "ok",
+            "iniciado_em": self.iniciado_em,
+            "atualizado_em": self.atualizado_em,
+            "atualizacoes": self.atualizacoes,
+            "carteiras_aquecidas": [carteira or "(todas)" for carteira in carteiras],
+        }
+
+# --- Rotas ---
+
+def _parametro(parametros: dict, nome: str, conversor: Callable = str, padrao: Any = None) -> Any:
+    valores = parametros.get(nome)
+    if not valores:
+        return padrao
+    try:
+        return conversor(valores[0])
+    except ValueError:
+        raise ValueError(f"Parâmetro '{nome}' inválido: '{valores[0]}'.")
+
+def _sim_ou_nao(texto: str) -> bool:
+    return texto.strip().lower() in ("1", "true", "sim", "s", "yes")
+
+def _posicoes(servico: PortfolioService, parametros: dict):
+    return servico.get_market_value_portfolio()
+
+def _distribuicao(servico: PortfolioService, parametros: dict):
+    return servico.calcular_distribuicao()
+
+def _risk_parity(servico: PortfolioService, parametros: dict):
+    if _parametro(parametros, "erc", _sim_ou_nao, False):
+        por_classe = not _parametro(parametros, "carteira_inteira", _sim_ou_nao, False)
+        resultados = servico.calcular_alocacao_erc(por_classe=por_classe)
+        return {grupo: resultado.como_registros() for grupo, resultado in resultados.items()}
+    return servico.calcular_alocacao_risk_parity_por_classe()
+
+def _rebalanceamento(servico: PortfolioService, parametros: dict):
+    faixa = _parametro(parametros, "faixa", float, FAIXA_TOLERANCIA)
+    plano = servico.gerar_plano_rebalanceamento_capital_neutro(faixa)
+    return {
+        "faixa_tolerancia": plano.faixa_tolerancia,
+        "total_vendas": plano.total_vendas,
+        "total_compras": plano.total_compras,
+        "itens": plano.itens,
+    }
+
+def _aporte(servico: PortfolioService, parametros: dict):
+    valor = _parametro(parametros, "valor", float)
+    if valor is None or valor <= 0:
+        raise ValueError("Informe um 'valor' de aporte positivo.")
+    return servico.gerar_plano_de_aporte(valor)
+
+def _carteiras(servico: PortfolioService, parametros: dict):
+    faixa = _parametro(parametros, "faixa", float, FAIXA_TOLERANCIA)
+    analise = servico.analisar_carteiras(faixa_tolerancia=faixa)
+    return analise.como_registros() if analise is not None else []
+
+# Caminho -> função(serviço, parâmetros da URL)
+ROTAS: Dict[str, Callable[[PortfolioService, dict], Any]] = {
+    "/posicoes": _posicoes,
+    "/distribuicao": _distribuicao,
+    "/risk-parity": _risk_parity,
+    "/rebalanceamento": _rebalanceamento,
+    "/aporte": _aporte,
+    "/carteiras": _carteiras,
+}
+
+# --- Servidor HTTP ---
+
+class _TratadorRequisicoes(BaseHTTPRequestHandler):
+    """Atende GET nas ROTAS, GET /saude e POST /atualizar, sempre em JSON."""
+    server: "ServidorHTTP"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parametros = parse_qs(url.query)
+        analises = self.server.analises
+        if url.path == "/saude":
+            return self._responder(200, analises.estado())
+
+        rota = ROTAS.get(url.path)
+        if rota is None:
+            return self._responder(404, {"erro": f"Rota desconhecida: '{url.path}'.", "rotas": sorted(ROTAS)})
+
+        inicio = time.perf_counter()
+        try:
+            servico = analises.servico(_parametro(parametros, "carteira"))
+            dados = rota(servico, parametros)
+        except ValueError as e:
+            return self._responder(400, {"erro": str(e)})
+        except Exception as e:
+            return self._responder(500, {"erro": f"{type(e).__name__}: {e}"})
+        self._responder(200, {"dados": dados, "tempo_ms": (time.perf_counter() - inicio) * 1000})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/atualizar":
+            return self._responder(404, {"erro": f"Rota desconhecida: '{self.path}'."})
+        try:
+            alterado = self.server.analises.atualizar(forcar=True)
+        except Exception as e:
+            return self._responder(500, {"erro": f"{type(e).__name__}: {e}"})
+        self._responder(200, {"atualizado": alterado, **self.server.analises.estado()})
+
+    def _responder(self, status: int, corpo: Any):
+        conteudo = json.dumps(para_json(corpo), ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(conteudo)))
+        self.end_headers()
+        self.wfile.write(conteudo)
+
+    def log_message(self, formato, *args):
+        # Uma linha curta por requisição, sem o endereço do cliente
+        print(f"  {self.command} {self.path} -> {args[1] if len(args) > 1 else ''}")
+
+class ServidorHTTP(ThreadingHTTPServer):
+    """Servidor HTTP com uma thread por requisição, ligado a um ServidorAnalises."""
+    daemon_threads = True
+
+    def __init__(self, endereco, analises: ServidorAnalises):
+        super().__init__(endereco, _TratadorRequisicoes)
+        self.analises = analises
@@ -0,0 +1,210 @@
+# volatilidade.py
+
+import datetime
+import math
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .models import EstadoVolatilidade
+from .repositories import DadoHistoricoRepository, EstadoVolatilidadeRepository
+
+# 252 é o número aproximado de dias de pregão em um ano.
+DIAS_PREGAO_ANO = 252
+
+# Serializa as gravações do estado entre todos os motores do processo (o
+# servidor tem um PortfolioService, e um motor, por carteira)
+_TRAVA_ESTADO = threading.Lock()
+
+# Momentos de um conjunto de retornos: (contagem, média, M2 = soma dos quadrados dos desvios)
+Momentos = Tuple[int, float, float]
+
+# --- Funções de Momentos ---
+
+def _retornos(precos: List[float]) -> np.ndarray:
+    """Retornos diários simples entre fechamentos consecutivos."""
+    precos = np.asarray(precos, dtype=float)
+    return precos[1:] / precos[:-1] - 1
+
+def _momentos(retornos: np.ndarray) -> Momentos:
+    if len(retornos) == 0:
+        return 0, 0.0, 0.0
+    media = float(retornos.mean())
+    return len(retornos), media, float(((retornos - media) ** 2).sum())
+
+def _combinar(a: Momentos, b: Momentos) -> Momentos:
+    """Junta os momentos de dois conjuntos disjuntos (fórmula de Chan et al.)."""
+    n_a, media_a, m2_a = a
+    n_b, media_b, m2_b = b
+    n = n_a + n_b
+    if n == 0:
+        return 0, 0.0, 0.0
+    delta = media_b - media_a
+    media = media_a + delta * n_b / n
+    return n, media, m2_a + m2_b + delta * delta * n_a * n_b / n
+
+def _remover(total: Momentos, b: Momentos) -> Momentos:
+    """Operação inversa de `_combinar`: retira de 'total' um subconjunto 'b'."""
+    n, media, m2 = total
+    n_b, media_b, m2_b = b
+    n_a = n - n_b
+    if n_a <= 0:
+        return 0, 0.0, 0.0
+    media_a = (n * media - n_b * media_b) / n_a
+    delta = media_b - media_a
+    m2_a = m2 - m2_b - delta * delta * n_a * n_b / n
+    # Pequenos erros de arredondamento não podem gerar variância negativa
+    return n_a, media_a, max(m2_a, 0.0)
+
+def _finito(estado: EstadoVolatilidade) -> bool:
+    """Momentos com NaN (ex: preço zero na janela) não podem ser usados nem gravados."""
+    return math.isfinite(estado.media) and math.isfinite(estado.m2)
+
+# --- Motor Incremental ---
+
+class MotorVolatilidade:
+    """
+    Mantém, para cada ticker, os momentos dos retornos diários dentro de uma
+    janela móvel de 'janela_dias' dias corridos. Dias novos são somados ao
+    estado e dias que saem da janela são subtraídos, então a volatilidade de
+    um ticker é lida sem percorrer o seu histórico.
+    """
+    def __init__(
+        self,
+        janela_dias: int,
+        repo_precos: DadoHistoricoRepository | None = None,
+        repo_estado: EstadoVolatilidadeRepository | None = None,
+    ):
+        self.janela_dias = janela_dias
+        self.repo_precos = repo_precos or DadoHistoricoRepository()
+        self.repo_estado = repo_estado or EstadoVolatilidadeRepository()
+
+    def data_limite(self, hoje: datetime.date | None = None) -> datetime.date:
+        """Primeiro dia que ainda pertence à janela."""
+        return (hoje or datetime.date.today()) - datetime.timedelta(days=self.janela_dias)
+
+    def atualizar(
+        self,
+        session: Session,
+        menores_datas: Dict[str, datetime.date] | None = None,
+        tickers: Iterable[str] = (),
+        hoje: datetime.date | None = None,
+    ) -> None:
+        """
+        Atualiza e grava o estado dos tickers afetados (caminho da importação).
+        'menores_datas' informa, para cada ticker que recebeu cotações, a data
+        mais antiga gravada: se ela não for posterior ao último dia já
+        incorporado (correção ou preenchimento de dias antigos), o ticker é
+        recalculado; caso contrário apenas desliza a janela.
+        A gravação é um upsert por ticker, que não falha se outro processo
+        gravou o mesmo estado antes; estados sem cotações na janela ou com
+        momentos não finitos são removidos em vez de gravados.
+        """
+        menores_datas = menores_datas or {}
+        limite = self.data_limite(hoje)
+        afetados = {ticker.upper() for ticker in menores_datas} | {ticker.upper() for ticker in tickers}
+        with _TRAVA_ESTADO:
+            estados = self.repo_estado.find_by_tickers(session, afetados)
+            novos = {ticker: self._calcular(session, ticker, estados.get(ticker), limite, menores_datas.get(ticker)) for ticker in afetados}
+            validos = [estado for estado in novos.values() if estado is not None and _finito(estado)]
+            self.repo_estado.gravar_em_lote(session, validos)
+            self.repo_estado.remover(session, afetados - {estado.ticker for estado in validos})
+
+    def volatilidades(self, session: Session, tickers: Iterable[str], hoje: datetime.date | None = None) -> Dict[str, float]:
+        """
+        Retorna a volatilidade anualizada de cada ticker {ticker: volatilidade}.
+        Estados ausentes ou com dias já fora da janela são atualizados só em
+        memória: a leitura nunca grava no banco (isso fica para `atualizar`).
+        Tickers com menos de dois retornos ficam de fora.
+        """
+        tickers = {ticker.upper() for ticker in tickers}
+        limite = self.data_limite(hoje)
+        estados = self.repo_estado.find_by_tickers(session, tickers)
+
+        for ticker in tickers:
+            estado = estados.get(ticker)
+            if estado is None or estado.inicio_janela < limite:
+                estados[ticker] = self._calcular(session, ticker, estado, limite)
+
+        return {
+            ticker: math.sqrt(estado.m2 / (estado.n_retornos - 1)) * math.sqrt(DIAS_PREGAO_ANO)
+            for ticker, estado in estados.items()
+            if estado is not None and estado.n_retornos >= 2 and _finito(estado)
+        }
+
+    # --- Métodos internos ---
+
+    def _calcular(
+        self,
+        session: Session,
+        ticker: str,
+        estado: EstadoVolatilidade | None,
+        limite: datetime.date,
+        menor_data: datetime.date | None = None,
+    ) -> EstadoVolatilidade | None:
+        """
+        Devolve um novo estado (fora da sessão) para o ticker: desliza a janela
+        do estado gravado ou, se não houver um estado aproveitável, recalcula.
+        None quando o ticker não tem cotações na janela.
+        """
+        if (
+            estado is None
+            or estado.ultima_data < limite
+            or (menor_data is not None and menor_data <= estado.ultima_data)
+        ):
+            return self._recalcular(session, ticker, limite)
+        return self._deslizar(session, estado, limite)
+
+    def _recalcular(self, session: Session, ticker: str, limite: datetime.date) -> EstadoVolatilidade | None:
+        """Refaz o estado de um ticker a partir das cotações dentro da janela."""
+        cotacoes = self.repo_precos.find_precos_ticker(session, ticker, data_inicial=limite)
+        if not cotacoes:
+            return None
+        n, media, m2 = _momentos(_retornos([preco for _, preco in cotacoes]))
+        return EstadoVolatilidade(
+            ticker=ticker,
+            inicio_janela=cotacoes[0][0],
+            ultima_data=cotacoes[-1][0],
+            ultimo_preco=cotacoes[-1][1],
+            n_retornos=n,
+            media=media,
+            m2=m2,
+        )
+
+    def _deslizar(self, session: Session, estado: EstadoVolatilidade, limite: datetime.date) -> EstadoVolatilidade:
+        """Subtrai os dias que saíram da janela e soma os dias novos."""
+        momentos = (estado.n_retornos, estado.media, estado.m2)
+        inicio_janela = estado.inicio_janela
+        ultima_data, ultimo_preco = estado.ultima_data, estado.ultimo_preco
+
+        # 1. Retira os retornos cujo preço inicial ficou antes do limite da janela
+        if inicio_janela < limite:
+            saindo = self.repo_precos.find_precos_ticker(
+                session, estado.ticker, data_inicial=inicio_janela, data_final=limite
+            )
+            novo_inicio = self.repo_precos.find_precos_ticker(session, estado.ticker, data_inicial=limite, limite=1)
+            precos = [preco for _, preco in saindo] + [novo_inicio[0][1]]
+            momentos = _remover(momentos, _momentos(_retornos(precos)))
+            inicio_janela = novo_inicio[0][0]
+
+        # 2. Soma os retornos dos dias posteriores ao último já incorporado
+        novas = self.repo_precos.find_precos_ticker(
+            session, estado.ticker, data_inicial=ultima_data + datetime.timedelta(days=1)
+        )
+        if novas:
+            precos = [ultimo_preco] + [preco for _, preco in novas]
+            momentos = _combinar(momentos, _momentos(_retornos(precos)))
+            ultima_data, ultimo_preco = novas[-1]
+
+        n, media, m2 = momentos
+        return EstadoVolatilidade(
+            ticker=estado.ticker,
+            inicio_janela=inicio_janela,
+            ultima_data=ultima_data,
+            ultimo_preco=ultimo_preco,
+            n_retornos=n,
+            media=media,
+            m2=m2,
+        )
@@ -0,0 +1,68 @@
+# backtest_risk_parity.py
+
+import argparse
+import time
+from db_nexus import DatabaseSessionManager
+from app.backtest import grade_parametros
+from app.cache import CacheAnalises
+from app.perfil import adicionar_opcao_perfil, perfilar
+from app.precos import CachePrecos
+from app.services import PortfolioService
+
+def exibir_backtest(service: PortfolioService, configuracoes: list, processos: int | None = None):
+    """
+    Roda o backtest da regra de faixas para cada configuração e exibe as
+    métricas lado a lado, da melhor para a pior relação retorno/volatilidade.
+    """
+    print(f"\n--- Backtest da Regra de Rebalanceamento por Faixas ({len(configuracoes)} configurações) ---")
+
+    inicio = time.perf_counter()
+    resultados = service.executar_backtest(configuracoes, processos=processos)
+    if not resultados:
+        print("Não foi possível rodar o backtest. A carteira está vazia ou sem cotações.")
+        return
+
+    resultados.sort(key=lambda r: r.retorno_anual / r.volatilidade_anual if r.volatilidade_anual > 0 else 0, reverse=True)
+
+    print(
+        f"\n{'FAIXA':>6} | {'JANELA':>6} | {'FREQ.':>5} | {'CUSTO':>6} | {'RET. A.A.':>9} | "
+        f"{'VOL. A.A.':>9} | {'DRAWDOWN':>9} | {'TURNOVER':>8} | {'REBAL.':>6}"
+    )
+    print("-" * 92)
+    for resultado in resultados:
+        config = resultado.configuracao
+        print(
+            f"{config.faixa_tolerancia:>5.0%} | "
+            f"{config.janela_volatilidade_dias:>5}d | "
+            f"{config.frequencia_pregoes:>5} | "
+            f"{config.custo_transacao:>6.2%} | "
+            f"{resultado.retorno_anual:>9.2%} | "
+            f"{resultado.volatilidade_anual:>9.2%} | "
+            f"{resultado.max_drawdown:>9.2%} | "
+            f"{resultado.turnover_anual:>8.2%} | "
+            f"{resultado.rebalanceamentos:>6}"
+        )
+    print("-" * 92)
+    print("FREQ.: pregões entre as verificações das faixas. TURNOVER: valor negociado por ano / valor médio.")
+    print(f"Tempo total: {(time.perf_counter() - inicio) * 1000:.0f} ms.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest da regra de rebalanceamento Risk Parity por faixas.")
+    parser.add_argument("--faixas", type=float, nargs="+", default=[0.10, 0.20, 0.30], help="Larguras da faixa (0.20 = +/- 20%%)")
+    parser.add_argument("--janelas", type=int, nargs="+", default=[365, 730], help="Janelas de volatilidade em dias corridos")
+    parser.add_argument("--frequencias", type=int, nargs="+", default=[5, 21, 63], help="Pregões entre as verificações das faixas")
+    parser.add_argument("--custos", type=float, nargs="+", default=[0.001], help="Custo por operação, como fração do valor negociado")
+    parser.add_argument("--processos", type=int, help="Número de processos (padrão: todos os núcleos)")
+    adicionar_opcao_perfil(parser)
+    args = parser.parse_args()
+
+    DB_URL = "sqlite:///data/portfolio.db"
+    session_manager = DatabaseSessionManager(DB_URL)
+    service = PortfolioService(
+        session_manager, cache_precos=CachePrecos(), cache=CacheAnalises("data/cache_analises")
+    )
+
+    configuracoes = grade_parametros(args.faixas, args.janelas, args.frequencias, args.custos)
+    with perfilar(args.profile, service):
+        exibir_backtest(service, configuracoes, args.processos)
@@ -0,0 +1 @@
+# Benchmarks do PortfolioService sobre dados sintéticos (ver README).
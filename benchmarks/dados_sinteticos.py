@@ -0,0 +1,150 @@
+# dados_sinteticos.py
+
+import argparse
+import csv
+import datetime
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.models import TipoAtivo, TipoOperacao
+
+# Volatilidade anual típica de cada classe, usada para gerar os preços
+VOLATILIDADE_POR_CLASSE = {
+    TipoAtivo.ACAO: 0.30,
+    TipoAtivo.FII: 0.15,
+    TipoAtivo.RENDA_FIXA: 0.03,
+    TipoAtivo.ETF_BR: 0.22,
+    TipoAtivo.ETF_EXTERIOR: 0.18,
+    TipoAtivo.BDR: 0.25,
+    TipoAtivo.CRIPTOMOEDA: 0.70,
+}
+
+# Fração das transações que são vendas
+FRACAO_VENDAS = 0.15
+
+COLUNAS_CSV = ["ticker", "nome", "tipo", "data", "operacao", "quantidade", "preco"]
+
+# Último dia do calendário sintético. É fixo para que a mesma semente gere
+# sempre os mesmos dados; como as análises olham os últimos 2 anos a partir de
+# hoje, deve ser avançado (junto com a baseline) antes de sair dessa janela.
+DATA_FINAL_PADRAO = datetime.date(2026, 9, 30)
+
+# --- Geradores ---
+
+def gerar_ativos(n_ativos: int) -> List[Tuple[str, str, TipoAtivo]]:
+    """Cria 'n_ativos' ativos (ticker, nome, tipo), distribuídos entre todas as classes."""
+    tipos = list(TipoAtivo)
+    return [(f"SINT{i:04d}", f"Ativo Sintético {i}", tipos[i % len(tipos)]) for i in range(n_ativos)]
+
+def gerar_precos(
+    ativos: List[Tuple[str, str, TipoAtivo]],
+    anos: float,
+    data_final: datetime.date | None = None,
+    semente: int = 0,
+) -> pd.DataFrame:
+    """
+    Gera fechamentos diários (dias úteis x tickers) por movimento browniano
+    geométrico, com a volatilidade típica da classe de cada ativo. O calendário
+    termina em 'data_final' (padrão: DATA_FINAL_PADRAO), então o conjunto
+    depende só da 'semente' e não do dia em que é gerado.
+    """
+    data_final = data_final or DATA_FINAL_PADRAO
+    datas = pd.bdate_range(end=data_final, periods=max(2, int(anos * 252)), name='data')
+    gerador = np.random.default_rng(semente)
+
+    volatilidade_anual = np.array([VOLATILIDADE_POR_CLASSE[tipo] for _, _, tipo in ativos])
+    volatilidade_diaria = volatilidade_anual * gerador.uniform(0.7, 1.3, len(ativos)) / np.sqrt(252)
+    retornos = gerador.normal(0.0003, volatilidade_diaria, size=(len(datas), len(ativos)))
+    retornos -= volatilidade_diaria**2 / 2
+    precos = gerador.uniform(10, 150, len(ativos)) * np.exp(np.cumsum(retornos, axis=0))
+    return pd.DataFrame(precos.round(2), index=datas, columns=[ticker for ticker, _, _ in ativos])
+
+def gerar_transacoes(
+    ativos: List[Tuple[str, str, TipoAtivo]],
+    precos: pd.DataFrame,
+    n_transacoes: int,
+    semente: int = 0,
+) -> List[Dict[str, str]]:
+    """
+    Gera 'n_transacoes' linhas no formato do CSV de transações, em ordem
+    cronológica, negociadas perto do fechamento do dia. Vendas nunca passam
+    de metade da posição do momento, então nenhuma posição fica negativa.
+    """
+    gerador = np.random.default_rng(semente + 1)
+    indice_ativo = gerador.integers(0, len(ativos), n_transacoes)
+    indice_dia = np.sort(gerador.integers(0, len(precos), n_transacoes))
+    quantidades = gerador.integers(1, 200, n_transacoes)
+    eh_venda = gerador.random(n_transacoes) < FRACAO_VENDAS
+    precos_negociados = precos.to_numpy()[indice_dia, indice_ativo] * gerador.uniform(0.99, 1.01, n_transacoes)
+    datas = precos.index.strftime('%Y-%m-%d')
+
+    posicoes = np.zeros(len(ativos), dtype=np.int64)
+    linhas = []
+    for ativo, dia, quantidade, venda, preco in zip(indice_ativo, indice_dia, quantidades, eh_venda, precos_negociados):
+        if venda and posicoes[ativo] >= 2:
+            quantidade = min(quantidade, posicoes[ativo] // 2)
+            posicoes[ativo] -= quantidade
+            operacao = TipoOperacao.VENDA
+        else:
+            posicoes[ativo] += quantidade
+            operacao = TipoOperacao.COMPRA
+        ticker, nome, tipo = ativos[ativo]
+        linhas.append({
+            "ticker": ticker,
+            "nome": nome,
+            "tipo": tipo.value,
+            "data": datas[dia],
+            "operacao": operacao.value,
+            "quantidade": str(int(quantidade)),
+            "preco": f"{preco:.2f}",
+        })
+    return linhas
+
+def como_registros_historicos(precos: pd.DataFrame) -> List[Dict]:
+    """Converte a matriz de preços no formato de `PortfolioService.importar_dados_historicos`."""
+    longo = precos.stack().rename('preco_fechamento').reset_index()
+    longo.columns = ['data', 'ticker', 'preco_fechamento']
+    longo['data'] = longo['data'].dt.strftime('%Y-%m-%d')
+    return longo[['ticker', 'data', 'preco_fechamento']].to_dict('records')
+
+def escrever_csv(linhas: List[Dict[str, str]], caminho: str):
+    with open(caminho, 'w', encoding='utf-8', newline='') as arquivo:
+        escritor = csv.DictWriter(arquivo, fieldnames=COLUNAS_CSV)
+        escritor.writeheader()
+        escritor.writerows(linhas)
+
+def gerar_conjunto(
+    diretorio: str, n_ativos: int, anos: float, n_transacoes: int, semente: int = 0
+) -> Tuple[str, List[Dict]]:
+    """
+    Gera um conjunto completo: grava as transações em '<diretorio>/transacoes.csv'
+    e retorna (caminho do CSV, registros de cotações).
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    ativos = gerar_ativos(n_ativos)
+    precos = gerar_precos(ativos, anos, semente=semente)
+    caminho_csv = os.path.join(diretorio, "transacoes.csv")
+    escrever_csv(gerar_transacoes(ativos, precos, n_transacoes, semente), caminho_csv)
+    return caminho_csv, como_registros_historicos(precos)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cria um banco com uma carteira e cotações sintéticas.")
+    parser.add_argument("destino", help="Diretório do banco (portfolio.db) e do CSV gerados.")
+    parser.add_argument("--ativos", type=int, default=100, help="Número de ativos (padrão: 100)")
+    parser.add_argument("--anos", type=float, default=5, help="Anos de cotações diárias (padrão: 5)")
+    parser.add_argument("--transacoes", type=int, default=20_000, help="Número de transações (padrão: 20000)")
+    parser.add_argument("--semente", type=int, default=0, help="Semente do gerador (padrão: 0)")
+    args = parser.parse_args()
+
+    from benchmarks.executar import criar_servico
+    from importar_csv import importar_de_csv
+
+    caminho_csv, historico = gerar_conjunto(args.destino, args.ativos, args.anos, args.transacoes, args.semente)
+    service = criar_servico(args.destino)
+    importar_de_csv(service, caminho_csv)
+    service.importar_dados_historicos(historico)
+    print(f"✅ Banco sintético criado em '{os.path.join(args.destino, 'portfolio.db')}'.")
@@ -0,0 +1,234 @@
+# executar.py
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from db_nexus import DatabaseSessionManager
+from sqlalchemy import delete
+
+from app.cache import CacheAnalises
+from app.models import EstadoVolatilidade
+from app.services import PortfolioService
+from benchmarks.dados_sinteticos import gerar_conjunto
+from importar_csv import importar_de_csv
+
+# Escalas pré-definidas: número de ativos, anos de cotações e de transações
+ESCALAS = {
+    "pequena": {"ativos": 20, "anos": 2, "transacoes": 2_000},
+    "media": {"ativos": 100, "anos": 5, "transacoes": 20_000},
+    "grande": {"ativos": 500, "anos": 10, "transacoes": 200_000},
+}
+
+# Aumento máximo aceito da mediana em relação à baseline (0.25 = 25% mais lento)
+TOLERANCIA_PADRAO = 0.25
+
+# Diferenças absolutas abaixo disto (ms) são ruído e nunca contam como regressão
+DIFERENCA_MINIMA_MS = 5.0
+
+# Quantas vezes as importações são medidas, cada vez em um banco novo
+REPETICOES_IMPORTACAO_PADRAO = 3
+
+# As importações dependem de disco e variam mais: a tolerância delas é ao menos esta
+TOLERANCIA_MINIMA_IMPORTACAO = 0.5
+ETAPAS_IMPORTACAO = ("importar_csv", "importar_historico")
+
+CAMINHO_BASELINE = "benchmarks/baseline.json"
+
+# --- Preparação ---
+
+def criar_servico(diretorio: str) -> PortfolioService:
+    """Cria (se preciso, pelas migrações) o banco em '<diretorio>/portfolio.db' e um serviço sobre ele."""
+    url = f"sqlite:///{os.path.join(diretorio, 'portfolio.db')}"
+    # Cache só em memória, esvaziado antes de cada medição das análises
+    return PortfolioService(DatabaseSessionManager(url), cache=CacheAnalises())
+
+def _medir(funcao: Callable[[], object], repeticoes: int, antes: Callable[[], None] | None = None) -> Dict:
+    """Executa 'funcao' 'repeticoes' vezes e devolve a mediana e o mínimo em ms."""
+    tempos = []
+    for _ in range(repeticoes):
+        if antes is not None:
+            antes()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return {"mediana_ms": statistics.median(tempos), "min_ms": min(tempos), "repeticoes": repeticoes}
+
+def _esvaziar_caches(service: PortfolioService):
+    """
+    Deixa o serviço a frio: descarta as análises guardadas e o estado
+    incremental das volatilidades, que fica no banco depois da importação.
+    """
+    service.cache.limpar()
+    with service.session_manager.get_session() as session:
+        session.execute(delete(EstadoVolatilidade))
+
+# --- Execução ---
+
+def executar_escala(
+    parametros: Dict, repeticoes: int, semente: int = 0, repeticoes_importacao: int = REPETICOES_IMPORTACAO_PADRAO
+) -> Dict[str, Dict]:
+    """
+    Gera os dados sintéticos da escala e mede cada etapa. As importações alteram
+    o banco, então cada uma das 'repeticoes_importacao' medições usa um banco
+    novo; as análises rodam 'repeticoes' vezes sobre o último, sempre a frio
+    (sem cache de análises nem estado de volatilidade).
+    """
+    medicoes = {}
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as diretorio:
+        caminho_csv, historico = gerar_conjunto(
+            diretorio, parametros["ativos"], parametros["anos"], parametros["transacoes"], semente
+        )
+
+        # 1. Importações, cada rodada em um banco vazio; as mensagens dos importadores ficam de fora
+        tempos: Dict[str, List[float]] = {"importar_csv": [], "importar_historico": []}
+        saida = io.StringIO()
+        for rodada in range(repeticoes_importacao):
+            pasta = os.path.join(diretorio, f"rodada_{rodada}")
+            os.makedirs(pasta)
+            service = criar_servico(pasta)
+            with contextlib.redirect_stdout(saida):
+                tempos["importar_csv"].append(_medir(lambda service=service: importar_de_csv(service, caminho_csv), 1)["mediana_ms"])
+                tempos["importar_historico"].append(_medir(lambda service=service: service.importar_dados_historicos(historico), 1)["mediana_ms"])
+            if "❌" in saida.getvalue():
+                raise RuntimeError(f"Falha na importação dos dados sintéticos:\n{saida.getvalue()}")
+        for etapa, valores in tempos.items():
+            medicoes[etapa] = {"mediana_ms": statistics.median(valores), "min_ms": min(valores), "repeticoes": len(valores)}
+
+        # 2. Análises, a frio
+        etapas = {
+            "calcular_portfolio_atual": service.calcular_portfolio_atual,
+            "get_market_value_portfolio": service.get_market_value_portfolio,
+            "calcular_alocacao_risk_parity_por_classe": service.calcular_alocacao_risk_parity_por_classe,
+            "plano_rebalanceamento": service.gerar_plano_rebalanceamento_capital_neutro,
+            "plano_aporte": lambda: service.gerar_plano_de_aporte(10_000.0),
+        }
+        for nome, funcao in etapas.items():
+            medicoes[nome] = _medir(funcao, repeticoes, antes=lambda: _esvaziar_caches(service))
+    return medicoes
+
+def _commit_atual() -> str | None:
+    try:
+        resultado = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return resultado.stdout.strip()
+
+def executar(escalas: List[str], repeticoes: int, semente: int = 0, repeticoes_importacao: int = REPETICOES_IMPORTACAO_PADRAO) -> Dict:
+    resultado = {
+        "data": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_atual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "semente": semente,
+        "escalas": {},
+    }
+    for escala in escalas:
+        parametros = ESCALAS[escala]
+        print(f"⏱️ Escala '{escala}': {parametros['ativos']} ativos, {parametros['anos']} anos, {parametros['transacoes']} transações...")
+        resultado["escalas"][escala] = {"parametros": parametros, "medicoes": executar_escala(parametros, repeticoes, semente, repeticoes_importacao)}
+    return resultado
+
+# --- Comparação com a Baseline ---
+
+def comparar(resultado: Dict, baseline: Dict, tolerancia: float, diferenca_minima_ms: float = DIFERENCA_MINIMA_MS) -> List[Dict]:
+    """
+    Compara a mediana de cada etapa com a da baseline. Há regressão quando a
+    etapa fica mais de 'tolerancia' mais lenta (nas importações, ao menos
+    TOLERANCIA_MINIMA_IMPORTACAO) e a diferença passa de
+    'diferenca_minima_ms'. Escalas com parâmetros diferentes não são comparadas.
+    """
+    comparacoes = []
+    for escala, dados in resultado["escalas"].items():
+        referencia = baseline.get("escalas", {}).get(escala)
+        if referencia is None or referencia["parametros"] != dados["parametros"]:
+            continue
+        for etapa, medicao in dados["medicoes"].items():
+            anterior = referencia["medicoes"].get(etapa)
+            if anterior is None:
+                continue
+            atual_ms, anterior_ms = medicao["mediana_ms"], anterior["mediana_ms"]
+            limite = max(tolerancia, TOLERANCIA_MINIMA_IMPORTACAO) if etapa in ETAPAS_IMPORTACAO else tolerancia
+            razao = atual_ms / anterior_ms if anterior_ms > 0 else float("inf")
+            comparacoes.append({
+                "escala": escala,
+                "etapa": etapa,
+                "atual_ms": atual_ms,
+                "baseline_ms": anterior_ms,
+                "razao": razao,
+                "regressao": razao > 1 + limite and atual_ms - anterior_ms > diferenca_minima_ms,
+            })
+    return comparacoes
+
+def exibir(resultado: Dict, comparacoes: List[Dict]):
+    por_etapa = {(c["escala"], c["etapa"]): c for c in comparacoes}
+    for escala, dados in resultado["escalas"].items():
+        print(f"\n--- ESCALA: {escala.upper()} ---")
+        print(f"{'ETAPA':<42} | {'MEDIANA (ms)':>12} | {'MÍN. (ms)':>10} | {'BASELINE (ms)':>13} | {'VARIAÇÃO':>9}")
+        print("-" * 100)
+        for etapa, medicao in dados["medicoes"].items():
+            comparacao = por_etapa.get((escala, etapa))
+            if comparacao is None:
+                baseline_str, variacao_str = "-", "-"
+            else:
+                baseline_str = f"{comparacao['baseline_ms']:.1f}"
+                variacao_str = f"{(comparacao['razao'] - 1) * 100:+.1f}%"
+                if comparacao["regressao"]:
+                    variacao_str += " ❌"
+            print(f"{etapa:<42} | {medicao['mediana_ms']:>12.1f} | {medicao['min_ms']:>10.1f} | {baseline_str:>13} | {variacao_str:>9}")
+        print("-" * 100)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mede o desempenho do PortfolioService sobre dados sintéticos.")
+    parser.add_argument("--escalas", nargs="+", choices=list(ESCALAS), default=["pequena", "media"], help="Escalas a medir (padrão: pequena media)")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Repetições de cada análise (vale a mediana)")
+    parser.add_argument("--repeticoes-importacao", type=int, default=REPETICOES_IMPORTACAO_PADRAO, help="Bancos novos em que as importações são medidas (vale a mediana)")
+    parser.add_argument("--semente", type=int, default=0, help="Semente dos dados sintéticos")
+    parser.add_argument("--saida", help="Arquivo JSON com os resultados (padrão: benchmarks/resultados/<data>.json)")
+    parser.add_argument("--baseline", default=CAMINHO_BASELINE, help=f"Baseline para comparação (padrão: {CAMINHO_BASELINE})")
+    parser.add_argument("--salvar-baseline", action="store_true", help="Grava estes resultados como a nova baseline")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO, help="Aumento aceito da mediana (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    resultado = executar(args.escalas, args.repeticoes, args.semente, args.repeticoes_importacao)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as arquivo:
+            baseline = json.load(arquivo)
+    comparacoes = comparar(resultado, baseline, args.tolerancia) if baseline else []
+    resultado["comparacao"] = {"baseline": args.baseline if baseline else None, "tolerancia": args.tolerancia, "etapas": comparacoes}
+    exibir(resultado, comparacoes)
+
+    saida = args.saida or os.path.join("benchmarks", "resultados", f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(saida) or ".", exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"\nResultados salvos em '{saida}'.")
+
+    if args.salvar_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as arquivo:
+            json.dump({k: v for k, v in resultado.items() if k != "comparacao"}, arquivo, indent=2, ensure_ascii=False)
+        print(f"Baseline gravada em '{args.baseline}'.")
+
+    regressoes = [c for c in comparacoes if c["regressao"]]
+    if baseline is None:
+        if not args.salvar_baseline:
+            print("Nenhuma baseline encontrada: use --salvar-baseline para criar uma.")
+    elif regressoes:
+        print(f"❌ {len(regressoes)} etapa(s) mais lentas que a baseline além da tolerância de {args.tolerancia:.0%}.")
+        sys.exit(1)
+    else:
+        print(f"✅ Nenhuma regressão além da tolerância de {args.tolerancia:.0%}.")
@@ -0,0 +1,212 @@
+# cli.py
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+DB_URL = "sqlite:///data/portfolio.db"
+
+# Dependências pesadas que os relatórios simples (positions, distribution) não
+# podem importar. Cada subcomando importa apenas o que usa, dentro da sua função.
+MODULOS_PESADOS = ("numpy", "pandas", "yfinance")
+
+# Módulos importados pelo caminho dos relatórios simples
+MODULOS_RELATORIOS_SIMPLES = ("db_nexus", "app.cache", "app.models", "app.services", "app.view", "analisar_distribuicao")
+
+# Tempo máximo (ms) para importar o caminho dos relatórios simples
+ORCAMENTO_INICIO_MS = 500.0
+
+def _criar_servico(args: argparse.Namespace, precos: bool = False, cache: bool = True):
+    """
+    Monta o PortfolioService; o cache de preços (pandas/numpy) só quando pedido.
+    Com --profile, o serviço é instrumentado pelo perfilador da execução.
+    """
+    from db_nexus import DatabaseSessionManager
+    from app.cache import CacheAnalises
+    from app.services import PortfolioService
+
+    cache_precos = None
+    if precos:
+        from app.precos import CachePrecos
+        cache_precos = CachePrecos()
+    service = PortfolioService(
+        DatabaseSessionManager(DB_URL),
+        cache_precos=cache_precos,
+        cache=CacheAnalises("data/cache_analises") if cache else None,
+        carteira=args.carteira,
+    )
+    if getattr(args, "perfilador", None) is not None:
+        args.perfilador.instrumentar_servico(service)
+    return service
+
+# --- Subcomandos ---
+
+def comando_positions(args: argparse.Namespace):
+    from app.models import setup_inicial_se_necessario
+    from app.view import exibir_portfolio
+
+    if not setup_inicial_se_necessario():
+        print("\n➡️  Agora, importe as transações:")
+        print("   python3 cli.py import")
+        return
+    exibir_portfolio(_criar_servico(args))
+
+def comando_distribution(args: argparse.Namespace):
+    from analisar_distribuicao import exibir_analise_completa
+
+    exibir_analise_completa(_criar_servico(args))
+
+def comando_risk_parity(args: argparse.Namespace):
+    from analisar_risk_parity import exibir_tabelas_erc, exibir_tabelas_risk_parity
+
+    service = _criar_servico(args, precos=True)
+    if args.erc:
+        exibir_tabelas_erc(service, por_classe=not args.carteira_inteira)
+    else:
+        exibir_tabelas_risk_parity(service)
+
+def comando_rebalance(args: argparse.Namespace):
+    from recomendar_rebalanceamento import gerar_plano_de_rebalanceamento
+
+    gerar_plano_de_rebalanceamento(_criar_servico(args, precos=True))
+
+def comando_aporte(args: argparse.Namespace):
+    from recomendar_aporte import gerar_relatorio_de_aporte, gerar_tabela_de_cenarios
+
+    service = _criar_servico(args, precos=True)
+    if args.de is not None or args.ate is not None:
+        if args.de is None or args.ate is None or args.passo <= 0 or args.ate < args.de:
+            sys.exit("❌ Informe --de e --ate (com --ate >= --de) e um --passo positivo.")
+        quantidade = int((args.ate - args.de) / args.passo + 1e-9) + 1
+        valores = [args.de + i * args.passo for i in range(quantidade)]
+        gerar_tabela_de_cenarios(service, valores, refinar=args.refinar, arquivo_csv=args.csv)
+        return
+
+    valor = args.valor
+    if valor is None:
+        try:
+            valor = float(input("Qual o valor do seu aporte em R$? "))
+        except ValueError:
+            print("Valor inválido. Por favor, digite um número.")
+            return
+    gerar_relatorio_de_aporte(service, valor)
+
+def comando_collect(args: argparse.Namespace):
+    from coletar_historico import coletar_e_salvar_historico
+
+    coletar_e_salvar_historico(_criar_servico(args, precos=True, cache=False))
+
+def comando_import(args: argparse.Namespace):
+    from app.models import setup_inicial_se_necessario
+    from app.view import exibir_portfolio
+    from importar_csv import TAMANHO_LOTE_PADRAO, importar_de_csv
+
+    setup_inicial_se_necessario()
+    service = _criar_servico(args, cache=False)
+    importar_de_csv(service, args.arquivo, tamanho_lote=args.lote or TAMANHO_LOTE_PADRAO, recomecar=args.recomecar)
+
+    print("\n--- Carteira após a operação ---")
+    exibir_portfolio(service)
+
+def medir_inicio(repeticoes: int = 3) -> dict:
+    """
+    Mede, em processos novos, o tempo de importar o caminho dos relatórios
+    simples e quais módulos pesados ele acabou carregando. Fica com a melhor
+    de 'repeticoes' medições, para descontar o ruído do sistema.
+    """
+    codigo = (
+        "import importlib, json, sys, time\n"
+        "inicio = time.perf_counter()\n"
+        "import cli\n"
+        f"for nome in {MODULOS_RELATORIOS_SIMPLES!r}: importlib.import_module(nome)\n"
+        "tempo_ms = (time.perf_counter() - inicio) * 1000\n"
+        f"print(json.dumps({{'tempo_ms': tempo_ms, 'pesados': [m for m in {MODULOS_PESADOS!r} if m in sys.modules]}}))\n"
+    )
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    medicoes = []
+    for _ in range(repeticoes):
+        processo = subprocess.run(
+            [sys.executable, "-c", codigo], cwd=diretorio, capture_output=True, text=True, check=True
+        )
+        medicoes.append(json.loads(processo.stdout.strip().splitlines()[-1]))
+    return min(medicoes, key=lambda medicao: medicao['tempo_ms'])
+
+def comando_check_startup(args: argparse.Namespace):
+    medicao = medir_inicio(args.repeticoes)
+    dentro_do_orcamento = medicao['tempo_ms'] <= args.orcamento_ms and not medicao['pesados']
+
+    print(f"\nImportação dos relatórios simples: {medicao['tempo_ms']:.0f} ms (orçamento: {args.orcamento_ms:.0f} ms)")
+    if medicao['pesados']:
+        print(f"❌ Módulos pesados importados sem necessidade: {', '.join(medicao['pesados'])}")
+    if dentro_do_orcamento:
+        print("✅ Dentro do orçamento.")
+    else:
+        print("❌ Fora do orçamento. Veja os maiores custos com: python3 -X importtime cli.py positions")
+        sys.exit(1)
+
+# --- Linha de Comando ---
+
+def criar_parser() -> argparse.ArgumentParser:
+    from app.perfil import adicionar_opcao_perfil
+
+    comum = argparse.ArgumentParser(add_help=False)
+    comum.add_argument("--carteira", help="Carteira analisada ou de destino (padrão: todas / Principal).")
+    adicionar_opcao_perfil(comum)
+
+    parser = argparse.ArgumentParser(description="Analisador de portfólio: todos os relatórios em um só comando.")
+    subcomandos = parser.add_subparsers(dest="comando", required=True, metavar="COMANDO")
+
+    sub = subcomandos.add_parser("positions", parents=[comum], help="Posição atual (custo) de cada ativo.")
+    sub.set_defaults(funcao=comando_positions)
+
+    sub = subcomandos.add_parser("distribution", parents=[comum], help="Distribuição por valor de mercado.")
+    sub.set_defaults(funcao=comando_distribution)
+
+    sub = subcomandos.add_parser("risk-parity", parents=[comum], help="Alocação por paridade de risco.")
+    sub.add_argument("--erc", action="store_true", help="Usa Contribuição de Risco Igual (com correlações).")
+    sub.add_argument("--carteira-inteira", action="store_true", help="Com --erc, resolve a carteira inteira em vez de cada classe.")
+    sub.set_defaults(funcao=comando_risk_parity)
+
+    sub = subcomandos.add_parser("rebalance", parents=[comum], help="Plano de rebalanceamento com capital neutro.")
+    sub.set_defaults(funcao=comando_rebalance)
+
+    sub = subcomandos.add_parser("aporte", parents=[comum], help="Plano de alocação de um novo aporte.")
+    sub.add_argument("valor", type=float, nargs="?", help="Valor do aporte em R$ (perguntado se omitido).")
+    sub.add_argument("--de", type=float, help="Simula vários aportes: menor valor (R$)")
+    sub.add_argument("--ate", type=float, help="Simula vários aportes: maior valor (R$)")
+    sub.add_argument("--passo", type=float, default=500.0, help="Intervalo entre os valores simulados (padrão: 500)")
+    sub.add_argument("--refinar", action="store_true", help="Refina cada cenário com a busca exata (mais lento)")
+    sub.add_argument("--csv", help="Salva a curva dos cenários neste arquivo CSV")
+    sub.set_defaults(funcao=comando_aporte)
+
+    sub = subcomandos.add_parser("collect", parents=[comum], help="Coleta as cotações que faltam.")
+    sub.set_defaults(funcao=comando_collect)
+
+    sub = subcomandos.add_parser("import", parents=[comum], help="Importa as transações de um arquivo CSV.")
+    sub.add_argument("arquivo", nargs="?", default="data/transacoes.csv", help="Caminho do arquivo CSV.")
+    sub.add_argument("--lote", type=int, help="Número de linhas gravadas por commit (padrão: 5000).")
+    sub.add_argument("--recomecar", action="store_true", help="Ignora o progresso salvo e importa desde o início.")
+    sub.set_defaults(funcao=comando_import)
+
+    sub = subcomandos.add_parser("check-startup", help="Verifica o tempo de início dos relatórios simples.")
+    sub.add_argument("--orcamento-ms", type=float, default=ORCAMENTO_INICIO_MS, help="Tempo máximo de importação, em ms.")
+    sub.add_argument("--repeticoes", type=int, default=3, help="Medições em processos novos (vale a melhor).")
+    sub.set_defaults(funcao=comando_check_startup)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = criar_parser()
+    argumentos = parser.parse_args()
+    if getattr(argumentos, "lote", None) is not None and argumentos.lote < 1:
+        parser.error("--lote deve ser um inteiro positivo.")
+    if getattr(argumentos, "profile", None) is None:
+        argumentos.funcao(argumentos)
+    else:
+        from app.perfil import perfilar
+
+        with perfilar(argumentos.profile) as perfilador:
+            argumentos.perfilador = perfilador
+            argumentos.funcao(argumentos)
@@ -1,6 +1,11 @@
 # gerar_relatorio.py
 
+import argparse
 from db_nexus import DatabaseSessionManager
+from app.cache import CacheAnalises
+from app.perfil import adicionar_opcao_perfil, perfilar
+from app.planejamento import FAIXA_TOLERANCIA
+from app.precos import CachePrecos
 from app.services import PortfolioService
 
 # --- Funções Auxiliares de Cor para o Terminal ---
@@ -36,9 +41,9 @@ def gerar_relatorio_completo(service: PortfolioService):
             aloc_atual_pct = ativo['alocacao_atual_na_classe'] * 100
             aloc_sugerida_pct = ativo['alocacao_sugerida'] * 100
 
-            # Define a faixa de tolerância de +/- 20%
-            faixa_min = aloc_sugerida_pct * 0.80
-            faixa_max = aloc_sugerida_pct * 1.20
+            # Define a faixa de tolerância em torno da alocação sugerida
+            faixa_min = aloc_sugerida_pct * (1 - FAIXA_TOLERANCIA)
+            faixa_max = aloc_sugerida_pct * (1 + FAIXA_TOLERANCIA)
 
             # Lógica para a recomendação
             if aloc_atual_pct > faixa_max:
@@ -59,8 +64,15 @@ def gerar_relatorio_completo(service: PortfolioService):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Relatório completo da carteira.")
+    adicionar_opcao_perfil(parser)
+    args = parser.parse_args()
+
     DB_URL = "sqlite:///data/portfolio.db"
     session_manager = DatabaseSessionManager(DB_URL)
-    service = PortfolioService(session_manager)
+    service = PortfolioService(
+        session_manager, cache_precos=CachePrecos(), cache=CacheAnalises("data/cache_analises")
+    )
     
-    gerar_relatorio_completo(service)
\ No newline at end of file
+    with perfilar(args.profile, service):
+        gerar_relatorio_completo(service)
@@ -1,14 +1,23 @@
 # importar_csv.py (Versão com Suporte a Comentários)
 
+import argparse
 import csv
 import datetime
+import hashlib
+import itertools
+import json
 import os
+import time
 from sqlalchemy import create_engine
 from app.models import Base, setup_inicial_se_necessario, TipoAtivo, TipoOperacao
 from db_nexus import DatabaseSessionManager
+from app.perfil import adicionar_opcao_perfil, perfilar
 from app.services import PortfolioService
 from app.view import exibir_portfolio
 
+# Número padrão de linhas gravadas em cada commit
+TAMANHO_LOTE_PADRAO = 5000
+
 def find_enum_by_value(enum_class, value_to_find: str):
     value_to_find_clean = value_to_find.strip().lower()
     for member in enum_class:
@@ -16,48 +25,177 @@ def find_enum_by_value(enum_class, value_to_find: str):
             return member
     return None
 
-def importar_de_csv(service: PortfolioService, caminho_arquivo: str):
-    print(f"\nIniciando importação do arquivo '{caminho_arquivo}'...")
+def converter_linha(linha: dict) -> dict:
+    """
+    Converte uma linha do CSV para o formato esperado pelo serviço de importação.
+    A coluna opcional 'carteira' escolhe a carteira de destino da linha.
+    Levanta ValueError se algum campo for inválido.
+    """
+    tipo_ativo = find_enum_by_value(TipoAtivo, linha['tipo'])
+    tipo_operacao = find_enum_by_value(TipoOperacao, linha['operacao'])
+    if tipo_ativo is None:
+        raise ValueError(f"tipo de ativo desconhecido: '{linha['tipo']}'")
+    if tipo_operacao is None:
+        raise ValueError(f"operação desconhecida: '{linha['operacao']}'")
+
+    registro = {
+        'ticker': linha['ticker'].upper(),
+        'nome': linha['nome'],
+        'tipo_ativo': tipo_ativo,
+        'data': datetime.date.fromisoformat(linha['data']),
+        'tipo_operacao': tipo_operacao,
+        'quantidade': float(linha['quantidade']),
+        'preco_unitario': float(linha['preco']),
+    }
+    if (linha.get('carteira') or '').strip():
+        registro['carteira'] = linha['carteira'].strip()
+    return registro
+
+def ler_em_lotes(leitor, tamanho_lote: int):
+    """
+    Gera listas com no máximo 'tamanho_lote' linhas do leitor, sem nunca
+    carregar o arquivo inteiro na memória.
+    """
+    while True:
+        lote = list(itertools.islice(leitor, tamanho_lote))
+        if not lote:
+            return
+        yield lote
+
+def ler_progresso(caminho_progresso: str) -> dict:
+    """
+    Lê o progresso de uma execução anterior: quantas linhas de dados já foram
+    importadas, o hash do trecho do arquivo que elas ocupavam e o tamanho do
+    arquivo de rejeitadas até o último lote confirmado.
+    """
     try:
+        with open(caminho_progresso, encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def salvar_progresso(caminho_progresso: str, linhas_processadas: int, hash_prefixo: str, tamanho_rejeitadas: int):
+    """Grava o offset de forma atômica, para que uma queda nunca deixe o arquivo pela metade."""
+    temporario = f"{caminho_progresso}.{os.getpid()}.tmp"
+    progresso = {
+        'linhas_processadas': linhas_processadas,
+        'hash_prefixo': hash_prefixo,
+        'tamanho_rejeitadas': tamanho_rejeitadas,
+    }
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(progresso, arquivo)
+    os.replace(temporario, caminho_progresso)
+
+def abrir_leitor(arquivo_csv):
+    """
+    Monta o leitor do CSV sobre o arquivo aberto e um hash de tudo o que ele já
+    consumiu. O leitor pede ao arquivo só as linhas de cada registro, então,
+    depois de N registros, o hash identifica exatamente o trecho já importado.
+    """
+    hash_prefixo = hashlib.sha256()
+
+    def linhas_com_hash():
+        for linha in arquivo_csv:
+            hash_prefixo.update(linha.encode('utf-8'))
+            yield linha
+
+    # Criamos um "filtro" que lê o arquivo e ignora linhas que começam
+    # com '#' ou que estão completamente em branco.
+    linhas_filtradas = (linha for linha in linhas_com_hash() if not linha.strip().startswith('#'))
+
+    # O DictReader agora lê a partir das linhas já filtradas, em vez do arquivo direto
+    return csv.DictReader(linhas_filtradas), hash_prefixo
+
+def importar_de_csv(service: PortfolioService, caminho_arquivo: str, tamanho_lote: int = TAMANHO_LOTE_PADRAO, recomecar: bool = False):
+    """
+    Importa o arquivo em lotes de tamanho fixo. Cada lote é gravado e confirmado
+    no banco de forma independente e o progresso é salvo em '<arquivo>.progresso',
+    de modo que uma interrupção não obriga a recomeçar do início.
+    Linhas inválidas são gravadas em '<arquivo>.rejeitadas.csv'.
+    """
+    print(f"\nIniciando importação do arquivo '{caminho_arquivo}' (lotes de {tamanho_lote} linhas)...")
+    caminho_progresso = f"{caminho_arquivo}.progresso"
+    caminho_rejeitadas = f"{os.path.splitext(caminho_arquivo)[0]}.rejeitadas.csv"
+    try:
+        inicio = time.perf_counter()
+        progresso = {} if recomecar else ler_progresso(caminho_progresso)
+        linhas_processadas = progresso.get('linhas_processadas', 0)
+        tamanho_rejeitadas = 0
+
         with open(caminho_arquivo, mode='r', encoding='utf-8') as arquivo_csv:
-            
-            # --- A MUDANÇA ESTÁ AQUI ---
-            # Criamos um "filtro" que lê o arquivo e ignora linhas que começam
-            # com '#' ou que estão completamente em branco.
-            linhas_filtradas = (linha for linha in arquivo_csv if not linha.strip().startswith('#'))
-            
-            # O DictReader agora lê a partir das linhas já filtradas, em vez do arquivo direto
-            leitor = csv.DictReader(linhas_filtradas)
+            leitor, hash_prefixo = abrir_leitor(arquivo_csv)
+
+            # Só retoma se as linhas já importadas continuam as mesmas no arquivo
+            if linhas_processadas:
+                puladas_no_inicio = sum(1 for _ in itertools.islice(leitor, linhas_processadas))
+                if puladas_no_inicio == linhas_processadas and hash_prefixo.hexdigest() == progresso.get('hash_prefixo'):
+                    print(f"⏯️ Retomando a partir da linha {linhas_processadas + 1} (use --recomecar para ignorar).")
+                    # Descarta as rejeitadas gravadas por um lote que não chegou ao commit
+                    tamanho_rejeitadas = progresso.get('tamanho_rejeitadas', 0)
+                    if os.path.exists(caminho_rejeitadas) and os.path.getsize(caminho_rejeitadas) > tamanho_rejeitadas:
+                        os.truncate(caminho_rejeitadas, tamanho_rejeitadas)
+                else:
+                    print("🔄 O arquivo mudou desde a importação interrompida: recomeçando do início.")
+                    linhas_processadas = 0
+                    arquivo_csv.seek(0)
+                    leitor, hash_prefixo = abrir_leitor(arquivo_csv)
             
             importadas = 0
             puladas = 0
-            
-            for linha in leitor:
-                try:
-                    # O resto do código continua igual...
-                    ticker = linha['ticker'].upper()
-                    nome = linha['nome']
-                    tipo_ativo = find_enum_by_value(TipoAtivo, linha['tipo'])
-                    data = datetime.date.fromisoformat(linha['data'])
-                    tipo_operacao = find_enum_by_value(TipoOperacao, linha['operacao'])
-                    quantidade = float(linha['quantidade'])
-                    preco = float(linha['preco'])
-
-                    resultado = service.importar_transacao_se_nova(
-                        ticker, nome, tipo_ativo, data, tipo_operacao, quantidade, preco
-                    )
-                    
-                    if resultado['status'] == 'imported':
-                        importadas += 1
-                    elif resultado['status'] == 'skipped':
-                        puladas += 1
-
-                except Exception as e:
-                    print(f"⚠️ Erro ao processar a linha: {linha}. Erro: {e}")
-            
-            print("\n--- Resumo da Importação ---")
-            print(f"✅ {importadas} novas transações importadas.")
-            print(f"⏩ {puladas} transações existentes foram puladas.")
+            lidas = 0
+            rejeitadas = 0
+            # O arquivo de rejeitadas só é aberto se aparecer a primeira linha inválida
+            arquivo_rejeitadas = None
+            escritor_rejeitadas = None
+
+            try:
+                for lote in ler_em_lotes(leitor, tamanho_lote):
+                    # 1. Converte as linhas do lote, separando as inválidas
+                    registros = []
+                    for linha in lote:
+                        try:
+                            registros.append(converter_linha(linha))
+                        except Exception as e:
+                            if escritor_rejeitadas is None:
+                                modo = 'a' if tamanho_rejeitadas and os.path.exists(caminho_rejeitadas) else 'w'
+                                arquivo_rejeitadas = open(caminho_rejeitadas, mode=modo, encoding='utf-8', newline='')
+                                escritor_rejeitadas = csv.DictWriter(
+                                    arquivo_rejeitadas, fieldnames=[*leitor.fieldnames, 'erro'], extrasaction='ignore'
+                                )
+                                if modo == 'w':
+                                    escritor_rejeitadas.writeheader()
+                            escritor_rejeitadas.writerow({**linha, 'erro': str(e)})
+                            rejeitadas += 1
+
+                    # 2. Grava o lote (uma sessão e um commit por lote)
+                    resultado = service.importar_transacoes_em_lote(registros)
+                    importadas += resultado['imported']
+                    puladas += resultado['skipped']
+                    lidas += len(lote)
+
+                    # 3. Só depois do commit registra o novo offset (e até onde vão as rejeitadas)
+                    linhas_processadas += len(lote)
+                    if arquivo_rejeitadas is not None:
+                        arquivo_rejeitadas.flush()
+                        tamanho_rejeitadas = os.path.getsize(caminho_rejeitadas)
+                    salvar_progresso(caminho_progresso, linhas_processadas, hash_prefixo.hexdigest(), tamanho_rejeitadas)
+                    print(f"  - {linhas_processadas} linhas processadas...")
+            finally:
+                if arquivo_rejeitadas is not None:
+                    arquivo_rejeitadas.close()
+
+        # O arquivo terminou: o progresso não é mais necessário
+        if os.path.exists(caminho_progresso):
+            os.remove(caminho_progresso)
+        duracao = time.perf_counter() - inicio
+        linhas_por_segundo = lidas / duracao if duracao > 0 else 0.0
+
+        print("\n--- Resumo da Importação ---")
+        print(f"✅ {importadas} novas transações importadas.")
+        print(f"⏩ {puladas} transações existentes foram puladas.")
+        if rejeitadas:
+            print(f"⚠️ {rejeitadas} linhas inválidas gravadas em '{caminho_rejeitadas}'.")
+        print(f"⏱️ {lidas} linhas em {duracao:.2f}s ({linhas_por_segundo:,.0f} linhas/s).")
 
     except FileNotFoundError:
         print(f"❌ Erro: Arquivo '{caminho_arquivo}' não encontrado.")
@@ -65,14 +203,25 @@ def importar_de_csv(service: PortfolioService, caminho_arquivo: str):
         print(f"❌ Ocorreu um erro durante a importação: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa as transações de um arquivo CSV para o banco.")
+    parser.add_argument("arquivo", nargs="?", default="data/transacoes.csv", help="Caminho do arquivo CSV.")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_PADRAO, help="Número de linhas gravadas por commit.")
+    parser.add_argument("--recomecar", action="store_true", help="Ignora o progresso salvo e importa desde o início.")
+    parser.add_argument("--carteira", help="Carteira das linhas sem a coluna 'carteira' (padrão: Principal).")
+    adicionar_opcao_perfil(parser)
+    args = parser.parse_args()
+    # Com lotes vazios nada seria lido, e o progresso seria apagado como se a importação tivesse terminado
+    if args.lote < 1:
+        parser.error("--lote deve ser um inteiro positivo.")
+
     setup_inicial_se_necessario()
 
     DB_URL = "sqlite:///data/portfolio.db"
     session_manager = DatabaseSessionManager(DB_URL)
-    service = PortfolioService(session_manager)
-    
-    ARQUIVO_CSV = "data/transacoes.csv"
-    importar_de_csv(service, ARQUIVO_CSV)
+    service = PortfolioService(session_manager, carteira=args.carteira)
     
-    print("\n--- Carteira após a operação ---")
-    exibir_portfolio(service)
\ No newline at end of file
+    with perfilar(args.profile, service):
+        importar_de_csv(service, args.arquivo, tamanho_lote=args.lote, recomecar=args.recomecar)
+
+        print("\n--- Carteira após a operação ---")
+        exibir_portfolio(service)
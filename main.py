@@ -1,27 +1,37 @@
 # main.py (Versão Refatorada)
 
+import argparse
+
 # Importa a função de setup diretamente do models.py
 from app.models import setup_inicial_se_necessario
 from db_nexus import DatabaseSessionManager
+from app.cache import CacheAnalises
+from app.perfil import adicionar_opcao_perfil, perfilar
 from app.services import PortfolioService
 from app.view import exibir_portfolio
 
-def rodar_dashboard():
+def rodar_dashboard(perfil: str | None = None):
     """
     Função principal que inicializa os serviços e exibe o portfólio.
+    Com 'perfil', mede a execução (veja `app.perfil.perfilar`).
     """
     DB_URL = "sqlite:///data/portfolio.db"
     session_manager = DatabaseSessionManager(DB_URL)
-    service = PortfolioService(session_manager)
-    exibir_portfolio(service)
+    service = PortfolioService(session_manager, cache=CacheAnalises("data/cache_analises"))
+    with perfilar(perfil, service):
+        exibir_portfolio(service)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exibe a posição atual da carteira.")
+    adicionar_opcao_perfil(parser)
+    args = parser.parse_args()
+
     # 1. Chama a função de setup centralizada
     banco_ja_existia = setup_inicial_se_necessario()
     
     # 2. Roda o dashboard apenas se o banco já existia
     if banco_ja_existia:
-        rodar_dashboard()
+        rodar_dashboard(args.profile)
     else:
         # Se o banco acabou de ser criado, avisa o usuário para importar os dados
         print("\n➡️  Agora, execute o script de importação para popular os dados:")
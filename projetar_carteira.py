@@ -0,0 +1,73 @@
+# projetar_carteira.py
+
+import argparse
+from db_nexus import DatabaseSessionManager
+from app.cache import CacheAnalises
+from app.perfil import adicionar_opcao_perfil, perfilar
+from app.monte_carlo import METODOS
+from app.precos import CachePrecos
+from app.services import PortfolioService
+
+def exibir_projecao(service: PortfolioService, args: argparse.Namespace):
+    """
+    Roda a projeção de Monte Carlo das posições atuais e exibe as faixas de
+    valor ao longo do horizonte, o VaR e o CVaR no fim dele.
+    """
+    print(f"\n--- Projeção de Monte Carlo ({args.caminhos:,} caminhos, {args.horizonte} pregões, {args.metodo}) ---")
+
+    resultado = service.projetar_monte_carlo(
+        horizonte_dias=args.horizonte,
+        n_caminhos=args.caminhos,
+        metodo=args.metodo,
+        processos=args.processos,
+        semente=args.semente,
+        tamanho_bloco=args.bloco,
+    )
+    if resultado is None:
+        print("Não foi possível projetar a carteira. Ela está vazia ou sem cotações.")
+        return
+
+    # 1. Faixas de percentis ao longo do horizonte
+    cabecalho = " | ".join(f"{f'P{percentil:g}':>14}" for percentil in resultado.percentis)
+    print(f"\n{'PREGÃO':>6} | {cabecalho}")
+    print("-" * (9 + 17 * len(resultado.percentis)))
+    for coluna, dia in enumerate(resultado.dias):
+        valores = " | ".join(f"{valor:>14,.2f}" for valor in resultado.bandas[:, coluna])
+        print(f"{dia:>6} | {valores}")
+    print("-" * (9 + 17 * len(resultado.percentis)))
+
+    # 2. Risco no fim do horizonte
+    print("\n" + "="*52)
+    print(f" RISCO EM {resultado.horizonte_dias} PREGÕES (valor atual R$ {resultado.valor_inicial:,.2f})")
+    print("="*52)
+    for nivel in resultado.var:
+        print(
+            f"  {nivel:.0%}:  VaR R$ {resultado.var[nivel]:>14,.2f} | "
+            f"CVaR R$ {resultado.cvar[nivel]:>14,.2f}"
+        )
+    print("="*52)
+    print(
+        f"Tempo: {resultado.tempo_ms:,.0f} ms em {resultado.n_lotes} lotes e {resultado.processos} processo(s) "
+        f"({resultado.caminhos_por_segundo:,.0f} caminhos/s)."
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Projeção de Monte Carlo do valor da carteira atual.")
+    parser.add_argument("--horizonte", type=int, default=252, help="Horizonte em pregões (padrão: 252)")
+    parser.add_argument("--caminhos", type=int, default=10_000, help="Número de caminhos simulados (padrão: 10000)")
+    parser.add_argument("--metodo", choices=METODOS, default="bootstrap", help="Bootstrap em blocos ou normal multivariada")
+    parser.add_argument("--bloco", type=int, default=10, help="Tamanho dos blocos do bootstrap, em pregões (padrão: 10)")
+    parser.add_argument("--processos", type=int, default=1, help="Processos em paralelo (0 = todos os núcleos)")
+    parser.add_argument("--semente", type=int, help="Semente para resultados reproduzíveis")
+    adicionar_opcao_perfil(parser)
+    args = parser.parse_args()
+
+    DB_URL = "sqlite:///data/portfolio.db"
+    session_manager = DatabaseSessionManager(DB_URL)
+    service = PortfolioService(
+        session_manager, cache_precos=CachePrecos(), cache=CacheAnalises("data/cache_analises")
+    )
+
+    with perfilar(args.profile, service):
+        exibir_projecao(service, args)
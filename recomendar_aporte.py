@@ -1,7 +1,12 @@
 # recomendar_aporte.py (novo arquivo na raiz do projeto)
 
-import math
+import argparse
+import csv
+import numpy as np
 from db_nexus import DatabaseSessionManager
+from app.cache import CacheAnalises
+from app.perfil import adicionar_opcao_perfil, perfilar
+from app.precos import CachePrecos
 from app.services import PortfolioService
 from app.models import TipoAtivo
 
@@ -24,14 +29,13 @@ def gerar_relatorio_de_aporte(service: PortfolioService, valor_aporte: float):
         return
 
     # 2. Exibe a tabela com as ordens de compra
-    print(f"\n{'TICKER':<10} | {'CLASSE':<20} | {'VALOR (R$) A COMPRAR':>20} | {'QTD. APROX.'}")
+    print(f"\n{'TICKER':<10} | {'CLASSE':<20} | {'VALOR (R$) A COMPRAR':>20} | {'QUANTIDADE'}")
     print("-" * 75)
 
     for ativo in plano['ordens_de_compra']:
         valor = ativo['valor_a_movimentar']
-        qtd_a_movimentar = math.floor(valor / ativo['preco_atual']) if ativo['preco_atual'] > 0 else 0
         unidade_label = "ações" if ativo['tipo_ativo'] == TipoAtivo.ACAO else "cotas"
-        qtd_str = f"{qtd_a_movimentar} {unidade_label}" if qtd_a_movimentar > 0 else "-"
+        qtd_str = f"{ativo['quantidade_a_comprar']} {unidade_label}"
 
         linha_formatada = (
             f"{ativo['ticker']:<10} | "
@@ -55,18 +59,74 @@ def gerar_relatorio_de_aporte(service: PortfolioService, valor_aporte: float):
     print("-" * 40)
     print(f"  Caixa Restante:       R$ {caixa_restante:,.2f}")
     print("="*40)
+    if not plano['otimo']:
+        print("Aviso: tempo de busca esgotado; o plano é o melhor encontrado, sem garantia de ser o ótimo.")
+
+
+def gerar_tabela_de_cenarios(service: PortfolioService, valores_aporte: list, refinar: bool = False, arquivo_csv: str | None = None):
+    """
+    Simula vários valores de aporte de uma vez e exibe uma tabela compacta com
+    o total alocado, o caixa restante e a distância da carteira ao alvo.
+    """
+    print(f"\n--- Simulação de {len(valores_aporte)} Aportes (R$ {valores_aporte[0]:,.2f} a R$ {valores_aporte[-1]:,.2f}) ---")
+
+    cenarios = service.simular_aportes(valores_aporte, refinar=refinar)
+    if cenarios is None:
+        print("\nNenhum dado disponível para simular os aportes.")
+        return
+
+    print(f"\n{'APORTE (R$)':>14} | {'ALOCADO (R$)':>14} | {'CAIXA (R$)':>10} | {'ORDENS':>6} | {'ERRO MÉDIO':>9}")
+    print("-" * 66)
+    registros = cenarios.como_registros()
+    for registro in registros:
+        print(
+            f"{registro['valor_aporte']:>14,.2f} | "
+            f"{registro['total_alocado']:>14,.2f} | "
+            f"{registro['caixa_restante']:>10,.2f} | "
+            f"{registro['ordens']:>6} | "
+            f"{registro['erro_medio'] * 100:>8.2f}%"
+        )
+    print("-" * 66)
+    print("Erro médio: distância média entre a alocação de cada ativo na classe e o alvo de Risk Parity.")
+    print(f"{len(registros)} cenários calculados em {cenarios.tempo_ms:.1f} ms.")
+
+    if arquivo_csv:
+        with open(arquivo_csv, 'w', newline='', encoding='utf-8') as arquivo:
+            escritor = csv.DictWriter(arquivo, fieldnames=list(registros[0]))
+            escritor.writeheader()
+            escritor.writerows(registros)
+        print(f"Curva salva em '{arquivo_csv}'.")
 
 
 if __name__ == "__main__":
-    try:
-        aporte_str = input("Qual o valor do seu aporte em R$? ")
-        valor_do_aporte = float(aporte_str)
-    except ValueError:
-        print("Valor inválido. Por favor, digite um número.")
-        exit()
+    parser = argparse.ArgumentParser(description="Planeja a alocação de um novo aporte.")
+    parser.add_argument("--de", type=float, help="Simula vários aportes: menor valor (R$)")
+    parser.add_argument("--ate", type=float, help="Simula vários aportes: maior valor (R$)")
+    parser.add_argument("--passo", type=float, default=500.0, help="Intervalo entre os valores simulados (padrão: 500)")
+    parser.add_argument("--refinar", action="store_true", help="Refina cada cenário com a busca exata (mais lento)")
+    parser.add_argument("--csv", help="Salva a curva dos cenários neste arquivo CSV")
+    adicionar_opcao_perfil(parser)
+    args = parser.parse_args()
 
     DB_URL = "sqlite:///data/portfolio.db"
     session_manager = DatabaseSessionManager(DB_URL)
-    service = PortfolioService(session_manager)
-    
-    gerar_relatorio_de_aporte(service, valor_do_aporte)
\ No newline at end of file
+    service = PortfolioService(
+        session_manager, cache_precos=CachePrecos(), cache=CacheAnalises("data/cache_analises")
+    )
+
+    with perfilar(args.profile, service):
+        if args.de is not None or args.ate is not None:
+            if args.de is None or args.ate is None or args.passo <= 0 or args.ate < args.de:
+                parser.error("informe --de e --ate (com --ate >= --de) e um --passo positivo.")
+            valores = np.arange(args.de, args.ate + 1e-9, args.passo).tolist()
+            gerar_tabela_de_cenarios(service, valores, refinar=args.refinar, arquivo_csv=args.csv)
+            exit()
+
+        try:
+            aporte_str = input("Qual o valor do seu aporte em R$? ")
+            valor_do_aporte = float(aporte_str)
+        except ValueError:
+            print("Valor inválido. Por favor, digite um número.")
+            exit()
+
+        gerar_relatorio_de_aporte(service, valor_do_aporte)
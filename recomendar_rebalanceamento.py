@@ -1,7 +1,11 @@
 # recomendar_rebalanceamento.py (Versão com Preço Atual na Tabela)
 
+import argparse
 import math
 from db_nexus import DatabaseSessionManager
+from app.cache import CacheAnalises
+from app.perfil import adicionar_opcao_perfil, perfilar
+from app.precos import CachePrecos
 from app.services import PortfolioService
 from app.models import TipoAtivo
 
@@ -27,7 +31,7 @@ def gerar_plano_de_rebalanceamento(service: PortfolioService):
     total_geral_compras = 0
     total_geral_vendas = 0
 
-    sorted_plano = sorted(plano.items(), key=lambda item: sum(a['valor_mercado'] for a in item[1]), reverse=True)
+    sorted_plano = sorted(plano.classes.items(), key=lambda item: sum(a.valor_mercado for a in item[1]), reverse=True)
 
     for classe, ativos in sorted_plano:
         print(f"\n--- CLASSE: {classe.upper()} ---")
@@ -38,8 +42,8 @@ def gerar_plano_de_rebalanceamento(service: PortfolioService):
         linhas_para_imprimir = []
 
         for ativo in ativos:
-            recomendacao = ativo['recomendacao']
-            valor = ativo['valor_a_movimentar']
+            recomendacao = ativo.recomendacao
+            valor = ativo.valor_a_movimentar
             cor = AMARELO
             
             if recomendacao == "Vender":
@@ -49,20 +53,20 @@ def gerar_plano_de_rebalanceamento(service: PortfolioService):
                 cor = VERDE
                 total_geral_compras += valor
             
-            aloc_atual_pct = ativo['alocacao_atual_na_classe'] * 100
-            aloc_sugerida_pct = ativo['alocacao_sugerida'] * 100
-            faixa_min_pct = aloc_sugerida_pct * 0.80
-            faixa_max_pct = aloc_sugerida_pct * 1.20
+            aloc_atual_pct = ativo.alocacao_atual_na_classe * 100
+            aloc_sugerida_pct = ativo.alocacao_sugerida * 100
+            faixa_min_pct = aloc_sugerida_pct * (1 - plano.faixa_tolerancia)
+            faixa_max_pct = aloc_sugerida_pct * (1 + plano.faixa_tolerancia)
             faixa_str = f"{faixa_min_pct:.2f}% a {faixa_max_pct:.2f}%"
             
-            qtd_a_movimentar = math.floor(valor / ativo['preco_atual']) if ativo['preco_atual'] > 0 else 0
-            unidade_label = "ações" if ativo['tipo_ativo'] == TipoAtivo.ACAO else "cotas"
+            qtd_a_movimentar = math.floor(valor / ativo.preco_atual) if ativo.preco_atual > 0 else 0
+            unidade_label = "ações" if ativo.tipo_ativo == TipoAtivo.ACAO else "cotas"
             qtd_str = f"{qtd_a_movimentar} {unidade_label}" if qtd_a_movimentar > 0 else "-"
             
             # --- LINHA FORMATADA ATUALIZADA ---
             linha_formatada = (
-                f"{ativo['ticker']:<10} | "
-                f"R$ {ativo['preco_atual']:>10.2f} | " # <-- NOVA COLUNA ADICIONADA AQUI
+                f"{ativo.ticker:<10} | "
+                f"R$ {ativo.preco_atual:>10.2f} | " # <-- NOVA COLUNA ADICIONADA AQUI
                 f"{aloc_atual_pct:>11.2f}% | "
                 f"{faixa_str:>18} | "
                 f"{recomendacao:<22} | "
@@ -107,8 +111,15 @@ def gerar_plano_de_rebalanceamento(service: PortfolioService):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plano de rebalanceamento com capital neutro.")
+    adicionar_opcao_perfil(parser)
+    args = parser.parse_args()
+
     DB_URL = "sqlite:///data/portfolio.db"
     session_manager = DatabaseSessionManager(DB_URL)
-    service = PortfolioService(session_manager)
+    service = PortfolioService(
+        session_manager, cache_precos=CachePrecos(), cache=CacheAnalises("data/cache_analises")
+    )
     
-    gerar_plano_de_rebalanceamento(service)
\ No newline at end of file
+    with perfilar(args.profile, service):
+        gerar_plano_de_rebalanceamento(service)
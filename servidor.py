@@ -0,0 +1,53 @@
+# servidor.py
+
+import argparse
+import time
+from db_nexus import DatabaseSessionManager
+from app.cache import CacheAnalises
+from app.precos import CachePrecos
+from app.servidor import INTERVALO_ATUALIZACAO, ROTAS, ServidorAnalises, ServidorHTTP
+
+def rodar_servidor(host: str, porta: int, intervalo: float):
+    """
+    Aquece as análises, inicia a vigia de mudanças no banco e atende as
+    requisições até o usuário interromper (Ctrl+C).
+    """
+    DB_URL = "sqlite:///data/portfolio.db"
+    session_manager = DatabaseSessionManager(DB_URL)
+    analises = ServidorAnalises(
+        session_manager, cache_precos=CachePrecos(), cache=CacheAnalises("data/cache_analises")
+    )
+
+    # 1. Carrega a matriz de preços e calcula as análises antes de abrir a porta
+    inicio = time.perf_counter()
+    analises.atualizar(forcar=True)
+    print(f"🔥 Análises aquecidas em {time.perf_counter() - inicio:.2f}s.")
+
+    try:
+        servidor = ServidorHTTP((host, porta), analises)
+    except OSError as e:
+        print(f"❌ Não foi possível abrir {host}:{porta}: {e}")
+        return
+
+    # 2. Vigia o banco e atende as requisições em paralelo
+    analises.vigiar(intervalo)
+    print(f"🚀 Servidor em http://{host}:{porta} (verificando o banco a cada {intervalo:g}s)")
+    print(f"   Rotas: /saude, {', '.join(sorted(ROTAS))} (GET) e /atualizar (POST)")
+    print("   Todas as rotas aceitam ?carteira=NOME. Ctrl+C para encerrar.")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\nEncerrando o servidor...")
+    finally:
+        analises.parar()
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local que mantém as análises da carteira em memória.")
+    parser.add_argument("--host", default="127.0.0.1", help="Endereço de escuta (padrão: apenas a máquina local).")
+    parser.add_argument("--porta", type=int, default=8765, help="Porta HTTP.")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_ATUALIZACAO, help="Segundos entre as verificações do banco.")
+    args = parser.parse_args()
+
+    rodar_servidor(args.host, args.porta, args.intervalo)